@@ -0,0 +1,257 @@
+import sqlite3
+import time
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from telethon import functions
+from telethon.utils import get_peer_id
+
+from common import as_text, dump_tl, load_tl
+
+
+# =========================
+# АРХИВ ОТВЕТОВ TELEGRAM (--record / --replay)
+# =========================
+def pack_tl(obj) -> bytes:
+    return zlib.compress(dump_tl(obj), 6)
+
+
+def unpack_tl(blob: bytes):
+    return load_tl(zlib.decompress(blob))
+
+
+class ResponseArchive:
+    """
+    Сырые ответы Telegram, из которых собирался отчёт: сообщения с опросами
+    и каждая страница GetPollVotesRequest (TL-байты, сжатые zlib).
+    По такому архиву весь пайплайн от pick_poll до build_report
+    повторяется без сети и без входа в аккаунт.
+    export.py дописывает сюда же участников и курсоры своих задач.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS archive_chats (
+                chat_id INTEGER PRIMARY KEY,
+                raw     BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS archive_polls (
+                chat_id     INTEGER NOT NULL,
+                topic_id    INTEGER NOT NULL,
+                msg_id      INTEGER NOT NULL,
+                question    TEXT    NOT NULL,
+                raw         BLOB    NOT NULL,
+                recorded_at REAL    NOT NULL,
+                votes_snapshot INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (chat_id, msg_id)
+            );
+            CREATE TABLE IF NOT EXISTS archive_votes (
+                chat_id INTEGER NOT NULL,
+                msg_id  INTEGER NOT NULL,
+                option  BLOB    NOT NULL,
+                offset  TEXT    NOT NULL,
+                raw     BLOB    NOT NULL,
+                PRIMARY KEY (chat_id, msg_id, option, offset)
+            );
+            CREATE TABLE IF NOT EXISTS archive_participants (
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                raw     BLOB    NOT NULL,
+                PRIMARY KEY (chat_id, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS archive_progress (
+                chat_id    INTEGER NOT NULL,
+                task       TEXT    NOT NULL,
+                cursor     INTEGER NOT NULL,
+                done       INTEGER NOT NULL,
+                updated_at REAL    NOT NULL,
+                PRIMARY KEY (chat_id, task)
+            );
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(archive_polls)")}
+        if "votes_snapshot" not in columns:
+            # архив, записанный до появления снимков: ни одной копии опроса не доверяем
+            self._db.execute("ALTER TABLE archive_polls ADD COLUMN votes_snapshot INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+
+    # ---------- запись ----------
+    def put_chat(self, entity) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO archive_chats (chat_id, raw) VALUES (?, ?)",
+            (get_peer_id(entity), pack_tl(entity)),
+        )
+        self._db.commit()
+
+    def add_polls(self, chat_id: int, topic_id: int, messages: list) -> None:
+        """Опросы из поиска; снимок, по которому уже выгружены голоса (put_poll_snapshot), не перезаписывается."""
+        now = time.time()
+        self._db.executemany(
+            "INSERT INTO archive_polls (chat_id, topic_id, msg_id, question, raw, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, msg_id) DO UPDATE SET topic_id=excluded.topic_id, question=excluded.question, "
+            "raw=excluded.raw, recorded_at=excluded.recorded_at WHERE archive_polls.votes_snapshot = 0",
+            [
+                (int(chat_id), int(topic_id), int(m.id), as_text(m.media.poll.question), pack_tl(m), now)
+                for m in messages
+            ],
+        )
+        self._db.commit()
+
+    def put_poll_snapshot(self, chat_id: int, message, topic_id: int = 0) -> None:
+        """
+        Копия опроса, по счётчикам которой выгружались голоса: --replay верит её нулям
+        (пустые варианты тогда не запрашивались). topic_id — если опроса ещё нет в архиве.
+        """
+        row = (as_text(message.media.poll.question), pack_tl(message), time.time(), int(chat_id), int(message.id))
+        cur = self._db.execute(
+            "UPDATE archive_polls SET question=?, raw=?, recorded_at=?, votes_snapshot=1 WHERE chat_id=? AND msg_id=?",
+            row,
+        )
+        if cur.rowcount == 0:
+            self._db.execute(
+                "INSERT INTO archive_polls (question, raw, recorded_at, chat_id, msg_id, topic_id, votes_snapshot) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1)",
+                row + (int(topic_id),),
+            )
+        self._db.commit()
+
+    def add_votes_page(self, chat_id: int, msg_id: int, option: bytes, offset: Optional[str], response) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO archive_votes (chat_id, msg_id, option, offset, raw) VALUES (?, ?, ?, ?, ?)",
+            (int(chat_id), int(msg_id), bytes(option), offset or "", pack_tl(response)),
+        )
+        self._db.commit()
+
+    def add_participants(self, chat_id: int, users: list) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO archive_participants (chat_id, user_id, raw) VALUES (?, ?, ?)",
+            [(int(chat_id), int(u.id), pack_tl(u)) for u in users],
+        )
+        self._db.commit()
+
+    def set_progress(self, chat_id: int, task: str, cursor: int, done: bool = False) -> None:
+        """Курсор выгрузки (export.py): после сбоя задача продолжается с него."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO archive_progress (chat_id, task, cursor, done, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (int(chat_id), task, int(cursor), int(done), time.time()),
+        )
+        self._db.commit()
+
+    def reset_progress(self, chat_id: int) -> None:
+        self._db.execute("DELETE FROM archive_progress WHERE chat_id=?", (int(chat_id),))
+        self._db.commit()
+
+    # ---------- чтение ----------
+    def progress(self, chat_id: int, task: str) -> Tuple[int, bool]:
+        """(курсор, задача завершена); (0, False) — ещё не начиналась."""
+        row = self._db.execute(
+            "SELECT cursor, done FROM archive_progress WHERE chat_id=? AND task=?", (int(chat_id), task),
+        ).fetchone()
+        return (int(row[0]), bool(row[1])) if row else (0, False)
+
+    def progress_tasks(self, chat_id: int, prefix: str) -> Dict[str, Tuple[int, bool]]:
+        """{task: (курсор, завершена)} для всех задач, чьё имя начинается с prefix."""
+        rows = self._db.execute(
+            "SELECT task, cursor, done FROM archive_progress WHERE chat_id=? AND substr(task, 1, ?)=?",
+            (int(chat_id), len(prefix), prefix),
+        ).fetchall()
+        return {task: (int(cursor), bool(done)) for task, cursor, done in rows}
+
+    def participants(self, chat_id: int) -> list:
+        rows = self._db.execute(
+            "SELECT raw FROM archive_participants WHERE chat_id=? ORDER BY user_id", (int(chat_id),),
+        ).fetchall()
+        return [unpack_tl(raw) for raw, in rows]
+
+    def chat(self, chat_id: int):
+        """Entity чата из архива (id как есть или со сменой знака) или None."""
+        row = self._db.execute(
+            "SELECT raw FROM archive_chats WHERE chat_id IN (?, ?)", (int(chat_id), -int(chat_id)),
+        ).fetchone()
+        return unpack_tl(row[0]) if row else None
+
+    def polls(self, chat_id: int, topic_id: int = 0) -> List[Tuple[object, str]]:
+        """[(message, question)] от новых к старым; topic_id=0 — все темы чата."""
+        sql = "SELECT raw, question FROM archive_polls WHERE chat_id=?"
+        params: list = [int(chat_id)]
+        if topic_id:
+            sql += " AND topic_id=?"
+            params.append(int(topic_id))
+        rows = self._db.execute(sql + " ORDER BY msg_id DESC", params).fetchall()
+        return [(unpack_tl(raw), question) for raw, question in rows]
+
+    def snapshot_ids(self, chat_id: int) -> Set[int]:
+        """id опросов, сохранённых вместе с голосами (put_poll_snapshot)."""
+        rows = self._db.execute(
+            "SELECT msg_id FROM archive_polls WHERE chat_id=? AND votes_snapshot=1", (int(chat_id),),
+        ).fetchall()
+        return {int(msg_id) for msg_id, in rows}
+
+    def votes_page(self, chat_id: int, msg_id: int, option: bytes, offset: Optional[str]):
+        row = self._db.execute(
+            "SELECT raw FROM archive_votes WHERE chat_id=? AND msg_id=? AND option=? AND offset=?",
+            (int(chat_id), int(msg_id), bytes(option), offset or ""),
+        ).fetchone()
+        return unpack_tl(row[0]) if row else None
+
+    def close(self) -> None:
+        self._db.close()
+
+
+# =========================
+# КЛИЕНТЫ-ОБЁРТКИ
+# =========================
+class RecordingClient:
+    """
+    Прокси над TelegramClient: все запросы идут как обычно, а ответы
+    GetPollVotesRequest дополнительно сохраняются в архив.
+    Остальные методы клиента (send_message, get_messages, ...) не меняются.
+    record_poll сохраняет копию опроса, по которой выгружаются голоса.
+    """
+
+    def __init__(self, client, archive: ResponseArchive):
+        self._client = client
+        self._archive = archive
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def record_poll(self, chat_peer, poll_msg) -> None:
+        self._archive.put_poll_snapshot(get_peer_id(chat_peer), poll_msg)
+
+    async def __call__(self, request, *args, **kwargs):
+        res = await self._client(request, *args, **kwargs)
+        if isinstance(request, functions.messages.GetPollVotesRequest):
+            self._archive.add_votes_page(get_peer_id(request.peer), request.id, request.option, request.offset, res)
+        return res
+
+
+class ReplayClient:
+    """
+    Замена клиента для --replay: страницы голосов берутся из архива,
+    отправка в Избранное только печатается. Любой другой запрос — ошибка:
+    значит, пайплайн попросил то, чего при записи не было.
+    """
+
+    def __init__(self, archive: ResponseArchive):
+        self._archive = archive
+
+    async def __call__(self, request, *args, **kwargs):
+        if isinstance(request, functions.messages.GetPollVotesRequest):
+            res = self._archive.votes_page(get_peer_id(request.peer), request.id, request.option, request.offset)
+            if res is None:
+                raise RuntimeError(
+                    f"В архиве нет голосов опроса id={request.id} — запиши его заново с --record."
+                )
+            return res
+        raise RuntimeError(f"--replay: запрос {type(request).__name__} не записан в архиве")
+
+    async def send_message(self, entity, message, *args, **kwargs):
+        return None
+
+    async def disconnect(self):
+        return None
@@ -0,0 +1,151 @@
+import os
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from stats import INSTRUMENT_ORDER, RosterLike, roster_series
+
+
+# =========================
+# ИСТОРИЯ ПОСЕЩАЕМОСТИ (битовая матрица)
+# =========================
+class AttendanceStore:
+    """
+    Матрица «музыкант × опрос» в упакованных битах (np.packbits-раскладка:
+    бит опроса j лежит в байте j >> 3 под маской 0x80 >> (j & 7)).
+    Строки — user_id (отсортированы), колонки — опросы в порядке добавления.
+    Каждый запуск main.py дописывает (или перезаписывает) колонку своего опроса.
+    """
+
+    GROW_BYTES = 8  # ёмкость колонок растёт блоками по 64 опроса
+
+    def __init__(self, path: str):
+        self.path = path
+        self.user_ids = np.zeros(0, dtype=np.int64)
+        self.chat_ids = np.zeros(0, dtype=np.int64)
+        self.msg_ids = np.zeros(0, dtype=np.int64)
+        self.dates = np.zeros(0, dtype=np.float64)
+        self.questions = np.zeros(0, dtype=object)
+        self.bits = np.zeros((0, 0), dtype=np.uint8)
+
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                self.user_ids = data["user_ids"]
+                self.chat_ids = data["chat_ids"]
+                self.msg_ids = data["msg_ids"]
+                self.dates = data["dates"]
+                self.questions = data["questions"].astype(object)
+                self.bits = data["bits"]
+
+    @property
+    def n_polls(self) -> int:
+        return len(self.msg_ids)
+
+    def save(self) -> None:
+        tmp = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            user_ids=self.user_ids,
+            chat_ids=self.chat_ids,
+            msg_ids=self.msg_ids,
+            dates=self.dates,
+            questions=self.questions.astype(str),
+            bits=self.bits,
+        )
+        os.replace(tmp, self.path)
+
+    # ---------- запись ----------
+    def _ensure_users(self, ids: np.ndarray) -> None:
+        new = np.setdiff1d(ids, self.user_ids, assume_unique=False)
+        if new.size == 0:
+            return
+        pos = np.searchsorted(self.user_ids, new)
+        self.user_ids = np.insert(self.user_ids, pos, new)
+        self.bits = np.insert(self.bits, pos, 0, axis=0)
+
+    def _column(self, chat_id: int, msg_id: int) -> Optional[int]:
+        hit = np.flatnonzero((self.chat_ids == chat_id) & (self.msg_ids == msg_id))
+        return int(hit[0]) if hit.size else None
+
+    def record(
+            self,
+            chat_id: int,
+            msg_id: int,
+            date: float,
+            question: str,
+            voter_ids: Iterable[int],
+            roster_ids: Iterable[int] = (),
+    ) -> None:
+        """Записывает, кто идёт на мероприятие (повторный запуск перезаписывает колонку)."""
+        voters = np.unique(np.fromiter(voter_ids, dtype=np.int64))
+        self._ensure_users(np.union1d(voters, np.fromiter(roster_ids, dtype=np.int64)))
+
+        col = self._column(chat_id, msg_id)
+        if col is None:
+            col = self.n_polls
+            if (col >> 3) >= self.bits.shape[1]:
+                grow = np.zeros((self.bits.shape[0], self.GROW_BYTES), dtype=np.uint8)
+                self.bits = np.concatenate([self.bits, grow], axis=1)
+            self.chat_ids = np.append(self.chat_ids, np.int64(chat_id))
+            self.msg_ids = np.append(self.msg_ids, np.int64(msg_id))
+            self.dates = np.append(self.dates, float(date))
+            self.questions = np.append(self.questions, np.array([question], dtype=object))
+        else:
+            self.dates[col] = float(date)
+            self.questions[col] = question
+
+        byte, mask = col >> 3, np.uint8(0x80 >> (col & 7))
+        self.bits[:, byte] &= ~mask
+        rows = np.searchsorted(self.user_ids, voters)
+        self.bits[rows, byte] |= mask
+
+    # ---------- запросы ----------
+    def last_polls(self, last_n: int, chat_ids: Optional[Iterable[int]] = None) -> np.ndarray:
+        """Индексы колонок последних N опросов (по дате), от старых к новым."""
+        cols = np.arange(self.n_polls)
+        if chat_ids is not None:
+            cols = cols[np.isin(self.chat_ids, np.fromiter(chat_ids, dtype=np.int64))]
+        cols = cols[np.argsort(self.dates[cols], kind="stable")]
+        return cols[-last_n:] if last_n > 0 else cols
+
+    def _mask(self, cols: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        np.bitwise_or.at(mask, cols >> 3, (0x80 >> (cols & 7)).astype(np.uint8))
+        return mask
+
+    def attended(self, cols: np.ndarray) -> np.ndarray:
+        """Сколько из выбранных опросов посетил каждый музыкант (popcount по маске)."""
+        if self.bits.size == 0:
+            return np.zeros(len(self.user_ids), dtype=np.int64)
+        return np.bitwise_count(self.bits & self._mask(cols)).sum(axis=1, dtype=np.int64)
+
+    def matrix(self, cols: np.ndarray) -> np.ndarray:
+        """Булева матрица «музыкант × выбранные опросы»."""
+        byte = self.bits[:, cols >> 3]
+        return (byte & (0x80 >> (cols & 7)).astype(np.uint8)) != 0
+
+    def rate_by_instrument(self, roster: RosterLike, cols: np.ndarray) -> pd.DataFrame:
+        """Посещаемость по инструментам: members, visits, possible, rate."""
+        r = roster_series(roster)
+        df = pd.DataFrame({"user_id": self.user_ids, "visits": self.attended(cols)})
+        df = df.join(r.rename("instrument"), on="user_id", how="inner")
+        out = df.groupby("instrument").agg(members=("user_id", "size"), visits=("visits", "sum"))
+        out["possible"] = out["members"] * len(cols)
+        out["rate"] = np.where(out["possible"] > 0, out["visits"] / out["possible"].clip(lower=1), 0.0)
+        order = [k for k in INSTRUMENT_ORDER if k in out.index] + [k for k in out.index if k not in INSTRUMENT_ORDER]
+        return out.reindex(order)
+
+    def fill_by_poll(self, roster: RosterLike, cols: np.ndarray) -> pd.DataFrame:
+        """Сколько человек каждой группы пришло на каждый опрос: инструмент × опрос."""
+        r = roster_series(roster)
+        present = pd.DataFrame(self.matrix(cols), index=self.user_ids, columns=[int(c) for c in cols])
+        present = present.join(r.rename("instrument"), how="inner")
+        return present.groupby("instrument").sum()
+
+    def absentees(self, roster: RosterLike, cols: np.ndarray, max_visits: int = 0) -> List[int]:
+        """Музыканты из состава, посетившие не больше max_visits из выбранных опросов."""
+        r = roster_series(roster)
+        visits = pd.Series(self.attended(cols), index=self.user_ids)
+        visits = visits.reindex(r.index, fill_value=0)
+        return [int(u) for u in visits[visits <= max_visits].index]
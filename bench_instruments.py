@@ -0,0 +1,172 @@
+"""
+Бенчмарк и проверка эквивалентности нормализации инструментов.
+
+Сравнивает табличный InstrumentNormalizer с прежней цепочкой if-ов
+(legacy_normalize_instrument — копия старой normalize_instrument) на большом
+сгенерированном корпусе написаний и замеряет скорость.
+
+    python bench_instruments.py --size 200000
+    python bench_instruments.py --size 200000 --uniques 150   # как в реальном составе: написания повторяются
+
+Код возврата 1, если хотя бы одно написание нормализуется иначе.
+"""
+import argparse
+import random
+import sys
+import time
+from typing import List
+
+from instruments import InstrumentNormalizer
+
+
+def legacy_normalize_instrument(raw: str) -> str:
+    s = (raw or "").strip().lower().replace("ё", "е")
+
+    if "скрип" in s:
+        if "1" in s:
+            return "первые скрипки"
+        if "2" in s:
+            return "вторые скрипки"
+        return "первые скрипки"  # если база хранит просто "скрипки" — выбери, что удобнее
+
+    # ======= Ветка Саксов =======
+
+    if "сакс" in s:
+        if "сопран" in s:
+            return "сопрано-саксофон"
+        if "альт-сакс" in s:
+            return "альт-саксофон"
+        if "тенор" in s:
+            return "тенор-саксофон"
+        if "барит" in s:
+            return "баритон-саксофон"
+        if "бас" in s:
+            return "бас-саксофон"
+        return "саксофон"
+
+    if "альт" in s:
+        return "альт"
+    if "виолонч" in s:
+        return "виолончель"
+    if "контрабас" in s:
+        return "контрабас"
+
+    if "флейт" in s:
+        return "флейта"
+    if "гобо" in s:
+        return "гобой"
+    if "кларнет" in s:
+        return "кларнет"
+    if "фагот" in s:
+        return "фагот"
+
+    if "валторн" in s:
+        return "валторна"
+    if "труба" in s:
+        return "труба"
+    if "тромбон" in s:
+        return "тромбон"
+    if "туба" in s:
+        return "туба"
+
+    if "удар" in s or "перкус" in s:
+        return "ударные"
+    if "фортеп" in s or "пианино" in s:
+        return "фортепиано"
+    if "арфа" in s:
+        return "арфа"
+    if "дириж" in s:
+        return "дирижёр"
+
+    return s or "неизвестно"
+
+
+BASES = [
+    "скрипка", "Скрипки", "скрипач", "альт", "Альт", "виолончель", "виолончелист", "контрабас",
+    "флейта", "флейта-пикколо", "гобой", "англ. гобой", "кларнет", "бас-кларнет", "фагот", "контрафагот",
+    "саксофон", "альт-саксофон", "альт саксофон", "сопрано-саксофон", "тенор-саксофон", "баритон-саксофон",
+    "бас-саксофон", "сакс", "валторна", "труба", "тромбон", "бас-тромбон", "туба", "ударные", "перкуссия",
+    "фортепиано", "пианино", "арфа", "дирижёр", "дирижер", "вокал", "гитара", "бас", "контрабас-саксофон",
+    "альтист", "", "   ", "неизвестно", "ёлка", "ТУБА", "Труба 1", "тромбон 2",
+]
+NUMBERS = ["", " 1", " 2", "1 ", "2 ", " 1/2", " (1)", " II", " 12"]
+WRAPS = [("", ""), (" ", " "), ("  ", ""), ("(", ")"), ("", "."), ("", " соло"), ("", ", туба")]
+
+
+def mutate(s: str, rng: random.Random) -> str:
+    if not s or rng.random() > 0.3:
+        return s
+    i = rng.randrange(len(s))
+    op = rng.random()
+    if op < 0.33:
+        return s[:i] + s[i + 1:]
+    if op < 0.66:
+        return s[:i] + s[i].upper() + s[i + 1:]
+    return s[:i] + rng.choice("абвгдеёжзийклмнопрстуфхцчшщьыэюя12 -") + s[i:]
+
+
+def generate_corpus(size: int, seed: int = 42) -> List[str]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(size):
+        base = rng.choice(BASES)
+        if rng.random() < 0.5:
+            base = base.upper() if rng.random() < 0.3 else base.capitalize()
+        pre, post = rng.choice(WRAPS)
+        out.append(mutate(pre + base + rng.choice(NUMBERS) + post, rng))
+    return out
+
+
+def timed(label: str, fn, n: int):
+    t0 = time.perf_counter()
+    result = fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<38} {dt * 1000:9.1f} ms  ({dt / max(n, 1) * 1e9:7.0f} ns/строка)")
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200_000, help="Размер корпуса написаний")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--uniques", type=int, default=0,
+                        help="Собрать корпус из стольких разных написаний (0 — все случайные)")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size, args.seed)
+    if args.uniques:
+        rng = random.Random(args.seed + 1)
+        pool = corpus[:args.uniques]
+        corpus = [rng.choice(pool) for _ in range(args.size)]
+    print(f"Корпус: {len(corpus)} строк, уникальных: {len(set(corpus))}")
+
+    expected = timed("legacy if-цепочка", lambda: [legacy_normalize_instrument(s) for s in corpus], len(corpus))
+
+    cold = InstrumentNormalizer()
+    got_cold = timed("таблица, без мемо (_classify)",
+                     lambda: [cold._classify(s) for s in corpus], len(corpus))
+
+    memo = InstrumentNormalizer()
+    got_memo = timed("таблица + мемо (normalize)", lambda: [memo.normalize(s) for s in corpus], len(corpus))
+    timed("таблица + мемо, повторно", lambda: [memo.normalize(s) for s in corpus], len(corpus))
+
+    column = InstrumentNormalizer()
+    got_column = timed("столбец (normalize_column)", lambda: column.normalize_column(corpus), len(corpus))
+
+    mismatches = [
+        (s, e, a, b, c)
+        for s, e, a, b, c in zip(corpus, expected, got_cold, got_memo, got_column)
+        if not (e == a == b == c)
+    ]
+    if mismatches:
+        print(f"❌ Расхождений: {len(mismatches)}")
+        for s, e, a, b, c in mismatches[:20]:
+            print(f"  {s!r}: legacy={e!r} table={a!r} memo={b!r} column={c!r}")
+        return 1
+
+    print("✅ Результаты совпадают с прежней normalize_instrument")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
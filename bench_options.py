@@ -0,0 +1,184 @@
+"""
+Бенчмарк и проверка эквивалентности разбора вариантов ответа.
+
+Сравнивает OptionClassifier с прежними функциями main.py (legacy_* — копии
+is_yes_option_text / extract_time_minutes / kw_rank и ключа --smart-sort) на большом
+сгенерированном корпусе вариантов: «позитивность», время, смысловой ранг и порядок
+сортировки внутри каждого опроса.
+
+    python bench_options.py --size 200000
+
+Код возврата 1, если хотя бы один вариант разбирается иначе.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from typing import List, Optional
+
+from poll_options import OptionClassifier, prepare_option_text
+
+
+def legacy_is_yes_option_text(txt: str) -> bool:
+    t = (txt or "").strip().casefold()
+    t = " ".join(t.split())
+
+    # явное "нет"
+    if "не смогу" in t or (t.startswith("не") and "смогу" in t):
+        return False
+    if "не приду" in t or (t.startswith("не") and "приду" in t):
+        return False
+
+    # явное "да"
+    if "✅" in t:
+        return True
+    if "приду" in t:
+        return True
+    if "смогу" in t:
+        return True
+    if "буду" in t or re.search(r"\bбуду\b", t):
+        return True
+
+    return False
+
+
+def legacy_extract_time_minutes(txt: str) -> Optional[int]:
+    t = (txt or "").strip().casefold()
+    t = " ".join(t.split())
+    m = re.search(r"(?:\bв\b|\bк\b)\s*(\d{1,2})(?::(\d{2}))?\b", t)
+    if not m:
+        return None
+    hh = int(m.group(1))
+    mm = int(m.group(2) or "0")
+    if not (0 <= hh <= 23 and 0 <= mm <= 59):
+        return None
+    return hh * 60 + mm
+
+
+def legacy_kw_rank(txt: str) -> int:
+    t = (txt or "").strip().casefold()
+    t = " ".join(t.split())
+
+    if "саунд" in t or "чек" in t:
+        return 0
+    if "репет" in t:
+        return 1
+    if "концерт" in t:
+        return 2
+    return 3
+
+
+def legacy_sort_key(txt: str, index: int):
+    tmin = legacy_extract_time_minutes(txt)
+    if tmin is not None:
+        return (0, tmin, legacy_kw_rank(txt), index)
+    return (1, legacy_kw_rank(txt), 10_000, index)
+
+
+HEADS = [
+    "✅ Смогу", "Смогу", "смогу", "Приду", "✅ приду", "Буду", "буду", "Не смогу", "❌ Не смогу", "Не приду",
+    "не буду", "Нет", "Может быть", "Посмотреть результаты", "✅", "Смогу, но опоздаю", "Не уверен, что смогу",
+    "Приду к концу", "Буду онлайн", "Неприду",
+]
+TAILS = [
+    "", " в 18:00", " в 19:30", " к 10", " в 9", " к 8:30", " в 25:00", " в 12:75", " в18:00", " (в 13:00)",
+    " на репетицию", " на концерт", " на саундчек", " на чек", " на репетицию в 11:00", " на концерт к 17:30",
+    " только онлайн", " в субботу", " во вторник в 20", ", но в 7 утра",
+]
+
+
+def mutate(s: str, rng: random.Random) -> str:
+    if not s or rng.random() > 0.3:
+        return s
+    op = rng.random()
+    if op < 0.4:
+        return s.upper()
+    if op < 0.7:
+        i = rng.randrange(len(s))
+        return s[:i] + "  " + s[i:]
+    return "  " + s + " "
+
+
+def generate_polls(size: int, seed: int = 42) -> List[List[str]]:
+    """size вариантов, разложенных по опросам из 2–6 вариантов (часть текстов повторяется от опроса к опросу)."""
+    rng = random.Random(seed)
+    polls: List[List[str]] = []
+    left = size
+    while left > 0:
+        n = min(left, rng.randint(2, 6))
+        polls.append([mutate(rng.choice(HEADS) + rng.choice(TAILS), rng) for _ in range(n)])
+        left -= n
+    return polls
+
+
+def timed(label: str, fn, n: int):
+    t0 = time.perf_counter()
+    result = fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<38} {dt * 1000:9.1f} ms  ({dt / max(n, 1) * 1e9:7.0f} ns/вариант)")
+    return result
+
+
+def legacy_pass(polls: List[List[str]]):
+    out = []
+    for options in polls:
+        yes = [t for t in options if legacy_is_yes_option_text(t)]
+        order = sorted(range(len(yes)), key=lambda i: legacy_sort_key(yes[i], i))
+        out.append(([legacy_is_yes_option_text(t) for t in options],
+                    [legacy_extract_time_minutes(t) for t in options],
+                    [legacy_kw_rank(t) for t in options],
+                    [yes[i] for i in order]))
+    return out
+
+
+def classifier_pass(polls: List[List[str]], classify):
+    out = []
+    for options in polls:
+        infos = [classify(t) for t in options]
+        yes = [(t, info) for t, info in zip(options, infos) if info.yes]
+        order = sorted(range(len(yes)), key=lambda i: yes[i][1].sort_key(i))
+        out.append(([info.yes for info in infos],
+                    [info.minutes for info in infos],
+                    [info.rank for info in infos],
+                    [yes[i][0] for i in order]))
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200_000, help="Сколько вариантов ответа всего")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    polls = generate_polls(args.size, args.seed)
+    flat = [t for options in polls for t in options]
+    print(f"Корпус: {len(polls)} опросов, {len(flat)} вариантов, уникальных: {len(set(flat))}")
+
+    expected = timed("legacy (3 функции + smart sort)", lambda: legacy_pass(polls), len(flat))
+
+    cold = OptionClassifier()
+    got_cold = timed("классификатор, без мемо (_classify)",
+                     lambda: classifier_pass(polls, lambda t: cold._classify(prepare_option_text(t))), len(flat))
+
+    memo = OptionClassifier()
+    got_memo = timed("классификатор + мемо (classify)", lambda: classifier_pass(polls, memo.classify), len(flat))
+    timed("классификатор + мемо, повторно", lambda: classifier_pass(polls, memo.classify), len(flat))
+
+    mismatches = [
+        (options, e, a, b)
+        for options, e, a, b in zip(polls, expected, got_cold, got_memo)
+        if not (e == a == b)
+    ]
+    if mismatches:
+        print(f"❌ Расхождений: {len(mismatches)}")
+        for options, e, a, b in mismatches[:20]:
+            print(f"  {options!r}:\n    legacy={e!r}\n    cold={a!r}\n    memo={b!r}")
+        return 1
+
+    print("✅ Результаты совпадают с прежними is_yes_option_text / extract_time_minutes / kw_rank")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,433 @@
+"""
+Офлайн-бенчмарк пайплайна main.py на подставном клиенте Telegram.
+
+FakeTelegram отвечает на те же запросы, что и настоящий сервер (поиск опросов,
+постраничные GetPollVotesRequest, темы форума, участники), на синтетических
+данных заданного размера и с заданной задержкой на запрос. Замеряются этапы
+отдельно и весь прогон целиком; результат сохраняется в JSON, чтобы сравнивать
+коммиты между собой.
+
+    python bench_pipeline.py --voters 50 1000 10000 100000 --latency 0.02
+    python bench_pipeline.py --out new.json --compare old.json
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from telethon.tl import types
+
+import get_id
+from common import RequestLimiter
+from instruments import DEFAULT_NORMALIZER
+from main import (
+    build_report,
+    fetch_poll_voters_yes_union,
+    find_polls_in_topic,
+    get_forum_topics,
+)
+from poll_index import PollIndex
+from roster import load_musicians_csv
+
+INSTRUMENT_SPELLINGS = [
+    "скрипка 1", "Скрипка 2", "скрипки", "альт", "Альт-саксофон", "виолончель", "контрабас",
+    "флейта", "гобой", "кларнет", "фагот", "тенор-сакс", "валторна", "труба", "тромбон", "туба",
+    "ударные", "фортепиано", "арфа", "дирижёр", "",
+]
+
+POLL_ANSWERS = ["✅ Смогу в 18:00", "✅ Смогу в 19:30", "Приду к концу", "✅ Смогу только онлайн", "❌ Не смогу"]
+VOTED_ANSWERS = [0, 1, 2, 4]  # за «онлайн» никто не голосует — пустой позитивный вариант
+
+BASE_USER_ID = 10_000_000
+
+FIRST_NAMES = [
+    "Анна", "Мария", "Елена", "Ольга", "Дарья", "Ирина", "Юлия", "Ксения", "Алексей", "Дмитрий", "Сергей",
+    "Иван", "Павел", "Никита", "Егор", "Фёдор", "Anna", "Maria", "Alex", "Max", "Kate", "Nick", "🎻", "",
+]
+LAST_SYLLABLES = ["ка", "ли", "мо", "но", "ра", "се", "та", "ви", "бе", "го", "ду", "жа", "зо", "пе", "фи", "ше"]
+
+
+def text(s: str) -> types.TextWithEntities:
+    return types.TextWithEntities(text=s, entities=[])
+
+
+# =========================
+# СИНТЕТИЧЕСКИЕ ДАННЫЕ
+# =========================
+class Dataset:
+    """
+    Чат-форум с n_polls опросами в теме topic_id. У самого свежего опроса
+    n_voters голосов, разбросанных по вариантам (часть людей выбирает несколько).
+    """
+
+    def __init__(self, n_voters: int, n_polls: int = 200, n_topics: int = 50, seed: int = 1):
+        rnd = random.Random(seed)
+        self.n_voters = n_voters
+        self.channel = types.Channel(
+            id=1_234_567, title="Оркестр (бенчмарк)", photo=types.ChatPhotoEmpty(), date=None,
+            access_hash=42, megagroup=True, forum=True,
+        )
+        self.peer = types.InputPeerChannel(self.channel.id, self.channel.access_hash)
+        self.topic_id = 1
+
+        self.user_ids = list(range(BASE_USER_ID, BASE_USER_ID + n_voters))
+        self.members = {uid: rnd.choice(INSTRUMENT_SPELLINGS) for uid in self.user_ids}
+        # имена участников — отдельным генератором, чтобы голоса не зависели от них
+        names = random.Random(seed + 1)
+        self.names = {
+            uid: (names.choice(FIRST_NAMES), "".join(names.choice(LAST_SYLLABLES) for _ in range(3)).capitalize())
+            for uid in self.user_ids
+        }
+
+        # голоса самого свежего опроса: option -> [user_id]
+        self.votes: Dict[bytes, List[int]] = {bytes([i]): [] for i in range(len(POLL_ANSWERS))}
+        for uid in self.user_ids:
+            first = rnd.choice(VOTED_ANSWERS)
+            self.votes[bytes([first])].append(uid)
+            if first < 2 and rnd.random() < 0.2:
+                self.votes[bytes([1 - first])].append(uid)
+
+        start = datetime(2025, 9, 1, tzinfo=timezone.utc)
+        self.messages = []
+        self.poll_votes: Dict[int, Dict[bytes, List[int]]] = {}
+        for i in range(n_polls):
+            msg_id = 1000 + i * 7
+            voters = self.votes if i == n_polls - 1 else {o: [] for o in self.votes}
+            self.poll_votes[msg_id] = voters
+            self.messages.append(self.poll_message(msg_id, start + timedelta(days=i), f"Репетиция №{i + 1}", voters))
+        self.messages.reverse()  # от новых к старым, как отдаёт сервер
+
+        self.topics = [
+            types.ForumTopic(
+                id=t, date=start, title=f"Тема {t}", icon_color=0, top_message=t,
+                read_inbox_max_id=0, read_outbox_max_id=0, unread_count=0, unread_mentions_count=0,
+                unread_reactions_count=0, from_id=types.PeerUser(1), notify_settings=types.PeerNotifySettings(),
+                peer=types.PeerChannel(self.channel.id),
+            )
+            for t in range(1, n_topics + 1)
+        ]
+
+    def poll_message(self, msg_id: int, date: datetime, question: str, votes: Dict[bytes, List[int]]):
+        poll = types.Poll(
+            id=msg_id,
+            question=text(question),
+            answers=[types.PollAnswer(text=text(a), option=bytes([i])) for i, a in enumerate(POLL_ANSWERS)],
+            public_voters=True,
+            multiple_choice=True,
+        )
+        results = types.PollResults(
+            results=[types.PollAnswerVoters(option=o, voters=len(v)) for o, v in votes.items()],
+            total_voters=len(set().union(*votes.values())),
+        )
+        return types.Message(
+            id=msg_id,
+            peer_id=types.PeerChannel(self.channel.id),
+            date=date,
+            message="",
+            media=types.MessageMediaPoll(poll=poll, results=results),
+            reply_to=types.MessageReplyHeader(reply_to_msg_id=self.topic_id, reply_to_top_id=self.topic_id,
+                                              forum_topic=True),
+        )
+
+    def write_musicians_csv(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.writer(f, delimiter=";")
+            w.writerow(["user_id", "Инструмент"])
+            for uid, instr in self.members.items():
+                w.writerow([uid, instr])
+
+
+# =========================
+# ПОДСТАВНОЙ КЛИЕНТ
+# =========================
+class FakeTelegram:
+    """
+    Вместо сети: await client(request) отвечает по Dataset после задержки latency.
+    Считает запросы по типам (requests) — это тоже результат бенчмарка.
+    """
+
+    def __init__(self, data: Dataset, latency: float = 0.0, member_cap: int = 10_000):
+        self.data = data
+        self.latency = latency
+        self.member_cap = member_cap
+        self.requests: Dict[str, int] = {}
+        self._votes_pages: Dict[tuple, types.messages.VotesList] = {}
+        self._member_search: Dict[str, List[int]] = {}
+
+    async def __call__(self, request):
+        name = type(request).__name__
+        self.requests[name] = self.requests.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, "_" + name, None)
+        if handler is None:
+            raise NotImplementedError(f"FakeTelegram: {name} не поддерживается")
+        return handler(request)
+
+    def reset(self) -> None:
+        self.requests.clear()
+
+    def _SearchRequest(self, req):
+        msgs = [
+            m for m in self.data.messages
+            if (not req.offset_id or m.id < req.offset_id) and m.id > (req.min_id or 0)
+        ][:req.limit]
+        return types.messages.ChannelMessages(pts=0, count=len(self.data.messages), messages=msgs,
+                                              topics=[], chats=[], users=[])
+
+    def _GetPollVotesRequest(self, req):
+        start = int(req.offset or 0)
+        key = (req.id, bytes(req.option), start, req.limit)
+        page = self._votes_pages.get(key)
+        if page is None:
+            ids = self.data.poll_votes.get(req.id, {}).get(bytes(req.option), [])
+            chunk = ids[start:start + req.limit]
+            end = start + len(chunk)
+            page = types.messages.VotesList(
+                count=len(ids),
+                votes=[types.MessagePeerVote(peer=types.PeerUser(uid), option=bytes(req.option), date=None)
+                       for uid in chunk],
+                chats=[],
+                users=[types.User(id=uid, access_hash=uid) for uid in chunk],
+                # как и Telegram: за полной последней страницей следует ещё один (пустой) запрос
+                next_offset=str(end) if end < len(ids) or len(chunk) == req.limit else None,
+            )
+            self._votes_pages[key] = page
+        return page
+
+    def _GetForumTopicsRequest(self, req):
+        # как сервер: по последней активности, страницами после offset_topic
+        ordered = sorted(self.data.topics, key=lambda t: -t.top_message)
+        if req.q:
+            ordered = [t for t in ordered if req.q.casefold() in t.title.casefold()]
+        start = next((i + 1 for i, t in enumerate(ordered) if t.id == req.offset_topic), 0) if req.offset_topic else 0
+        return types.messages.ForumTopics(count=len(ordered), topics=ordered[start:start + req.limit],
+                                          messages=[], chats=[], users=[], pts=0)
+
+    def _GetFullChannelRequest(self, req):
+        return SimpleNamespace(full_chat=SimpleNamespace(participants_count=len(self.data.user_ids)))
+
+    def _GetParticipantsRequest(self, req):
+        # как сервер: поиск по началу имени/фамилии, count — все подходящие,
+        # но дальше member_cap по одному запросу страниц нет
+        q = req.filter.q.casefold()
+        if not self._member_search:
+            # индекс по началам слов (как у сервера), строится один раз
+            index: Dict[str, Dict[int, None]] = {"": dict.fromkeys(self.data.user_ids)}
+            for uid in self.data.user_ids:
+                for w in " ".join(self.data.names[uid]).casefold().split():
+                    for n in range(1, len(w) + 1):
+                        index.setdefault(w[:n], {})[uid] = None
+            self._member_search = {k: list(v) for k, v in index.items()}
+        ids = self._member_search.get(q, [])
+        chunk = ids[req.offset:min(req.offset + req.limit, self.member_cap)]
+        return types.channels.ChannelParticipants(
+            count=len(ids),
+            participants=[types.ChannelParticipant(user_id=uid, date=None) for uid in chunk],
+            chats=[],
+            users=[types.User(id=uid, access_hash=uid, first_name=self.data.names[uid][0] or None,
+                              last_name=self.data.names[uid][1]) for uid in chunk],
+        )
+
+
+# =========================
+# ЭТАПЫ
+# =========================
+async def run_once(data: Dataset, client: FakeTelegram, workdir: str, page_size: int, concurrency: int) -> dict:
+    timings: Dict[str, float] = {}
+    t_all = time.perf_counter()
+
+    t = time.perf_counter()
+    await get_forum_topics(client, data.channel, query=None, limit=200)
+    timings["topics"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    polls = await find_polls_in_topic(client, data.channel, data.topic_id, limit=len(data.messages))
+    timings["find_polls"] = time.perf_counter() - t
+    poll_msg = polls[0][0]
+
+    t = time.perf_counter()
+    voter_ids, option_texts = await fetch_poll_voters_yes_union(
+        client, data.peer, poll_msg, page_size, smart_sort=True, concurrency=concurrency,
+    )
+    timings["fetch_voters"] = time.perf_counter() - t
+
+    csv_path = os.path.join(workdir, "Музыканты.csv")
+    t = time.perf_counter()
+    musicians, _ = load_musicians_csv(csv_path)
+    timings["load_csv"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    uids = list(musicians.keys())
+    roster = dict(zip(uids, DEFAULT_NORMALIZER.normalize_column(musicians.values())))
+    timings["normalize"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    report = build_report(polls[0][1], option_texts, voter_ids, roster)
+    timings["build_report"] = time.perf_counter() - t
+
+    timings["end_to_end"] = time.perf_counter() - t_all
+
+    # участники (get_id.py) — отдельно, в пайплайн отчёта не входят
+    out_csv = os.path.join(workdir, "Участники.csv")
+    writer = get_id.ParticipantWriter(out_csv, data.channel.id)
+    writer.open()
+    t = time.perf_counter()
+    try:
+        await get_id.export_participants(client, data.channel, writer, RequestLimiter(concurrency))
+        writer.finish()
+    finally:
+        writer.close()
+    timings["participants"] = time.perf_counter() - t
+    os.remove(out_csv)
+
+    return {
+        "timings": timings,
+        "voters_found": len(voter_ids),
+        "participants_found": writer.count,
+        "report_lines": report.count("\n") + 1,
+    }
+
+
+async def check_incremental_search(seed: int, plain_after: int = 5000) -> int:
+    """
+    Поиск по индексу: после первого запуска в теме появляется plain_after обычных сообщений (не опросов).
+    Следующий запуск их дочитывает, а ещё один, без новых сообщений, должен уложиться в один SearchRequest.
+    Возвращает число запросов последнего запуска.
+    """
+    data = Dataset(10, n_polls=20, seed=seed)
+    top = max(m.id for m in data.messages)
+    client = FakeTelegram(data)
+    with tempfile.TemporaryDirectory() as workdir:
+        index = PollIndex(os.path.join(workdir, "cache.sqlite"))
+        try:
+            await find_polls_in_topic(client, data.channel, data.topic_id, 300, index)
+            data.messages = [
+                types.Message(id=top + i, peer_id=types.PeerChannel(data.channel.id), date=None, message=f"№{i}")
+                for i in range(plain_after, 0, -1)
+            ] + data.messages
+            await find_polls_in_topic(client, data.channel, data.topic_id, 300, index)
+            client.reset()
+            polls = await find_polls_in_topic(client, data.channel, data.topic_id, 300, index)
+        finally:
+            index.close()
+    assert len(polls) == 20, f"из индекса вернулось {len(polls)} опросов вместо 20"
+    return client.requests.get("SearchRequest", 0)
+
+
+def bench_size(n_voters: int, args) -> dict:
+    data = Dataset(n_voters, n_polls=args.polls, seed=args.seed)
+    client = FakeTelegram(data, latency=args.latency, member_cap=args.member_cap)
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        data.write_musicians_csv(os.path.join(workdir, "Музыканты.csv"))
+        for _ in range(args.repeat):
+            client.reset()
+            sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with sink:
+                runs.append(asyncio.run(run_once(data, client, workdir, args.page_size, args.concurrency)))
+
+    stages = runs[0]["timings"].keys()
+    return {
+        "voters": n_voters,
+        "voters_found": runs[0]["voters_found"],
+        "participants_found": runs[0]["participants_found"],
+        "requests": dict(client.requests),
+        # минимум по повторам — наименее зашумлённая оценка
+        "seconds": {s: min(r["timings"][s] for r in runs) for s in stages},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    base = {r["voters"]: r["seconds"] for r in baseline.get("results", [])}
+    print(f"\nСравнение с {baseline_path} ({baseline.get('commit') or '?'} -> {current.get('commit') or '?'}):")
+    for r in current["results"]:
+        old = base.get(r["voters"])
+        if old is None:
+            continue
+        parts = []
+        for stage, sec in r["seconds"].items():
+            if old.get(stage):
+                parts.append(f"{stage} x{sec / old[stage]:.2f}")
+        print(f"  {r['voters']:>7} голосов: " + ", ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voters", type=int, nargs="+", default=[50, 1000, 10000, 100000],
+                        help="Размеры опроса (число голосовавших)")
+    parser.add_argument("--polls", type=int, default=200, help="Сколько опросов в теме")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка на каждый запрос, сек")
+    parser.add_argument("--page-size", type=int, default=100, help="votes_page_size")
+    parser.add_argument("--concurrency", type=int, default=4, help="votes_concurrency")
+    parser.add_argument("--member-cap", type=int, default=10_000,
+                        help="Сколько участников сервер отдаёт по одному запросу списка/поиска")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=str, default="bench_pipeline.json")
+    parser.add_argument("--compare", type=str, default="", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--verbose", action="store_true", help="Не глушить вывод пайплайна")
+    args = parser.parse_args()
+
+    result = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "verbose")},
+        "results": [],
+    }
+
+    for n in args.voters:
+        r = bench_size(n, args)
+        result["results"].append(r)
+        s = r["seconds"]
+        print(
+            f"{n:>7} голосов: всего {s['end_to_end'] * 1000:8.1f} мс | "
+            + " | ".join(f"{k} {v * 1000:.1f}" for k, v in s.items() if k != "end_to_end")
+            + f" | запросов {sum(r['requests'].values())}"
+            + f" | участников {r['participants_found']}/{n}"
+        )
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"💾 {args.out}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        searches = asyncio.run(check_incremental_search(args.seed))
+    if searches > 1:
+        print(f"❌ Повторный поиск по индексу без новых сообщений: {searches} SearchRequest (ожидался 1)")
+        return 1
+    print(f"✅ Повторный поиск по индексу без новых сообщений: {searches} SearchRequest")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import asyncio
+
+from telethon import errors
+from telethon.extensions import BinaryReader
+
+
+# =========================
+# ЛОГГЕР
+# =========================
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+
+def as_text(x) -> str:
+    if x is None:
+        return ""
+    return x.text if hasattr(x, "text") else str(x)
+
+
+def dump_tl(obj) -> bytes:
+    """TL-объект Telethon -> сырые байты (для хранения на диске)."""
+    return bytes(obj)
+
+
+def load_tl(data: bytes):
+    """Сырые байты -> TL-объект Telethon (обратное к dump_tl)."""
+    with BinaryReader(data) as reader:
+        return reader.tgread_object()
+
+
+# =========================
+# ЗАПРОСЫ: ЛИМИТ + FLOODWAIT
+# =========================
+class RequestLimiter:
+    """
+    Общий бюджет запросов к Telegram:
+      - не больше `concurrency` запросов одновременно
+      - при FloodWait все задачи ждут, сколько попросил сервер, и повторяют запрос
+    """
+
+    def __init__(self, concurrency: int = 4, max_retries: int = 5):
+        self._sem = asyncio.Semaphore(max(1, int(concurrency)))
+        self._resume_at = 0.0
+        self.max_retries = max_retries
+
+    async def _wait_flood(self) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self._resume_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def call(self, client, request):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            await self._wait_flood()
+            async with self._sem:
+                try:
+                    return await client(request)
+                except errors.FloodWaitError as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+                    log(f"⏳ FloodWait: жду {e.seconds} сек... (попытка {attempt}/{self.max_retries})")
+                    self._resume_at = max(self._resume_at, loop.time() + e.seconds + 1)
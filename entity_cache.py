@@ -0,0 +1,180 @@
+import sqlite3
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from telethon import utils
+from telethon.utils import get_peer_id
+
+from common import dump_tl, load_tl
+
+
+# =========================
+# КЭШ ЧАТОВ И ТЕМ (SQLite)
+# =========================
+class CachedTopic(NamedTuple):
+    """Тема форума из кэша: те же поля, что читает main.py у types.ForumTopic."""
+    id: int
+    title: str
+    top_message: Optional[int]
+
+
+class EntityCache:
+    """
+    Локальный кэш того, что дорого получать при каждом запуске:
+      - entity чата целиком (с access_hash) по peer_id / @username / названию
+      - список диалогов для --pick-chat
+      - темы форума по чату
+    Записи моложе ttl секунд используются без запросов к Telegram;
+    более старые перепроверяются одним запросом (см. resolve_chat_entity в main.py).
+    """
+
+    def __init__(self, path: str, ttl: float = 86400):
+        self.path = path
+        self.ttl = float(ttl)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entities (
+                peer_id    INTEGER PRIMARY KEY,
+                username   TEXT,
+                title      TEXT,
+                raw        BLOB    NOT NULL,
+                updated_at REAL    NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entities_username ON entities (username);
+            CREATE INDEX IF NOT EXISTS entities_title ON entities (title);
+            CREATE TABLE IF NOT EXISTS dialogs (
+                position   INTEGER PRIMARY KEY,
+                peer_id    INTEGER NOT NULL,
+                name       TEXT    NOT NULL,
+                updated_at REAL    NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS forum_topics (
+                chat_id     INTEGER NOT NULL,
+                topic_id    INTEGER NOT NULL,
+                title       TEXT    NOT NULL,
+                top_message INTEGER,
+                updated_at  REAL    NOT NULL,
+                PRIMARY KEY (chat_id, topic_id)
+            );
+            """
+        )
+        self._db.commit()
+
+    def _fresh(self, updated_at: float) -> bool:
+        return time.time() - float(updated_at) < self.ttl
+
+    # ---------- entity ----------
+    def put(self, entity) -> None:
+        self.put_many([entity])
+
+    def put_many(self, entities) -> None:
+        now = time.time()
+        rows = []
+        for ent in entities:
+            try:
+                pid = get_peer_id(ent)
+            except TypeError:
+                continue
+            username = (getattr(ent, "username", None) or "").lower() or None
+            title = getattr(ent, "title", None) or utils.get_display_name(ent) or None
+            rows.append((pid, username, title.lower() if title else None, dump_tl(ent), now))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO entities (peer_id, username, title, raw, updated_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._db.commit()
+
+    def lookup(self, ref) -> Optional[Tuple[object, bool]]:
+        """
+        Ищет entity по int peer_id (как есть или со сменой знака), @username/ссылке или названию.
+        Возвращает (entity, свежая ли запись) или None.
+        """
+        if isinstance(ref, int):
+            row = self._db.execute(
+                "SELECT raw, updated_at FROM entities WHERE peer_id IN (?, ?)", (ref, -ref),
+            ).fetchone()
+        elif isinstance(ref, str) and ref.strip():
+            s = ref.strip()
+            username = s.rsplit("/", 1)[-1].lstrip("@").lower()
+            row = self._db.execute(
+                "SELECT raw, updated_at FROM entities WHERE username=? OR title=? "
+                "ORDER BY username=? DESC LIMIT 1",
+                (username, s.lower(), username),
+            ).fetchone()
+        else:
+            return None
+        if row is None:
+            return None
+        return load_tl(row[0]), self._fresh(row[1])
+
+    def invalidate(self, peer_id: int) -> None:
+        """Забыть chat (например, access_hash перестал подходить)."""
+        self._db.execute("DELETE FROM entities WHERE peer_id IN (?, ?)", (peer_id, -peer_id))
+        self._db.execute("DELETE FROM forum_topics WHERE chat_id IN (?, ?)", (peer_id, -peer_id))
+        self._db.commit()
+
+    # ---------- диалоги (--pick-chat) ----------
+    def put_dialogs(self, dialogs) -> None:
+        now = time.time()
+        self.put_many([d.entity for d in dialogs])
+        self._db.execute("DELETE FROM dialogs")
+        self._db.executemany(
+            "INSERT INTO dialogs (position, peer_id, name, updated_at) VALUES (?, ?, ?, ?)",
+            [(i, int(d.id), d.name or "", now) for i, d in enumerate(dialogs)],
+        )
+        self._db.commit()
+
+    def dialogs(self, limit: int) -> Optional[List[Tuple[str, int, object]]]:
+        """[(name, peer_id, entity)] в порядке списка диалогов; None, если кэш пуст или устарел."""
+        rows = self._db.execute(
+            "SELECT d.name, d.peer_id, e.raw, d.updated_at FROM dialogs d "
+            "JOIN entities e ON e.peer_id = d.peer_id ORDER BY d.position LIMIT ?",
+            (int(limit),),
+        ).fetchall()
+        if len(rows) < limit or not self._fresh(rows[0][3]):
+            return None
+        return [(name, int(pid), load_tl(raw)) for name, pid, raw, _ in rows]
+
+    # ---------- темы форума ----------
+    def put_topics(self, chat_id: int, topics, replace: bool = True) -> None:
+        """
+        replace=True — полный обход: темы, которых нет в topics, удаляются.
+        replace=False — дообход после водяного знака: темы добавляются/обновляются,
+        а остальные просто считаются проверенными сейчас.
+        """
+        now = time.time()
+        if replace:
+            self._db.execute("DELETE FROM forum_topics WHERE chat_id=?", (int(chat_id),))
+        else:
+            self._db.execute("UPDATE forum_topics SET updated_at=? WHERE chat_id=?", (now, int(chat_id)))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO forum_topics (chat_id, topic_id, title, top_message, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (int(chat_id), int(t.id), str(t.title), getattr(t, "top_message", None), now)
+                for t in topics if getattr(t, "title", None)
+            ],
+        )
+        self._db.commit()
+
+    def topics_watermark(self, chat_id: int) -> int:
+        """Последнее сообщение в темах чата на момент обхода (0 — тем в кэше нет)."""
+        row = self._db.execute(
+            "SELECT MAX(top_message) FROM forum_topics WHERE chat_id=?", (int(chat_id),),
+        ).fetchone()
+        return int(row[0] or 0)
+
+    def topics(self, chat_id: int) -> Optional[List[CachedTopic]]:
+        """Темы чата по убыванию id; None, если кэша нет или он устарел."""
+        rows = self._db.execute(
+            "SELECT topic_id, title, top_message, updated_at FROM forum_topics WHERE chat_id=? "
+            "ORDER BY topic_id DESC",
+            (int(chat_id),),
+        ).fetchall()
+        if not rows or not self._fresh(rows[0][3]):
+            return None
+        return [CachedTopic(int(tid), title, top) for tid, title, top, _ in rows]
+
+    def close(self) -> None:
+        self._db.close()
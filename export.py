@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+from datetime import date, datetime, timezone
+from typing import Optional, Set
+
+from telethon import TelegramClient, errors, functions
+from telethon.tl import types
+from telethon.tl.types import MessageMediaPoll
+from telethon.utils import get_peer_id
+
+from archive import RecordingClient, ResponseArchive
+from common import RequestLimiter, as_text, log
+from get_id import (
+    MAX_SHARD_DEPTH,
+    SHARD_DONE,
+    SHARD_SPLIT,
+    coverage_line,
+    crawl_participants_sharded,
+    participants_count,
+)
+from main import fetch_option_voters, load_config, option_vote_counts, resolve_chat_entity
+from metrics import RpcMetrics
+from poll_index import iter_search_pages
+
+
+# =========================
+# TAKEOUT
+# =========================
+class TakeoutRouter:
+    """
+    Запросы выгрузки идут через takeout-сессию: у неё мягче лимиты на массовый экспорт.
+    Если сервер не принимает какой-то тип запроса внутри takeout (TAKEOUT_INVALID / TAKEOUT_REQUIRED),
+    этот тип один раз переключается на обычный клиент. Без takeout (--no-takeout) всё идёт обычным клиентом.
+    """
+
+    def __init__(self, client: TelegramClient, takeout=None):
+        self.client = client
+        self.takeout = takeout
+        self.plain: Set[str] = set()
+
+    async def __call__(self, request):
+        name = type(request).__name__
+        if self.takeout is None or name in self.plain:
+            return await self.client(request)
+        try:
+            return await self.takeout(request)
+        except (errors.TakeoutInvalidError, errors.TakeoutRequiredError) as e:
+            # остальные ошибки (PollVoteRequired, FloodWait, ...) относятся к самому запросу, а не к takeout
+            if name not in self.plain:
+                self.plain.add(name)
+                log(f"ℹ️  {name} не идёт через takeout ({e.message}) — дальше обычными запросами")
+            return await self.client(request)
+
+
+# =========================
+# ЗАДАЧИ ВЫГРУЗКИ
+# =========================
+# каждая задача пишет в архив пачками и после каждой пачки сохраняет курсор
+# (archive_progress), поэтому прерванный экспорт продолжается с того же места
+SHARD_TASK = "participants:"  # + префикс шарда участников
+
+
+async def export_history(
+        client,
+        chat,
+        topic_id: int,
+        archive: ResponseArchive,
+        limiter: RequestLimiter,
+        since: Optional[date] = None,
+) -> int:
+    """
+    Все опросы темы (topic_id=0 — всего чата) от новых к старым до since. Возвращает число опросов.
+    Курсор history: идёт вниз по истории; history-top: самое новое просмотренное сообщение —
+    когда история выгружена целиком, следующие запуски дочитывают только то, что новее него.
+    """
+    chat_id = get_peer_id(chat)
+    task = f"history:{topic_id}"
+    top_task = f"history-top:{topic_id}"
+    cursor, done = archive.progress(chat_id, task)
+    top = archive.progress(chat_id, top_task)[0]
+    since_dt = datetime.combine(since, datetime.min.time(), tzinfo=timezone.utc) if since else None
+
+    def save(messages: list) -> int:
+        polls = [
+            m for m in messages
+            if isinstance(getattr(m, "media", None), MessageMediaPoll)
+            and (since_dt is None or m.date is None or m.date >= since_dt)
+        ]
+        archive.add_polls(chat_id, topic_id, polls)
+        return len(polls)
+
+    found = 0
+    if done:
+        if not top:
+            # архив, выгруженный до появления history-top: новее последнего опроса в архиве
+            known = archive.polls(chat_id, topic_id)
+            top = known[0][0].id if known else 0
+        newest = top
+        async for messages in iter_search_pages(client, chat, topic_id, top, 0, 100, limiter):
+            newest = max(newest, messages[0].id)
+            found += save(messages)
+        # страницы идут от новых к старым, поэтому верх сдвигается только после всего промежутка
+        archive.set_progress(chat_id, top_task, newest)
+        log(f"✅ История темы {topic_id}: новых опросов после id={top} — {found}")
+        return found
+
+    async for messages in iter_search_pages(client, chat, topic_id, 0, cursor, 100, limiter):
+        if not top:
+            top = messages[0].id
+            archive.set_progress(chat_id, top_task, top)
+        reached = since_dt is not None and messages[-1].date is not None and messages[-1].date < since_dt
+        n = save(messages)
+        found += n
+        cursor = messages[-1].id
+        archive.set_progress(chat_id, task, cursor)
+        log(f"  ... история: до id={cursor}, опросов +{n}")
+        if reached:
+            break
+    archive.set_progress(chat_id, task, cursor, done=True)
+    return found
+
+
+async def refresh_polls(client, chat, chat_peer, messages: list, limiter: RequestLimiter) -> list:
+    """
+    Перечитывает опросы пачками по 100 (актуальные poll.results): копия из истории могла устареть,
+    пока шла выгрузка, и вариант с новыми голосами считался бы пустым. Удалённые опросы выкидываются.
+    """
+    fresh = []
+    for i in range(0, len(messages), 100):
+        ids = [types.InputMessageID(m.id) for m in messages[i:i + 100]]
+        if isinstance(chat, types.Channel):
+            req = functions.channels.GetMessagesRequest(channel=chat_peer, id=ids)
+        else:
+            req = functions.messages.GetMessagesRequest(id=ids)
+        res = await limiter.call(client, req)
+        fresh.extend(
+            m for m in getattr(res, "messages", []) or []
+            if isinstance(getattr(m, "media", None), MessageMediaPoll)
+        )
+    return fresh
+
+
+async def export_votes(
+        client,
+        chat,
+        chat_peer,
+        topic_id: int,
+        archive: ResponseArchive,
+        limiter: RequestLimiter,
+        votes_page_size: int,
+        since: Optional[date] = None,
+) -> int:
+    """
+    Голоса по всем вариантам (не только «позитивным») каждого неанонимного опроса из архива.
+    Страницы сохраняются как при --record, так что по архиву работает и --replay.
+    Опрос, голоса которого Telegram не отдаёт без своего голоса, остаётся невыгруженным —
+    следующий запуск попробует снова. Возвращает число опросов, выгруженных в этот раз.
+    """
+    chat_id = get_peer_id(chat)
+    recorder = RecordingClient(client, archive)
+    todo = []
+    for msg, _ in archive.polls(chat_id, topic_id):
+        if since and msg.date and msg.date.date() < since:
+            continue
+        if not getattr(msg.media.poll, "public_voters", False):
+            continue
+        if archive.progress(chat_id, f"votes:{msg.id}")[1]:
+            continue
+        todo.append(msg)
+    log(f"🗳️ Голоса: опросов к выгрузке — {len(todo)}")
+    todo = await refresh_polls(client, chat, chat_peer, todo, limiter)
+
+    async def export_poll(msg) -> bool:
+        # снимок, по счётчикам которого выгружаются голоса: --replay верит его нулям
+        archive.put_poll_snapshot(chat_id, msg, topic_id)
+        counts = option_vote_counts(msg)
+        for ans in msg.media.poll.answers:
+            expected = counts.get(bytes(ans.option))
+            try:
+                await fetch_option_voters(recorder, chat_peer, msg, ans.option, votes_page_size, limiter, expected)
+            except errors.PollVoteRequiredError:
+                # не done: когда аккаунт проголосует, следующий запуск выгрузит этот опрос
+                log(f"⚠️ id={msg.id}: Telegram не отдаёт голоса, пока аккаунт сам не проголосует — пропускаю")
+                return False
+        archive.set_progress(chat_id, f"votes:{msg.id}", 0, done=True)
+        log(f"  ... голоса: {as_text(msg.media.poll.question)[:60]}")
+        return True
+
+    return sum(await asyncio.gather(*[export_poll(m) for m in todo]))
+
+
+async def export_participants(client, chat, archive: ResponseArchive, limiter: RequestLimiter) -> int:
+    """
+    Все участники чата. Группа — одним запросом; супергруппа обходится шардами по префиксу имени,
+    как в get_id.py (один общий список сервер обрывает на потолке). Обойдённые шарды запоминаются
+    в курсорах архива, прерванная выгрузка их пропускает. Возвращает, сколько всего участников в архиве.
+    """
+    chat_id = get_peer_id(chat)
+    if not archive.progress(chat_id, "participants")[1]:
+        if not isinstance(chat, types.Channel):
+            # обычная группа: все участники приходят одним запросом
+            full = await limiter.call(client, functions.messages.GetFullChatRequest(chat_id=chat.id))
+            archive.add_participants(chat_id, getattr(full, "users", []) or [])
+        else:
+            total = await participants_count(client, chat, limiter)
+            # курсор шарда: done — обойдён целиком, cursor=1 — поделён на подшарды
+            shards = {
+                task[len(SHARD_TASK):]: SHARD_DONE if done else SHARD_SPLIT
+                for task, (cursor, done) in archive.progress_tasks(chat_id, SHARD_TASK).items()
+                if done or cursor
+            }
+
+            def on_page(users: list) -> None:
+                archive.add_participants(chat_id, users)
+                log(f"  ... участники: +{len(users)}")
+
+            def on_shard(query: str, state: str) -> None:
+                archive.set_progress(chat_id, SHARD_TASK + query, int(state == SHARD_SPLIT), done=state == SHARD_DONE)
+
+            stats = await crawl_participants_sharded(client, chat, limiter, on_page, shards, on_shard)
+            if stats["incomplete"]:
+                log(f"⚠️ Сервер оборвал список и на глубине {MAX_SHARD_DEPTH}: {', '.join(stats['incomplete'][:20])}")
+            log(coverage_line(len(archive.participants(chat_id)), total))
+        archive.set_progress(chat_id, "participants", 0, done=True)
+    return len(archive.participants(chat_id))
+
+
+# =========================
+# MAIN
+# =========================
+async def main():
+    parser = argparse.ArgumentParser(description="Массовая выгрузка опросов, голосов и участников в архив")
+    parser.add_argument("--config", type=str, default="config.ini", help="Путь к config.ini")
+    parser.add_argument("--chat", type=str, default="", help="Чат (по умолчанию chat_id из config.ini)")
+    parser.add_argument("--topic-id", type=int, default=None, help="Тема (по умолчанию default_topic_id, 0 — весь чат)")
+    parser.add_argument("--since", type=date.fromisoformat, default=None, metavar="YYYY-MM-DD",
+                        help="Только опросы не старше этой даты")
+    parser.add_argument("--archive", type=str, default="", help="Файл архива (по умолчанию [files] archive)")
+    parser.add_argument("--no-polls", action="store_true", help="Не выгружать историю опросов")
+    parser.add_argument("--no-votes", action="store_true", help="Не выгружать голоса")
+    parser.add_argument("--no-participants", action="store_true", help="Не выгружать участников")
+    parser.add_argument("--no-takeout", action="store_true", help="Обычные запросы вместо takeout-сессии")
+    parser.add_argument("--restart", action="store_true", help="Забыть курсоры и выгрузить всё заново")
+    args = parser.parse_args()
+
+    conf = load_config(args.config)
+    archive_path = args.archive or conf["ARCHIVE"]
+    topic_id = conf["DEFAULT_TOPIC_ID"] if args.topic_id is None else args.topic_id
+
+    metrics = RpcMetrics(conf["METRICS"])
+    client = metrics.instrument(TelegramClient(conf["SESSION_NAME"], conf["API_ID"], conf["API_HASH"]))
+    with metrics.stage("connect"):
+        await client.start()
+    log("✅ Подключено к Telegram")
+
+    archive = ResponseArchive(archive_path)
+    limiter = RequestLimiter(conf["VOTES_CONCURRENCY"])
+    try:
+        chat = await resolve_chat_entity(client, args.chat.strip() or conf["CHAT_ID"])
+        chat_peer = await client.get_input_entity(chat)
+        chat_id = get_peer_id(chat)
+        if not isinstance(chat, types.Channel):
+            topic_id = 0
+        archive.put_chat(chat)
+        if args.restart:
+            archive.reset_progress(chat_id)
+        log(f"📦 Экспорт: {getattr(chat, 'title', chat_id)} (тема {topic_id}) -> {archive_path}")
+
+        async def run(router) -> None:
+            if not args.no_polls:
+                with metrics.stage("export_history"):
+                    n = await export_history(router, chat, topic_id, archive, limiter, args.since)
+                log(f"✅ История: найдено опросов — {n}")
+            if not args.no_votes:
+                with metrics.stage("export_votes"):
+                    n = await export_votes(
+                        router, chat, chat_peer, topic_id, archive, limiter, conf["VOTES_PAGE_SIZE"], args.since,
+                    )
+                log(f"✅ Голоса: выгружено опросов — {n}")
+            if not args.no_participants:
+                with metrics.stage("export_participants"):
+                    n = await export_participants(router, chat, archive, limiter)
+                log(f"✅ Участники: {n}")
+
+        if args.no_takeout:
+            await run(TakeoutRouter(client))
+        else:
+            try:
+                async with client.takeout(finalize=True, chats=True, megagroups=True, channels=True) as takeout:
+                    await run(TakeoutRouter(client, takeout))
+            except errors.TakeoutInitDelayError as e:
+                log(
+                    "❌ Telegram попросил подтвердить экспорт данных: открой Telegram на другом устройстве, "
+                    "разреши экспорт в служебном уведомлении и запусти снова "
+                    f"(или подожди {e.seconds} с). Без takeout: --no-takeout"
+                )
+                return
+        log("👋 Завершено. Отчёты по архиву: python main.py --replay " + archive_path)
+    finally:
+        archive.close()
+        metrics.flush()
+        metrics.close()
+        await client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
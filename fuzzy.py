@@ -0,0 +1,136 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+# =========================
+# НЕЧЁТКИЙ ПОИСК ПО НАЗВАНИЯМ
+# =========================
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_text(s: str) -> str:
+    """casefold, ё -> е, всё, что не буквы/цифры (эмодзи, пунктуация), -> один пробел."""
+    s = (s or "").casefold().replace("ё", "е")
+    return _NON_WORD.sub(" ", s).replace("_", " ").strip()
+
+
+def trigrams(s: str) -> Set[str]:
+    """Триграммы каждого слова с границами: "тема" -> {"  т", " те", "тем", "ема", "ма "}."""
+    out: Set[str] = set()
+    for word in s.split():
+        w = f"  {word} "
+        out.update(w[i:i + 3] for i in range(len(w) - 2))
+    return out
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау–Левенштейна (с перестановкой соседних букв); больше limit — возвращает limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def word_similarity(q: str, w: str) -> float:
+    """1.0 — совпадение или w начинается с q; иначе 1 - опечатки / длина (до трети букв)."""
+    if w.startswith(q):
+        return 1.0
+    limit = max(1, len(q) // 3)
+    # запрос может быть началом слова с опечаткой: сравниваем и с префиксами w близкой длины
+    d = edit_distance(q, w, limit)
+    for n in range(max(1, len(q) - 1), min(len(w), len(q) + 1) + 1):
+        d = min(d, edit_distance(q, w[:n], limit))
+    return 0.0 if d > limit else 1.0 - d / max(len(q), 1)
+
+
+def similarity(query: str, words: List[str], norm: str, memo: Optional[Dict[Tuple[str, str], float]] = None) -> float:
+    """
+    Оценка названия norm для запроса query (оба после normalize_text, words = query.split()):
+      1.0  — запрос целиком входит в название
+      <1.0 — каждое слово запроса сопоставляется с лучшим словом названия (префикс / опечатки)
+    memo — общий словарь на один поиск: слова в названиях повторяются, опечатки считаются один раз.
+    """
+    if query in norm:
+        return 1.0
+    title_words = set(norm.split())
+    if not title_words:
+        return 0.0
+    if memo is None:
+        memo = {}
+    sims = []
+    for q in words:
+        best = 0.0
+        for w in title_words:
+            sim = memo.get((q, w))
+            if sim is None:
+                sim = memo[(q, w)] = word_similarity(q, w)
+            if sim > best:
+                best = sim
+                if best == 1.0:
+                    break
+        sims.append(best)
+    if min(sims) == 0.0:
+        return 0.0
+    return 0.95 * sum(sims) / len(sims)
+
+
+class Match(NamedTuple):
+    score: float
+    key: object
+    text: str
+
+
+class FuzzyIndex:
+    """
+    Индекс коротких названий (темы, вопросы опросов) для поиска с опечатками.
+    Кандидаты отбираются по общим триграммам, затем ранжируются по similarity.
+    """
+
+    def __init__(self, items: Iterable[Tuple[object, str]] = ()):
+        self._items: List[Tuple[object, str, str]] = []
+        self._grams: Dict[str, List[int]] = {}
+        for key, text in items:
+            self.add(key, text)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, key, text: str) -> None:
+        pos = len(self._items)
+        norm = normalize_text(text)
+        self._items.append((key, text, norm))
+        for g in trigrams(norm):
+            self._grams.setdefault(g, []).append(pos)
+
+    def search(self, query: str, limit: int = 10, threshold: float = 0.6) -> List[Match]:
+        """Совпадения не хуже threshold, от лучших к худшим (при равенстве — в порядке добавления)."""
+        q = normalize_text(query)
+        if not q:
+            return []
+        grams = trigrams(q)
+        # кандидат — любое название хотя бы с одной общей триграммой:
+        # у короткого слова с опечаткой общих триграмм может быть всего одна
+        hits: Set[int] = set()
+        for g in grams:
+            hits.update(self._grams.get(g, ()))
+        words = q.split()
+        memo: Dict[Tuple[str, str], float] = {}
+        scored = []
+        for pos in hits:
+            norm = self._items[pos][2]
+            score = similarity(q, words, norm, memo)
+            if score >= threshold:
+                scored.append((score, pos))
+        scored.sort(key=lambda sp: (-sp[0], sp[1]))
+        return [Match(round(score, 3), self._items[pos][0], self._items[pos][1]) for score, pos in scored[:limit]]
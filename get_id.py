@@ -1,11 +1,21 @@
+import argparse
 import asyncio
 import configparser
 import csv
+import json
 import os
-from typing import Optional
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
-from telethon import TelegramClient
-from telethon.errors import FloodWaitError
+from telethon import TelegramClient, errors, functions
+from telethon.tl import types
+
+from common import RequestLimiter
+from instruments import UNKNOWN_INSTRUMENT
+from metrics import RpcMetrics
+
+CSV_HEADER = ["user_id", "first_name", "last_name", "username"]
+PAGE_SIZE = 200  # максимум, который отдаёт channels.getParticipants
 
 
 def load_config(path: str = "config.ini") -> dict:
@@ -28,59 +38,633 @@ def load_config(path: str = "config.ini") -> dict:
         "API_HASH": get("telegram", "api_hash"),
         "SESSION_NAME": get("telegram", "session_name", "orchestra_parser"),
         "CHAT_ID": int(get("telegram", "chat_id")),
+        "MUSICIANS_CSV": get("files", "musicians_csv", "Музыканты.csv"),
+        "METRICS": get("metrics", "path", "metrics.json"),
+        "CONCURRENCY": int(get("participants", "concurrency", "4")),
+        "SHARDED_FROM": int(get("participants", "sharded_from", "1000")),
     }
 
 
+def user_row(user) -> list:
+    # user может быть deleted — тогда имена/юзернейм могут быть пустыми
+    return [
+        int(user.id),
+        (getattr(user, "first_name", None) or "").strip(),
+        (getattr(user, "last_name", None) or "").strip(),
+        (getattr(user, "username", None) or "").strip(),
+    ]
+
+
+def participant_user_id(p) -> Optional[int]:
+    uid = getattr(p, "user_id", None)
+    if uid is None:
+        peer = getattr(p, "peer", None)
+        uid = getattr(peer, "user_id", None)
+    return int(uid) if uid is not None else None
+
+
+# =========================
+# ПОТОКОВАЯ ЗАПИСЬ + ЧЕКПОИНТ
+# =========================
+class ParticipantWriter:
+    """
+    Пишет участников в CSV пачками и после каждой пачки сохраняет чекпоинт
+    (смещение в списке участников + размер уже записанного файла).
+    После сбоя или FloodWait выгрузка продолжается с чекпоинта: хвост CSV,
+    записанный после последнего чекпоинта, обрезается.
+    """
+
+    def __init__(self, out_file: str, chat_id: int, checkpoint_file: Optional[str] = None):
+        self.out_file = out_file
+        self.chat_id = chat_id
+        self.checkpoint_file = checkpoint_file or f"{out_file}.checkpoint"
+        self.offset = 0
+        self.count = 0
+        self.seen: Set[int] = set()
+        self.state: Dict = {}
+        self._f = None
+        self._w = None
+
+    def open(self) -> bool:
+        """Открывает CSV. Возвращает True, если выгрузка продолжается с чекпоинта."""
+        cp = self._read_checkpoint()
+        if cp and cp.get("chat_id") == self.chat_id and os.path.exists(self.out_file):
+            self.offset = int(cp["offset"])
+            self.count = int(cp["count"])
+            self.state = cp.get("state", {})
+            with open(self.out_file, "r+b") as f:
+                f.truncate(int(cp["bytes"]))
+            self._load_seen()
+            self._f = open(self.out_file, "a", encoding="utf-8", newline="")
+            self._w = csv.writer(self._f, delimiter=";")
+            return True
+
+        # Пишем CSV (UTF-8 with BOM, чтобы нормально открывалось в Excel)
+        self._f = open(self.out_file, "w", encoding="utf-8-sig", newline="")
+        self._w = csv.writer(self._f, delimiter=";")
+        self._w.writerow(CSV_HEADER)
+        self._commit()
+        return False
+
+    def _load_seen(self) -> None:
+        with open(self.out_file, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f, delimiter=";"):
+                try:
+                    self.seen.add(int(row["user_id"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+    def _read_checkpoint(self) -> Optional[dict]:
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _commit(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        cp = {
+            "chat_id": self.chat_id,
+            "offset": self.offset,
+            "count": self.count,
+            "bytes": os.path.getsize(self.out_file),
+            "state": self.state,
+        }
+        tmp = self.checkpoint_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cp, f)
+        os.replace(tmp, self.checkpoint_file)
+
+    def write_batch(self, users: Iterable, next_offset: int) -> int:
+        """Дописывает пачку (без дублей) и сохраняет чекпоинт. Возвращает число новых строк."""
+        added = 0
+        for user in users:
+            uid = int(user.id)
+            if uid in self.seen:
+                continue
+            self.seen.add(uid)
+            self._w.writerow(user_row(user))
+            added += 1
+        self.count += added
+        self.offset = next_offset
+        self._commit()
+        return added
+
+    def set_state(self, key: str, value) -> None:
+        """Сохраняет значение в чекпоинт (например, какие шарды уже обойдены)."""
+        self.state[key] = value
+        self._commit()
+
+    def finish(self) -> None:
+        self._f.close()
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+    def close(self) -> None:
+        if self._f is not None and not self._f.closed:
+            self._f.close()
+
+
+# =========================
+# ВЫГРУЗКА УЧАСТНИКОВ
+# =========================
+async def search_participants_page(
+        client, chat, query: str, offset: int, limiter: RequestLimiter, limit: int = PAGE_SIZE,
+) -> Tuple[List, int, int]:
+    """
+    Одна страница участников супергруппы/канала, чьё имя/фамилия/юзернейм начинается с query
+    ("" — все подряд). FloodWait — ждём и повторяем ту же страницу.
+    Возвращает (users, сколько участников было на странице, сколько всего подходит по мнению сервера).
+    """
+    res = await limiter.call(client, functions.channels.GetParticipantsRequest(
+        channel=chat,
+        filter=types.ChannelParticipantsSearch(query),
+        offset=offset,
+        limit=limit,
+        hash=0,
+    ))
+    users = {int(u.id): u for u in getattr(res, "users", []) or []}
+    participants = getattr(res, "participants", []) or []
+    page = []
+    for p in participants:
+        uid = participant_user_id(p)
+        if uid is not None and uid in users:
+            page.append(users[uid])
+    return page, len(participants), int(getattr(res, "count", 0) or 0)
+
+
+async def fetch_participants_page(
+        client, chat, offset: int, limiter: RequestLimiter, limit: int = PAGE_SIZE,
+) -> Tuple[List, int]:
+    """
+    Одна страница общего списка участников.
+    Возвращает (users, сколько участников было на странице) — второе нужно для следующего offset.
+    """
+    page, n, _ = await search_participants_page(client, chat, "", offset, limiter, limit)
+    return page, n
+
+
+async def participants_count(client, chat, limiter: RequestLimiter) -> int:
+    """Сколько участников в чате по данным сервера (0 — неизвестно)."""
+    if not isinstance(chat, types.Channel):
+        return 0
+    full = await limiter.call(client, functions.channels.GetFullChannelRequest(channel=chat))
+    return int(getattr(getattr(full, "full_chat", None), "participants_count", 0) or 0)
+
+
+# =========================
+# ШАРДИРОВАННЫЙ ОБХОД (большие чаты)
+# =========================
+# Один проход по списку (и по любому поиску) сервер обрывает на нескольких тысячах участников:
+# дальше страницы приходят пустыми, и CSV молча получается неполным. Поэтому список режется на шарды
+# по началу имени/фамилии/юзернейма: общий список, упёршийся в потолок, делится на "а", "б", ..., "a", ..., "0",
+# шарды обходятся параллельно под общим RequestLimiter, а упёршийся шард делится дальше ("аа", "аб", ...).
+SHARD_ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя" "abcdefghijklmnopqrstuvwxyz" "0123456789"
+MAX_SHARD_DEPTH = 3
+SHARD_WAVE = 4  # сколько страниц одного шарда запрашивать разом
+SHARD_DONE = "done"    # шард обойдён целиком (или глубже делить некуда)
+SHARD_SPLIT = "split"  # шард упёрся в потолок и поделён на подшарды
+
+
+async def crawl_shard(client, chat, query: str, limiter: RequestLimiter, on_page: Callable[[List], None]) -> bool:
+    """
+    Все страницы поиска query. Первая страница сообщает count, остальные смещения известны заранее
+    и запрашиваются волнами по SHARD_WAVE параллельно; пустая страница (потолок сервера) останавливает обход.
+    True — сервер отдал всех, False — оборвал список раньше count.
+    """
+    page, n, count = await search_participants_page(client, chat, query, 0, limiter)
+    if n == 0:
+        return count == 0
+    on_page(page)
+    got = n
+    offsets = list(range(n, count, PAGE_SIZE))
+    for start in range(0, len(offsets), SHARD_WAVE):
+        pages = await asyncio.gather(*(
+            search_participants_page(client, chat, query, offset, limiter)
+            for offset in offsets[start:start + SHARD_WAVE]
+        ))
+        for page, n, _ in pages:
+            on_page(page)
+            got += n
+        if any(n == 0 for _, n, _ in pages):
+            break
+    return got >= count
+
+
+async def crawl_participants_sharded(
+        client,
+        chat,
+        limiter: RequestLimiter,
+        on_page: Callable[[List], None],
+        shards: Optional[Dict[str, str]] = None,
+        on_shard: Optional[Callable[[str, str], None]] = None,
+        max_depth: int = MAX_SHARD_DEPTH,
+) -> Dict:
+    """
+    Обходит участников шардами параллельно; on_page получает только ещё не встреченных (дедупликация по user_id).
+    shards — состояние прошлого прогона (query -> SHARD_DONE / SHARD_SPLIT): обойдённые шарды пропускаются,
+    поделённые сразу идут в подшарды. on_shard(query, state) вызывается, когда шард закончен.
+    Возвращает статистику: found, shards, split, incomplete (шарды, где и на max_depth список оборван).
+    """
+    shards = {} if shards is None else shards
+    seen: Set[int] = set()
+    stats: Dict = {"found": 0, "shards": 0, "split": 0, "incomplete": []}
+
+    def accept(users: List) -> None:
+        fresh = []
+        for user in users:
+            uid = int(user.id)
+            if uid not in seen:
+                seen.add(uid)
+                fresh.append(user)
+        stats["found"] += len(fresh)
+        if fresh:
+            on_page(fresh)
+
+    def finish(query: str, state: str) -> None:
+        shards[query] = state
+        if on_shard is not None:
+            on_shard(query, state)
+
+    async def run(query: str) -> None:
+        state = shards.get(query)
+        if state == SHARD_DONE:
+            return
+        if state != SHARD_SPLIT:
+            stats["shards"] += 1
+            complete = await crawl_shard(client, chat, query, limiter, accept)
+            if complete or len(query) >= max_depth:
+                if not complete:
+                    stats["incomplete"].append(query or "''")
+                finish(query, SHARD_DONE)
+                return
+            finish(query, SHARD_SPLIT)
+        stats["split"] += 1
+        await asyncio.gather(*(run(query + ch) for ch in SHARD_ALPHABET))
+
+    # корень — общий список: если сервер отдал его целиком, шарды не нужны; иначе он делится на буквы.
+    # Заодно он ловит тех, у кого имя начинается с эмодзи или редкой буквы.
+    await run("")
+    return stats
+
+
+def coverage_line(found: int, total: int) -> str:
+    if not total:
+        return f"📊 Собрано {found} (общее число участников сервер не сообщил)"
+    return f"📊 Покрытие: {found} из {total} ({found / total:.1%})"
+
+
+async def export_participants(
+        client, chat, writer: ParticipantWriter, limiter: RequestLimiter, sharded_from: int = 1000,
+) -> None:
+    """
+    Выгрузка в writer. Чаты больше sharded_from участников обходятся шардами параллельно
+    (sharded_from=0 — всегда шардами, отрицательное — всегда одним проходом).
+    """
+    if not isinstance(chat, types.Channel):
+        # обычная группа: все участники приходят одним запросом
+        full = await limiter.call(client, functions.messages.GetFullChatRequest(chat_id=chat.id))
+        writer.write_batch(getattr(full, "users", []) or [], next_offset=0)
+        return
+
+    total = await participants_count(client, chat, limiter) if sharded_from >= 0 else 0
+    if sharded_from >= 0 and (total > sharded_from or "shards" in writer.state):
+        shards = dict(writer.state.get("shards", {}))
+
+        def on_page(users: List) -> None:
+            writer.write_batch(users, next_offset=writer.offset)
+            print(f"  ... {writer.count} участников")
+
+        def on_shard(query: str, state: str) -> None:
+            writer.set_state("shards", dict(shards))
+
+        stats = await crawl_participants_sharded(client, chat, limiter, on_page, shards, on_shard)
+        print(f"🧩 Шардов обойдено: {stats['shards']}, поделено: {stats['split']}")
+        if stats["incomplete"]:
+            print(f"⚠️ Сервер оборвал список и на глубине {MAX_SHARD_DEPTH}: {', '.join(stats['incomplete'][:20])}")
+        print(coverage_line(writer.count, total))
+        return
+
+    while True:
+        page, n = await fetch_participants_page(client, chat, writer.offset, limiter)
+        if n == 0:
+            break
+        writer.write_batch(page, next_offset=writer.offset + n)
+        print(f"  ... {writer.count} участников")
+    if total:
+        print(coverage_line(writer.count, total))
+
+
+# =========================
+# ИНКРЕМЕНТАЛЬНАЯ СИНХРОНИЗАЦИЯ (--sync)
+# =========================
+# Админ-лог Telegram хранит события только 48 часов: если прошлый снимок старше,
+# часть вступлений/выходов могла пропасть — тогда делаем полный проход.
+ADMIN_LOG_MAX_AGE = 47 * 3600
+ADMIN_LOG_PAGE = 100
+
+
+def display_row(row: list) -> str:
+    name = " ".join(str(x) for x in row[1:3] if x)
+    return f"{name} @{row[3]}" if row[3] else name
+
+
+def load_snapshot(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(path: str, snap: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snap, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def read_participants_csv(path: str) -> Dict[int, list]:
+    rows: Dict[int, list] = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f, delimiter=";"):
+            try:
+                uid = int(row["user_id"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            rows[uid] = [uid] + [(row.get(k) or "").strip() for k in CSV_HEADER[1:]]
+    return rows
+
+
+def write_participants_csv(path: str, rows: Dict[int, list]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(CSV_HEADER)
+        w.writerows(rows.values())
+    os.replace(tmp, path)
+
+
+def admin_log_user_id(ev) -> Tuple[Optional[int], Optional[bool]]:
+    """(user_id, True=вступил / False=вышел) для событий состава; (None, None) для прочих."""
+    a = ev.action
+    if isinstance(a, (
+            types.ChannelAdminLogEventActionParticipantJoin,
+            types.ChannelAdminLogEventActionParticipantJoinByInvite,
+            types.ChannelAdminLogEventActionParticipantJoinByRequest,
+    )):
+        return int(ev.user_id), True
+    if isinstance(a, types.ChannelAdminLogEventActionParticipantLeave):
+        return int(ev.user_id), False
+    if isinstance(a, types.ChannelAdminLogEventActionParticipantInvite):
+        return participant_user_id(a.participant), True
+    if isinstance(a, types.ChannelAdminLogEventActionParticipantToggleBan):
+        p = a.new_participant
+        if isinstance(p, types.ChannelParticipantBanned):
+            # ограничение (без медиа, без сообщений) оставляет в чате; выход — кик или запрет читать
+            rights = getattr(p, "banned_rights", None)
+            gone = bool(getattr(p, "left", False) or (rights is not None and rights.view_messages))
+        else:
+            gone = isinstance(p, types.ChannelParticipantLeft)
+        return participant_user_id(p), not gone
+    return None, None
+
+
+async def fetch_admin_log_delta(client, chat, min_id: int, limiter: RequestLimiter):
+    """
+    Вступления/выходы из админ-лога после события min_id.
+    Возвращает (joined: uid -> user, left: set(uid), users: uid -> user из событий, max_event_id).
+    """
+    events = []
+    users: Dict[int, object] = {}
+    max_id = 0
+    while True:
+        res = await limiter.call(client, functions.channels.GetAdminLogRequest(
+            channel=chat,
+            q="",
+            max_id=max_id,
+            min_id=min_id,
+            limit=ADMIN_LOG_PAGE,
+            events_filter=types.ChannelAdminLogEventsFilter(join=True, leave=True, invite=True, ban=True, kick=True),
+        ))
+        page = getattr(res, "events", []) or []
+        for u in getattr(res, "users", []) or []:
+            users[int(u.id)] = u
+        events.extend(page)
+        if len(page) < ADMIN_LOG_PAGE:
+            break
+        max_id = min(ev.id for ev in page)
+
+    joined: Dict[int, object] = {}
+    left: Set[int] = set()
+    for ev in sorted(events, key=lambda e: e.id):
+        uid, is_join = admin_log_user_id(ev)
+        if uid is None:
+            continue
+        if is_join:
+            left.discard(uid)
+            if uid in users:
+                joined[uid] = users[uid]
+        else:
+            joined.pop(uid, None)
+            left.add(uid)
+
+    top = max([ev.id for ev in events], default=min_id)
+    return joined, left, users, top
+
+
+async def admin_log_watermark(client, chat, limiter: RequestLimiter) -> int:
+    """id последнего события админ-лога (0 — лог недоступен: нет прав админа)."""
+    if not isinstance(chat, types.Channel):
+        return 0
+    try:
+        res = await limiter.call(client, functions.channels.GetAdminLogRequest(
+            channel=chat, q="", max_id=0, min_id=0, limit=1,
+        ))
+    except errors.ChatAdminRequiredError:
+        return 0
+    events = getattr(res, "events", []) or []
+    return int(events[0].id) if events else 0
+
+
+def merge_new_musicians(path: str, new_rows: List[list]) -> int:
+    """
+    Дописывает новых участников в CSV музыкантов с инструментом "неизвестно".
+    Имена/юзернейм заполняются, только если такие колонки уже есть в файле.
+    Возвращает число добавленных строк.
+    """
+    if not new_rows:
+        return 0
+
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            csv.writer(f, delimiter=";").writerow(CSV_HEADER + ["Инструмент"])
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        fieldnames = list(reader.fieldnames or [])
+        known: Set[int] = set()
+        for row in reader:
+            try:
+                known.add(int((row.get("user_id") or "").strip()))
+            except ValueError:
+                continue
+
+    needs_newline = False
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b"\n", b"\r")
+
+    added = 0
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        if needs_newline:
+            f.write("\r\n")
+        w = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";", extrasaction="ignore")
+        for row in new_rows:
+            if row[0] in known:
+                continue
+            values = dict(zip(CSV_HEADER, row))
+            values["Инструмент"] = UNKNOWN_INSTRUMENT
+            w.writerow({k: values.get(k, "") for k in fieldnames})
+            added += 1
+    return added
+
+
+async def sync_participants(
+        client,
+        chat,
+        chat_id: int,
+        out_file: str,
+        musicians_csv: str,
+        limiter: RequestLimiter,
+        full: bool = False,
+        sharded_from: int = 1000,
+) -> None:
+    """
+    Обновляет снимок участников по изменениям:
+      - есть свежий снимок и права админа — только события админ-лога после прошлой синхронизации
+      - иначе — полная потоковая выгрузка (с чекпоинтом) и сравнение со снимком
+    Новых участников дописывает в CSV музыкантов с инструментом "неизвестно".
+    """
+    snapshot_file = f"{out_file}.snapshot.json"
+    snap = load_snapshot(snapshot_file)
+    if snap and snap.get("chat_id") != chat_id:
+        snap = None
+
+    old: Dict[int, list] = {int(k): v for k, v in (snap or {}).get("users", {}).items()}
+    current: Optional[Dict[int, list]] = None
+    log_id = int((snap or {}).get("admin_log_max_id", 0))
+    fresh = snap is not None and time.time() - float(snap.get("synced_at", 0)) < ADMIN_LOG_MAX_AGE
+
+    if not full and fresh and log_id and isinstance(chat, types.Channel):
+        try:
+            joined, left, seen, log_id = await fetch_admin_log_delta(client, chat, log_id, limiter)
+            current = dict(old)
+            for uid, user in seen.items():
+                if uid in current:
+                    current[uid] = user_row(user)
+            for uid in left:
+                current.pop(uid, None)
+            for uid, user in joined.items():
+                current[uid] = user_row(user)
+            print(f"📜 Админ-лог: вступили {len(joined)}, вышли {len(left)}")
+        except errors.ChatAdminRequiredError:
+            print("⚠️ Нет прав на админ-лог — делаю полный проход.")
+
+    if current is None:
+        new_log_id = await admin_log_watermark(client, chat, limiter)
+        writer = ParticipantWriter(out_file, chat_id)
+        if writer.open():
+            print(f"↩️  Продолжаю с чекпоинта: смещение {writer.offset}, уже записано {writer.count}")
+        try:
+            await export_participants(client, chat, writer, limiter, sharded_from)
+            writer.finish()
+        finally:
+            writer.close()
+        current = read_participants_csv(out_file)
+        log_id = new_log_id
+    else:
+        write_participants_csv(out_file, current)
+
+    joins = [current[u] for u in current if u not in old]
+    leaves = [old[u] for u in old if u not in current]
+    renames = [(old[u], current[u]) for u in current if u in old and old[u] != current[u]]
+
+    save_snapshot(snapshot_file, {
+        "chat_id": chat_id,
+        "admin_log_max_id": log_id,
+        "synced_at": time.time(),
+        "users": {str(u): row for u, row in current.items()},
+    })
+
+    print(f"➕ Новых: {len(joins)}  ➖ Вышли: {len(leaves)}  ✏️ Сменили имя/юзернейм: {len(renames)}")
+    for row in leaves[:50]:
+        print(f"  ➖ {row[0]} {display_row(row)}")
+    for before, after in renames[:50]:
+        print(f"  ✏️ {after[0]}: {display_row(before)} → {display_row(after)}")
+
+    # при самом первом запуске «новые» — это все, их в музыканты не дописываем
+    if snap is not None:
+        added = merge_new_musicians(musicians_csv, joins)
+        print(f"🎻 В {musicians_csv} добавлено с инструментом «{UNKNOWN_INSTRUMENT}»: {added}")
+    else:
+        print("📸 Первый снимок участников сохранён — следующие запуски --sync будут инкрементальными.")
+
+
 async def main():
-    conf = load_config("config.ini")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="config.ini", help="Путь к config.ini")
+    parser.add_argument("--sync", action="store_true",
+                        help="Инкрементально обновить участников и дописать новых в CSV музыкантов")
+    parser.add_argument("--full", action="store_true", help="С --sync: всегда делать полный проход")
+    shard_mode = parser.add_mutually_exclusive_group()
+    shard_mode.add_argument("--shards", action="store_true", help="Всегда обходить участников шардами")
+    shard_mode.add_argument("--no-shards", action="store_true", help="Всегда одним последовательным проходом")
+    args = parser.parse_args()
+
+    conf = load_config(args.config)
+    sharded_from = 0 if args.shards else -1 if args.no_shards else conf["SHARDED_FROM"]
+    limiter = RequestLimiter(conf["CONCURRENCY"])
 
-    client = TelegramClient(conf["SESSION_NAME"], conf["API_ID"], conf["API_HASH"])
+    metrics = RpcMetrics(conf["METRICS"])
+    client = metrics.instrument(TelegramClient(conf["SESSION_NAME"], conf["API_ID"], conf["API_HASH"]))
 
     print("🆔 Запуск сборщика участников...")
-    await client.start()
+    with metrics.stage("connect"):
+        await client.start()
     print("✅ Подключено к Telegram")
 
     out_file = "Участники.csv"
     chat_id = conf["CHAT_ID"]
+    writer = ParticipantWriter(out_file, chat_id)
 
     try:
         chat = await client.get_entity(chat_id)
         title = getattr(chat, "title", str(chat_id))
         print(f"👥 Собираю участников чата: {title} ({chat_id})")
 
-        rows = []
-        count = 0
+        if args.sync:
+            await sync_participants(
+                client, chat, chat_id, out_file, conf["MUSICIANS_CSV"], limiter,
+                full=args.full, sharded_from=sharded_from,
+            )
+            return
 
-        async for user in client.iter_participants(chat):
-            try:
-                # user может быть deleted — тогда имена/юзернейм могут быть пустыми
-                uid = int(user.id)
-                first_name = (user.first_name or "").strip()
-                last_name = (user.last_name or "").strip()
-                username = (user.username or "").strip()
+        if writer.open():
+            print(f"↩️  Продолжаю с чекпоинта: смещение {writer.offset}, уже записано {writer.count}")
 
-                rows.append([uid, first_name, last_name, username])
-                count += 1
-
-                if count % 200 == 0:
-                    print(f"  ... {count} участников")
-
-            except FloodWaitError as e:
-                # если Telegram просит подождать
-                print(f"⏳ FloodWait: жду {e.seconds} сек...")
-                await asyncio.sleep(e.seconds)
-
-        print(f"✅ Собрано: {count} участников")
-
-        # Пишем CSV (UTF-8 with BOM, чтобы нормально открывалось в Excel)
-        with open(out_file, "w", encoding="utf-8-sig", newline="") as f:
-            w = csv.writer(f, delimiter=";")
-            w.writerow(["user_id", "first_name", "last_name", "username"])
-            w.writerows(rows)
+        await export_participants(client, chat, writer, limiter, sharded_from)
+        writer.finish()
 
+        print(f"✅ Собрано: {writer.count} участников")
         print(f"💾 Сохранено в файл: {out_file}")
 
     finally:
+        writer.close()
+        metrics.flush()
+        metrics.close()
         await client.disconnect()
         print("👋 Завершено")
 
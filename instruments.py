@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+
+# =========================
+# ПРАВИЛА НОРМАЛИЗАЦИИ ИНСТРУМЕНТОВ
+# =========================
+# Порядок важен: побеждает первое правило, все подстроки которого есть в строке.
+# Так задаётся старшинство, которое раньше было спрятано в порядке if-ов:
+# "альт-сакс" проверяется до "альт", "скрип" без номера — первые скрипки.
+DEFAULT_RULES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("первые скрипки", ("скрип", "1")),
+    ("вторые скрипки", ("скрип", "2")),
+    ("первые скрипки", ("скрип",)),  # если база хранит просто "скрипки" — выбери, что удобнее
+
+    ("сопрано-саксофон", ("сакс", "сопран")),
+    ("альт-саксофон", ("сакс", "альт-сакс")),
+    ("тенор-саксофон", ("сакс", "тенор")),
+    ("баритон-саксофон", ("сакс", "барит")),
+    ("бас-саксофон", ("сакс", "бас")),
+    ("саксофон", ("сакс",)),
+
+    ("альт", ("альт",)),
+    ("виолончель", ("виолонч",)),
+    ("контрабас", ("контрабас",)),
+
+    ("флейта", ("флейт",)),
+    ("гобой", ("гобо",)),
+    ("кларнет", ("кларнет",)),
+    ("фагот", ("фагот",)),
+
+    ("валторна", ("валторн",)),
+    ("труба", ("труба",)),
+    ("тромбон", ("тромбон",)),
+    ("туба", ("туба",)),
+
+    ("ударные", ("удар",)),
+    ("ударные", ("перкус",)),
+    ("фортепиано", ("фортеп",)),
+    ("фортепиано", ("пианино",)),
+    ("арфа", ("арфа",)),
+    ("дирижёр", ("дириж",)),
+]
+
+UNKNOWN_INSTRUMENT = "неизвестно"
+MEMO_SIZE = 4096  # сколько разных написаний помнит normalize()
+
+
+def prepare_instrument_text(raw: str) -> str:
+    return (raw or "").strip().lower().replace("ё", "е")
+
+
+# =========================
+# НОРМАЛИЗАТОР
+# =========================
+class InstrumentNormalizer:
+    """
+    Табличная нормализация инструментов:
+      - правила идут по порядку, первое, все подстроки которого есть в строке, задаёт ключ
+      - подряд идущие правила с общей первой подстрокой проверяются одной веткой
+        ("скрип" -> "1" / "2" / просто "скрип"), как в прежней цепочке if-ов
+      - результат кэшируется по исходной строке (lru, не больше memo_size строк)
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, Sequence[str]]] = DEFAULT_RULES, memo_size: int = MEMO_SIZE):
+        self.rules = [(key, tuple(patterns)) for key, patterns in rules]
+
+        # [(первая подстрока, [(остальные подстроки, ключ), ...]), ...]
+        self._chain: List[Tuple[str, List[Tuple[Tuple[str, ...], str]]]] = []
+        for key, pats in self.rules:
+            if not pats:
+                continue
+            if self._chain and self._chain[-1][0] == pats[0]:
+                self._chain[-1][1].append((pats[1:], key))
+            else:
+                self._chain.append((pats[0], [(pats[1:], key)]))
+        self._normalize = lru_cache(maxsize=memo_size)(self._classify)
+
+        digest = hashlib.sha256(
+            json.dumps(self.rules, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        self.rules_key = digest[:16]
+
+    @classmethod
+    def from_file(cls, path: str) -> "InstrumentNormalizer":
+        """
+        JSON: {"rules": [{"key": "альт", "all": ["альт"]}, {"key": "ударные", "any": ["удар", "перкус"]}, ...]}
+        "all" — все подстроки должны встретиться; "any" — любая (разворачивается в несколько правил).
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Файл правил инструментов не найден: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        rules: List[Tuple[str, Tuple[str, ...]]] = []
+        for item in data.get("rules", []):
+            key = item["key"]
+            if "all" in item:
+                rules.append((key, tuple(prepare_instrument_text(p) for p in item["all"])))
+            for p in item.get("any", []):
+                rules.append((key, (prepare_instrument_text(p),)))
+        if not rules:
+            raise ValueError(f"В {path} нет правил (ключ 'rules')")
+        return cls(rules)
+
+    def _classify(self, raw: str) -> str:
+        s = (raw or "").strip().lower().replace("ё", "е")  # prepare_instrument_text, без лишнего вызова
+        for first, branch in self._chain:
+            if first in s:
+                for rest, key in branch:
+                    for p in rest:
+                        if p not in s:
+                            break
+                    else:
+                        return key
+        return s or UNKNOWN_INSTRUMENT
+
+    def normalize(self, raw: str) -> str:
+        return self._normalize(raw or "")
+
+    def normalize_column(self, values: Iterable[Optional[str]]) -> List[str]:
+        """
+        Нормализует целый столбец за один вызов: каждая уникальная строка
+        классифицируется один раз, результат раздаётся по индексам.
+        """
+        codes, uniques = pd.factorize(pd.Series(list(values), dtype=object).fillna(""), sort=False)
+        if len(codes) == 0:
+            return []
+        keys = pd.Index([self.normalize(u) for u in uniques], dtype=object)
+        return keys.take(codes).tolist()
+
+
+DEFAULT_NORMALIZER = InstrumentNormalizer()
+
+
+def load_normalizer(path: str = "") -> InstrumentNormalizer:
+    """Нормализатор по правилам из файла; без файла — встроенные правила."""
+    return InstrumentNormalizer.from_file(path) if path else DEFAULT_NORMALIZER
+
+
+def normalize_instrument(raw: str) -> str:
+    return DEFAULT_NORMALIZER.normalize(raw)
@@ -1,22 +1,40 @@
 import asyncio
 import argparse
 import configparser
-import csv
 import os
 import re
-from typing import Dict, List, Optional, Set, Tuple
+from datetime import date, datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
-from telethon.utils import get_peer_id
-from telethon import TelegramClient, functions, errors
+from telethon.utils import get_input_peer, get_peer_id
+from telethon import TelegramClient, events, functions, errors
 from telethon.tl import types
 from telethon.tl.types import MessageMediaPoll
 
-
-# =========================
-# ЛОГГЕР
-# =========================
-def log(msg: str) -> None:
-    print(msg, flush=True)
+from archive import RecordingClient, ReplayClient, ResponseArchive
+from attendance import AttendanceStore
+from common import RequestLimiter, as_text, log
+from entity_cache import EntityCache
+from fuzzy import FuzzyIndex
+from instruments import DEFAULT_NORMALIZER, InstrumentNormalizer, load_normalizer
+from metrics import RpcMetrics
+from poll_index import PollIndex, backfill_polls, search_polls
+from poll_options import DEFAULT_CLASSIFIER, OptionClassifier, load_classifier
+from report_store import DELIVERY_LOG, TG_MESSAGE_LIMIT, ReportStore, deliver_report, split_report
+from roster import load_roster
+from stats import (
+    INSTRUMENT_ORDER,
+    InstrumentTally,
+    RosterLike,
+    attendance_table,
+    counts_dict,
+    instrument_counts,
+    roster_series,
+    stands,
+    stands_table,
+    votes_frame,
+)
+from vote_cache import VoteCache
 
 
 # =========================
@@ -39,15 +57,49 @@ def load_config(path: str = "config.ini") -> dict:
             return default
         return cfg[section][key].strip()
 
+    musicians_csv = get("files", "musicians_csv", "Музыканты.csv")
+
+    # [chat:<имя>] — несколько оркестров в одном запуске (--chats / --all-chats)
+    chats = []
+    for section in cfg.sections():
+        if not section.startswith("chat:"):
+            continue
+        name = section.split(":", 1)[1].strip() or section
+        chats.append({
+            "NAME": name,
+            "CHAT_ID": get(section, "chat_id"),
+            "DEFAULT_TOPIC_ID": int(get(section, "default_topic_id", "0")),
+            "MUSICIANS_CSV": get(section, "musicians_csv", musicians_csv),
+        })
+
     return {
         "API_ID": int(get("telegram", "api_id")),
         "API_HASH": get("telegram", "api_hash"),
         "SESSION_NAME": get("telegram", "session_name", "orchestra_parser"),
         "CHAT_ID": int(get("telegram", "chat_id")),
         "DEFAULT_TOPIC_ID": int(get("telegram", "default_topic_id", "0")),
-        "MUSICIANS_CSV": get("files", "musicians_csv", "Музыканты.csv"),
+        "MUSICIANS_CSV": musicians_csv,
+        "CHATS": chats,
+        "INSTRUMENT_RULES": get("files", "instrument_rules", ""),
+        "OPTION_LEXICON": get("files", "option_lexicon", ""),
+        "ATTENDANCE": get("files", "attendance", "attendance.npz"),
+        "ARCHIVE": get("files", "archive", "archive.sqlite"),
         "SEARCH_LIMIT": int(get("search", "search_limit", "300")),
         "VOTES_PAGE_SIZE": int(get("search", "votes_page_size", "100")),
+        "VOTES_CONCURRENCY": int(get("search", "votes_concurrency", "4")),
+        "CACHE_DB": get("cache", "path", "cache.sqlite"),
+        "ROSTER_CACHE": get("cache", "roster_path", ""),
+        "ENTITY_TTL": float(get("cache", "entity_ttl", "86400")),
+        "WATCH_DEBOUNCE": float(get("watch", "debounce", "2")),
+        "WATCH_FALLBACK_INTERVAL": float(get("watch", "fallback_interval", "600")),
+        "METRICS": get("metrics", "path", "metrics.json"),
+        "SERVER_HOST": get("server", "host", "127.0.0.1"),
+        "SERVER_PORT": int(get("server", "port", "8080")),
+        "SERVER_TTL": float(get("server", "ttl", "60")),
+        # своя сессия: файл сессии Telethon (SQLite) нельзя открыть из двух процессов сразу
+        "SERVER_SESSION": get(
+            "server", "session_name", get("telegram", "session_name", "orchestra_parser") + "_server",
+        ),
     }
 
 
@@ -122,156 +174,148 @@ ICON = {
 }
 
 
-# =========================
-# ВСПОМОГАТЕЛЬНОЕ
-# =========================
-def as_text(x) -> str:
-    if x is None:
-        return ""
-    return x.text if hasattr(x, "text") else str(x)
-
-
-def normalize_instrument(raw: str) -> str:
-    s = (raw or "").strip().lower().replace("ё", "е")
-
-    if "скрип" in s:
-        if "1" in s:
-            return "первые скрипки"
-        if "2" in s:
-            return "вторые скрипки"
-        return "первые скрипки"  # если база хранит просто "скрипки" — выбери, что удобнее
-
-    # ======= Ветка Саксов =======
-
-    if "сакс" in s:
-        if "сопран" in s:
-            return "сопрано-саксофон"
-        if "альт-сакс" in s:
-            return "альт-саксофон"
-        if "тенор" in s:
-            return "тенор-саксофон"
-        if "барит" in s:
-            return "баритон-саксофон"
-        if "бас" in s:
-            return "бас-саксофон"
-        return "саксофон"
-
-    if "альт" in s:
-        return "альт"
-    if "виолонч" in s:
-        return "виолончель"
-    if "контрабас" in s:
-        return "контрабас"
-
-    if "флейт" in s:
-        return "флейта"
-    if "гобо" in s:
-        return "гобой"
-    if "кларнет" in s:
-        return "кларнет"
-    if "фагот" in s:
-        return "фагот"
-
-    if "валторн" in s:
-        return "валторна"
-    if "труба" in s:
-        return "труба"
-    if "тромбон" in s:
-        return "тромбон"
-    if "туба" in s:
-        return "туба"
-
-    if "удар" in s or "перкус" in s:
-        return "ударные"
-    if "фортеп" in s or "пианино" in s:
-        return "фортепиано"
-    if "арфа" in s:
-        return "арфа"
-    if "дириж" in s:
-        return "дирижёр"
-
-    return s or "неизвестно"
-
-
-def load_musicians_csv(path: str) -> Tuple[Dict[int, str], int]:
-    """
-    CSV: delimiter ';', columns: user_id, Инструмент
-    Возвращает: (user_id -> instrument, total_rows)
-    """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Файл не найден: {path}")
-
-    musicians: Dict[int, str] = {}
-    total_rows = 0
-
-    with open(path, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f, delimiter=";")
-        for row in reader:
-            total_rows += 1
-            uid = (row.get("user_id") or "").strip()
-            instr = (row.get("Инструмент") or "").strip()
-            if not uid or not instr:
-                continue
-            try:
-                musicians[int(uid)] = instr
-            except ValueError:
-                continue
-
-    return musicians, total_rows
-
-
 # =========================
 # TOPICS (совместимость Telethon)
 # =========================
-async def get_forum_topics(client: TelegramClient, chat_entity, query: Optional[str], limit: int = 100):
-    q = query if query else None
-
+def forum_topics_request(chat_entity, query: Optional[str], offset_date, offset_id: int, offset_topic: int, limit: int):
     if hasattr(functions.channels, "GetForumTopicsRequest"):
-        req = functions.channels.GetForumTopicsRequest(
+        return functions.channels.GetForumTopicsRequest(
             channel=chat_entity,
-            q=q,
-            offset_date=None,
-            offset_id=0,
-            offset_topic=0,
+            q=query,
+            offset_date=offset_date,
+            offset_id=offset_id,
+            offset_topic=offset_topic,
             limit=limit,
         )
-    elif hasattr(functions.messages, "GetForumTopicsRequest"):
-        req = functions.messages.GetForumTopicsRequest(
+    if hasattr(functions.messages, "GetForumTopicsRequest"):
+        return functions.messages.GetForumTopicsRequest(
             peer=chat_entity,
-            q=q,
-            offset_date=None,
-            offset_id=0,
-            offset_topic=0,
+            q=query,
+            offset_date=offset_date,
+            offset_id=offset_id,
+            offset_topic=offset_topic,
             limit=limit,
         )
-    else:
-        raise RuntimeError(
-            "В вашей версии Telethon нет getForumTopics.\n"
-            "Обновите: python -m pip install -U telethon"
-        )
+    raise RuntimeError(
+        "В вашей версии Telethon нет getForumTopics.\n"
+        "Обновите: python -m pip install -U telethon"
+    )
+
 
-    res = await client(req)
-    return getattr(res, "topics", []) or []
+async def iter_forum_topics(
+        client: TelegramClient,
+        chat_entity,
+        query: Optional[str] = None,
+        page_size: int = 100,
+        stop_at: int = 0,
+):
+    """
+    Все темы форума постранично (сервер отдаёт их по последней активности, закреплённые — первыми).
+    stop_at — водяной знак: обход заканчивается на первой незакреплённой теме,
+    где последнее сообщение не новее stop_at (дальше всё уже известно).
+    Удалённые темы (без названия) пропускаются.
+    """
+    offset_date, offset_id, offset_topic = None, 0, 0
+    seen: Set[int] = set()
+    while True:
+        res = await client(forum_topics_request(chat_entity, query or None, offset_date, offset_id, offset_topic,
+                                                page_size))
+        topics = getattr(res, "topics", []) or []
+        by_activity = not getattr(res, "order_by_create_date", False)
+        for t in topics:
+            if t.id in seen:
+                continue
+            seen.add(t.id)
+            if not getattr(t, "title", None):
+                continue
+            if stop_at and by_activity and not getattr(t, "pinned", False) and (t.top_message or 0) <= stop_at:
+                return
+            yield t
+
+        if len(topics) < page_size or len(seen) >= getattr(res, "count", 0):
+            return
+        last = topics[-1]
+        dates = {m.id: m.date for m in getattr(res, "messages", []) or [] if hasattr(m, "date")}
+        offset_topic = last.id
+        offset_id = getattr(last, "top_message", 0) or 0
+        offset_date = dates.get(offset_id)
+
+
+async def get_forum_topics(client: TelegramClient, chat_entity, query: Optional[str], limit: Optional[int] = 100):
+    """Темы форума (limit=None — все), по страницам iter_forum_topics."""
+    page_size = 100 if limit is None else max(1, min(limit, 100))
+    topics = []
+    async for t in iter_forum_topics(client, chat_entity, query, page_size=page_size):
+        topics.append(t)
+        if limit is not None and len(topics) >= limit:
+            break
+    return topics
+
+
+async def cached_forum_topics(client: TelegramClient, chat_entity, cache: EntityCache, refresh: bool = False):
+    """
+    Все темы чата из кэша, если он свежий. Иначе обход страниц: при первом запуске полный,
+    дальше — только темы с активностью после водяного знака (новые и переименованные).
+    """
+    chat_id = get_peer_id(chat_entity)
+    topics = None if refresh else cache.topics(chat_id)
+    if topics is None:
+        watermark = cache.topics_watermark(chat_id)
+        crawled = [t async for t in iter_forum_topics(client, chat_entity, stop_at=watermark)]
+        cache.put_topics(chat_id, crawled, replace=not watermark)
+        if watermark:
+            log(f"🗂️  Тем с новой активностью: {len(crawled)} (после сообщения id={watermark})")
+        topics = cache.topics(chat_id) or []
+    return topics
+
+
+def match_topics(topics, topic_title_query: str) -> List[Tuple[object, float]]:
+    """
+    [(тема, оценка)] по названию: сначала точные вхождения запроса (оценка 1.0),
+    а если их нет — похожие с опечатками, от лучших к худшим.
+    """
+    index = FuzzyIndex((t, t.title) for t in topics)
+    found = index.search(topic_title_query, limit=20)
+    exact = [(m.key, m.score) for m in found if m.score >= 1.0]
+    return exact or [(m.key, m.score) for m in found]
 
 
-async def choose_topic_id(client: TelegramClient, chat_entity, topic_title_query: str) -> int:
-    topics = await get_forum_topics(client, chat_entity, query=topic_title_query, limit=200)
-    if not topics:
+async def choose_topic_id(
+        client: TelegramClient,
+        chat_entity,
+        topic_title_query: str,
+        cache: Optional[EntityCache] = None,
+) -> int:
+    if cache is not None:
+        # поиск по названию локально; если в кэше не нашлось — тема могла появиться, дообходим один раз
+        matches = match_topics(await cached_forum_topics(client, chat_entity, cache), topic_title_query)
+        if not matches:
+            all_topics = await cached_forum_topics(client, chat_entity, cache, refresh=True)
+            matches = match_topics(all_topics, topic_title_query)
+    else:
+        topics = await get_forum_topics(client, chat_entity, query=topic_title_query, limit=None)
+        matches = [(t, 1.0) for t in topics]
+        if not matches:
+            # сервер ищет только точное вхождение — для опечаток нужны все темы
+            matches = match_topics(await get_forum_topics(client, chat_entity, query=None, limit=None),
+                                   topic_title_query)
+
+    if not matches:
         raise RuntimeError(f"Не нашёл темы по запросу: {topic_title_query}")
 
-    if len(topics) == 1:
-        t = topics[0]
-        log(f"✅ Тема найдена: ID={t.id} | {t.title}")
+    if len(matches) == 1:
+        t, score = matches[0]
+        log(f"✅ Тема найдена: ID={t.id} | {t.title}" + ("" if score >= 1.0 else f" (≈{score:.0%})"))
         return int(t.id)
 
     log("\n📌 Нашлось несколько тем. Выбери:")
-    for i, t in enumerate(topics, start=1):
-        log(f"{i:>2}. ID={t.id} | {t.title}")
+    for i, (t, score) in enumerate(matches, start=1):
+        log(f"{i:>2}. ID={t.id} | {t.title}" + ("" if score >= 1.0 else f" (≈{score:.0%})"))
 
     raw = input("\nНомер темы (Enter = 1): ").strip()
     idx = 1 if raw == "" else int(raw)
-    idx = max(1, min(idx, len(topics)))
-    chosen = topics[idx - 1]
+    idx = max(1, min(idx, len(matches)))
+    chosen = matches[idx - 1][0]
     log(f"✅ Выбрана тема: ID={chosen.id} | {chosen.title}")
     return int(chosen.id)
 
@@ -279,34 +323,94 @@ async def choose_topic_id(client: TelegramClient, chat_entity, topic_title_query
 # =========================
 # POLLS
 # =========================
-async def find_polls_in_topic(client, chat, topic_id: int, limit: int):
-    polls = []
-    kwargs = {}
-    if topic_id > 0:
-        kwargs["reply_to"] = topic_id
-
-    async for msg in client.iter_messages(chat, limit=limit, **kwargs):
-        if isinstance(getattr(msg, "media", None), MessageMediaPoll):
-            q = as_text(msg.media.poll.question)
-            polls.append((msg, q))
-    return polls
+async def find_polls_in_topic(client, chat, topic_id: int, limit: int, index: Optional[PollIndex] = None):
+    """
+    Опросы в теме (или во всём чате при topic_id=0), от новых к старым: [(message, question)].
+    С index: у сервера спрашиваются только сообщения новее водяного знака,
+    остальное берётся из локального индекса.
+    """
+    if index is None:
+        found, _ = await search_polls(client, chat, topic_id, limit)
+        return [(msg, as_text(msg.media.poll.question)) for msg in found]
+
+    chat_id = get_peer_id(chat)
+    watermark = index.watermark(chat_id, topic_id)
+    # после водяного знака дочитываем до него целиком: иначе опросы в промежутке
+    # за пределами limit не попадут ни в индекс, ни в backfill (он идёт вниз от старых)
+    found, scanned_max_id = await search_polls(
+        client, chat, topic_id, limit if watermark == 0 else None, min_id=watermark,
+    )
+    if found:
+        log(f"🗂️  Новых опросов: {len(found)} (после id={watermark})")
+    # водяной знак — последнее просмотренное сообщение, а не последний опрос: иначе
+    # сообщения после последнего опроса перечитывались бы при каждом запуске
+    index.add(chat_id, topic_id, found, scanned_max_id)
+    return index.polls(chat_id, topic_id)
+
+
+async def refresh_poll_messages(client, chat, poll_msgs: list) -> list:
+    """
+    Перечитывает сообщения с опросами одним запросом (актуальные poll.results).
+    Нужно для опросов из локального индекса: сохранённые счётчики голосов устаревают.
+    Удалённые опросы выкидываются.
+    """
+    if not poll_msgs:
+        return []
+    fresh = await client.get_messages(chat, ids=[m.id for m in poll_msgs])
+    return [m for m in fresh if m is not None and isinstance(getattr(m, "media", None), MessageMediaPoll)]
 
 
-def pick_poll(polls, poll_query: Optional[str]):
-    if not polls:
+async def collect_polls(client, chat_entity, topic_id: int, limit: int, index: Optional[PollIndex] = None):
+    """
+    Опросы в теме с фоллбеком на весь чат.
+    Возвращает (polls, topic_id) — topic_id может стать 0, если тема не подошла.
+    """
+    try:
+        polls = await find_polls_in_topic(client, chat_entity, topic_id, limit, index)
+    except errors.BadRequestError:
+        # PEER_ID_INVALID / TOPIC_ID_INVALID и т.п. — чат без тем
+        log("⚠️ Этот чат не поддерживает темы/reply_to. Ищу опрос по всему чату (без topic_id)...")
+        topic_id = 0
+        polls = await find_polls_in_topic(client, chat_entity, 0, limit, index)
+
+    # Авто-фоллбек: если тема не форумная/не та — пробуем искать опросы по всему чату
+    if not polls and topic_id > 0:
+        log("⚠️ В этой теме опросов нет. Пробую искать по всему чату (без topic_id)...")
+        polls = await find_polls_in_topic(client, chat_entity, 0, limit, index)
+
+    return polls, topic_id
+
+
+def pick_poll(
+        polls,
+        poll_query: Optional[str],
+        index: Optional[PollIndex] = None,
+        chat_id: int = 0,
+        topic_id: int = 0,
+):
+    """
+    Опрос по --poll. С index — ранжированный поиск по вопросам и вариантам ответа
+    всей истории чата (с опечатками); без него — подстрока в вопросах из polls.
+    """
+    if not polls and index is None:
         return None
 
     if poll_query:
-        pq = poll_query.casefold()
-        matches = [(m, q) for (m, q) in polls if pq in (q or "").casefold()]
+        if index is not None:
+            matches = index.search(chat_id, poll_query, topic_id)
+            if not matches and topic_id > 0:
+                matches = index.search(chat_id, poll_query)
+        else:
+            pq = poll_query.casefold()
+            matches = [(m, q, 1.0) for (m, q) in polls if pq in (q or "").casefold()]
         if len(matches) == 1:
             return matches[0][0]
 
         if len(matches) > 1:
             log("🗳️ Нашлось несколько опросов по запросу. Выбери нужный:")
-            for i, (m, q) in enumerate(matches, start=1):
+            for i, (m, q, score) in enumerate(matches, start=1):
                 d = m.date.strftime("%Y-%m-%d %H:%M") if m.date else "?"
-                log(f"{i:>2}. [{d}] id={m.id} | {q[:90]}")
+                log(f"{i:>2}. [{d}] id={m.id} | {q[:90]}" + ("" if score >= 1.0 else f" (≈{score:.0%})"))
             raw = input("\nНомер опроса (Enter = 1): ").strip()
             idx = 1 if raw == "" else int(raw)
             idx = max(1, min(idx, len(matches)))
@@ -314,87 +418,110 @@ def pick_poll(polls, poll_query: Optional[str]):
 
         log("⚠️ По --poll ничего не найдено, беру самый последний опрос в теме.")
 
-    return polls[0][0]
+    return polls[0][0] if polls else None
 
 
-def is_yes_option_text(txt: str) -> bool:
+async def fetch_option_voters(
+        client: TelegramClient,
+        chat_peer,
+        poll_msg,
+        option: bytes,
+        votes_page_size: int,
+        limiter: RequestLimiter,
+        expected: Optional[int] = None,
+) -> Set[int]:
     """
-    Позитивные варианты:
-      - репетиции: ✅, "приду" (но не "не приду")
-      - концерты: "смогу ..." (но не "не смогу")
+    Постранично выгружает голоса за один вариант опроса.
+    Каждая страница идёт через общий limiter (лимит параллельности + FloodWait).
+    expected — счётчик голосов из poll.results (предварительная оценка):
+      - 0 — вариант пустой, запросов нет
+      - размер страниц подбирается под него (поровну, не больше votes_page_size)
+      - выгрузка останавливается, как только собрано столько голосов, сколько
+        сервер насчитал на первой странице, — без лишнего пустого запроса в конце
     """
-    t = (txt or "").strip().casefold()
-    t = " ".join(t.split())
-
-    # явное "нет"
-    if "не смогу" in t or (t.startswith("не") and "смогу" in t):
-        return False
-    if "не приду" in t or (t.startswith("не") and "приду" in t):
-        return False
-
-    # явное "да"
-    if "✅" in t:
-        return True
-    if "приду" in t:
-        return True
-    if "смогу" in t:
-        return True
-    if "буду" in t or re.search(r"\bбуду\b", t):        return True
-
-    return False
-
+    voters: Set[int] = set()
+    if expected == 0:
+        return voters
+
+    limit = votes_page_size
+    if expected is not None:
+        pages = -(-expected // votes_page_size)
+        limit = -(-expected // pages)
+
+    offset = None
+    total = expected
+    while True:
+        res = await limiter.call(client, functions.messages.GetPollVotesRequest(
+            peer=chat_peer,
+            id=poll_msg.id,
+            option=option,  # bytes
+            offset=offset,
+            limit=limit
+        ))
+
+        for v in getattr(res, "votes", []) or []:
+            peer = getattr(v, "peer", None)
+            if isinstance(peer, types.PeerUser):
+                voters.add(int(peer.user_id))
+
+        for u in getattr(res, "users", []) or []:
+            if getattr(u, "id", None):
+                voters.add(int(u.id))
+
+        next_offset = getattr(res, "next_offset", None)
+        if not next_offset:
+            break
+        if total is not None:
+            # счётчик на момент первой страницы точнее предварительного (голоса могли прибавиться)
+            if offset is None:
+                total = max(total, int(getattr(res, "count", 0) or 0))
+            if len(voters) >= total:
+                break
+        offset = next_offset
 
-def extract_time_minutes(txt: str) -> Optional[int]:
-    """
-    Ищем время в варианте ответа: "в 13:00", "к 10", "в 9", "к 8:30".
-    """
-    t = (txt or "").strip().casefold()
-    t = " ".join(t.split())
-    m = re.search(r"(?:\bв\b|\bк\b)\s*(\d{1,2})(?::(\d{2}))?\b", t)
-    if not m:
-        return None
-    hh = int(m.group(1))
-    mm = int(m.group(2) or "0")
-    if not (0 <= hh <= 23 and 0 <= mm <= 59):
-        return None
-    return hh * 60 + mm
+    return voters
 
 
-def kw_rank(txt: str) -> int:
+def option_vote_counts(poll_msg) -> Dict[bytes, int]:
     """
-    Смысловой порядок вариантов без времени.
+    Счётчики голосов по вариантам из poll.results (option bytes -> voters).
+    Если Telegram не прислал результаты — пустой dict.
     """
-    t = (txt or "").strip().casefold()
-    t = " ".join(t.split())
+    results = getattr(getattr(poll_msg, "media", None), "results", None)
+    counts: Dict[bytes, int] = {}
+    for r in getattr(results, "results", None) or []:
+        counts[bytes(r.option)] = int(r.voters or 0)
+    return counts
 
-    if "саунд" in t or "чек" in t:
-        return 0
-    if "репет" in t:
-        return 1
-    if "концерт" in t:
-        return 2
-    return 3
 
-
-async def fetch_poll_voters_yes_union(
+async def fetch_poll_option_voters(
         client: TelegramClient,
         chat_peer,
         poll_msg,
         votes_page_size: int,
         smart_sort: bool,
-) -> Tuple[Set[int], List[str]]:
+        concurrency: int = 4,
+        limiter: Optional[RequestLimiter] = None,
+        cache: Optional[VoteCache] = None,
+        classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+        on_option: Optional[Callable[[str, Set[int]], Awaitable[None]]] = None,
+) -> List[Tuple[str, Set[int]]]:
     """
-    Собирает ВСЕ "позитивные" варианты и объединяет проголосовавших.
-    Возвращает (set(user_id), list(option_texts_sorted))
+    Собирает ВСЕ "позитивные" варианты и проголосовавших за каждый из них.
+    Варианты выгружаются параллельно (не больше `concurrency` запросов одновременно).
+    on_option(option_text, voters) вызывается для каждого варианта, как только он выгружен, —
+    отчёт можно собирать, не дожидаясь остальных.
+    С cache: варианты, у которых счётчик voters не изменился, берутся из кэша без запросов.
+    Возвращает [(option_text, set(user_id))] в порядке вариантов (с учётом smart_sort).
     """
     poll = poll_msg.media.poll
 
-    # 1) Найти все позитивные варианты
+    # 1) Найти все позитивные варианты (каждый текст разбирается один раз, результат общий для всех опросов)
     targets = []
     for ans in poll.answers:
-        txt = as_text(ans.text)
-        if is_yes_option_text(txt):
-            targets.append(ans)
+        info = classifier.classify(as_text(ans.text))
+        if info.yes:
+            targets.append((ans, info))
 
     if not targets:
         answers_debug = "\n".join([f"- {as_text(a.text)}" for a in poll.answers])
@@ -402,77 +529,105 @@ async def fetch_poll_voters_yes_union(
 
     # 2) Умная сортировка по флагу
     if smart_sort:
-        index_map = {id(a): i for i, a in enumerate(targets)}
-
-        def sort_key(a):
-            txt = as_text(a.text)
-            tmin = extract_time_minutes(txt)
-            if tmin is not None:
-                return (0, tmin, kw_rank(txt), index_map[id(a)])
-            return (1, kw_rank(txt), 10_000, index_map[id(a)])
-
-        targets = sorted(targets, key=sort_key)
+        order = sorted(range(len(targets)), key=lambda i: targets[i][1].sort_key(i))
+        targets = [targets[i] for i in order]
+    targets = [ans for ans, _ in targets]
 
     # 3) Опрос должен быть неанонимный
     if not getattr(poll, "public_voters", False):
         raise RuntimeError("Опрос анонимный — Telegram не отдаёт список проголосовавших.")
 
-    # 4) Выгрузить голоса по каждой позитивной опции и объединить
-    voter_ids: Set[int] = set()
-    option_texts: List[str] = []
+    # 4) Выгрузить голоса по всем позитивным опциям параллельно и объединить
+    if limiter is None:
+        limiter = RequestLimiter(concurrency)
 
-    for target in targets:
+    # предварительные счётчики по вариантам: пустые варианты не запрашиваются,
+    # страницы подбираются под ожидаемое число голосов
+    counts = option_vote_counts(poll_msg)
+    if isinstance(client, RecordingClient):
+        # --record: в архив — именно эта копия опроса, иначе --replay решит по чужим счётчикам
+        client.record_poll(chat_peer, poll_msg)
+    chat_id = get_peer_id(chat_peer) if cache is not None else 0
+
+    async def fetch_option(target) -> Set[int]:
         option_text = as_text(target.text)
-        option_texts.append(option_text)
+        expected = counts.get(bytes(target.option))
+
+        if cache is not None and expected is not None:
+            cached = cache.get(chat_id, poll_msg.id, target.option)
+            if cached is not None and cached[0] == expected:
+                log(f"♻️  Голоса из кэша: {option_text} ({expected})")
+                return cached[1]
+
+        if expected == 0:
+            return set()
+
         log(f"⬇️  Загружаю голоса за: {option_text}")
+        voters = await fetch_option_voters(
+            client, chat_peer, poll_msg, target.option, votes_page_size, limiter, expected,
+        )
 
-        offset = None
-        while True:
-            res = await client(functions.messages.GetPollVotesRequest(
-                peer=chat_peer,
-                id=poll_msg.id,
-                option=target.option,  # bytes
-                offset=offset,
-                limit=votes_page_size
-            ))
-
-            for v in getattr(res, "votes", []) or []:
-                peer = getattr(v, "peer", None)
-                if isinstance(peer, types.PeerUser):
-                    voter_ids.add(int(peer.user_id))
-
-            for u in getattr(res, "users", []) or []:
-                if getattr(u, "id", None):
-                    voter_ids.add(int(u.id))
-
-            next_offset = getattr(res, "next_offset", None)
-            if not next_offset:
-                break
-            offset = next_offset
+        if cache is not None and expected is not None:
+            cache.put(chat_id, poll_msg.id, target.option, expected, voters)
+        return voters
 
-    return voter_ids, option_texts
+    async def load_option(target) -> Set[int]:
+        voters = await fetch_option(target)
+        if on_option is not None:
+            await on_option(as_text(target.text), voters)
+        return voters
 
+    per_option = await asyncio.gather(*[load_option(t) for t in targets])
+    return [(as_text(t.text), voters) for t, voters in zip(targets, per_option)]
 
-def build_report(poll_question: str, option_texts: List[str], voter_ids: Set[int], musicians: Dict[int, str]) -> str:
-    counts: Dict[str, int] = {}
-    found = 0
 
-    for uid in voter_ids:
-        if uid not in musicians:
-            continue
-        found += 1
-        key = normalize_instrument(musicians[uid])
-        counts[key] = counts.get(key, 0) + 1
-
-    order = [
-        "первые скрипки", "вторые скрипки",
-        "альт", "виолончель", "контрабас",
-        "флейта", "гобой", "кларнет", "фагот", "сопрано-саксофон", "альт-саксофон", "тенор-саксофон",
-        "баритон-саксофон", "бас-саксофон",
-        "валторна", "труба", "тромбон", "туба",
-        "ударные", "фортепиано", "арфа", "дирижёр",
-        "неизвестно",
-    ]
+def union_voters(per_option: List[Tuple[str, Set[int]]]) -> Set[int]:
+    voter_ids: Set[int] = set()
+    for _, voters in per_option:
+        voter_ids |= voters
+    return voter_ids
+
+
+async def fetch_poll_voters_yes_union(
+        client: TelegramClient,
+        chat_peer,
+        poll_msg,
+        votes_page_size: int,
+        smart_sort: bool,
+        concurrency: int = 4,
+        limiter: Optional[RequestLimiter] = None,
+        cache: Optional[VoteCache] = None,
+        classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+) -> Tuple[Set[int], List[str]]:
+    """
+    Собирает ВСЕ "позитивные" варианты и объединяет проголосовавших.
+    Возвращает (set(user_id), list(option_texts_sorted))
+    """
+    per_option = await fetch_poll_option_voters(
+        client, chat_peer, poll_msg, votes_page_size, smart_sort, concurrency, limiter, cache, classifier,
+    )
+    return union_voters(per_option), [text for text, _ in per_option]
+
+
+def build_report(
+        poll_question: str,
+        option_texts: List[str],
+        voter_ids: Set[int],
+        roster: RosterLike,
+        per_option: Optional[List[Tuple[str, Set[int]]]] = None,
+        tally: Optional[InstrumentTally] = None,
+) -> str:
+    """
+    roster: user_id -> канонический ключ инструмента (см. roster.load_roster).
+    per_option: если передан — в конце добавляется разбивка по вариантам.
+    tally: счёт по инструментам, уже собранный по мере прихода голосов (иначе считается здесь).
+    """
+    roster = roster_series(roster)
+    if tally is not None:
+        counts_s, found = tally.counts(), tally.found
+    else:
+        counts_s, found = instrument_counts(voter_ids, roster)
+    counts = counts_dict(counts_s)
 
     lines: List[str] = []
     lines.append("🎵 СТАТИСТИКА")
@@ -482,7 +637,7 @@ def build_report(poll_question: str, option_texts: List[str], voter_ids: Set[int
     lines.append("")
 
     total = 0
-    for k in order:
+    for k in INSTRUMENT_ORDER:
         if k in counts:
             c = counts[k]
             total += c
@@ -492,15 +647,7 @@ def build_report(poll_question: str, option_texts: List[str], voter_ids: Set[int
 
     lines.append("")
 
-    paired = {"первые скрипки", "вторые скрипки", "альт", "виолончель"}
-
-    pupitre = 0
-    strings_pupitre = 0
-    for instr, n in counts.items():
-        if instr in paired:
-            strings_pupitre += (n + 1) // 2
-        else:
-            pupitre += n
+    strings_pupitre, pupitre = stands(counts_s)
 
     lines.append(f"📊 Всего: {total} человек")
     lines.append(f"🎼 Нужно Пультов: {pupitre + strings_pupitre}")
@@ -510,10 +657,662 @@ def build_report(poll_question: str, option_texts: List[str], voter_ids: Set[int
     if not_found > 0:
         lines.append(f"⚠️ Не найдено в базе: {not_found}")
 
+    if per_option:
+        table = attendance_table(votes_frame({poll_question: per_option}), roster, by=["option"])
+        option_stands = stands_table(table)
+        lines.append("")
+        lines.append("🗂️ По вариантам:")
+        for option, _ in per_option:
+            people = int(table[option].sum()) if option in table.columns else 0
+            need = int(option_stands.at["total", option]) if option in option_stands.columns else 0
+            lines.append(f"• {option}: {people} {plural_ru(people, 'человек', 'человека', 'человек')}, пультов {need}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+# =========================
+# ПОСЕЩАЕМОСТЬ ЗА СЕЗОН
+# =========================
+def record_attendance(
+        store: Optional[AttendanceStore],
+        chat_peer,
+        poll_msg,
+        options: List[Tuple[str, Set[int]]],
+        roster: RosterLike,
+) -> None:
+    """Дописывает опрос в историю посещаемости (кто идёт = объединение позитивных вариантов)."""
+    if store is None:
+        return
+    store.record(
+        chat_id=get_peer_id(chat_peer),
+        msg_id=poll_msg.id,
+        date=poll_msg.date.timestamp() if poll_msg.date else 0.0,
+        question=as_text(poll_msg.media.poll.question),
+        voter_ids=union_voters(options),
+        roster_ids=roster_series(roster).index,
+    )
+    store.save()
+
+
+def build_attendance_report(store: AttendanceStore, roster: RosterLike, last_n: int, chat_ids=None) -> str:
+    """Посещаемость по инструментам за последние N опросов + кто не был ни разу."""
+    cols = store.last_polls(last_n, chat_ids)
+    if len(cols) == 0:
+        return "❌ В истории посещаемости пока нет опросов."
+
+    rates = store.rate_by_instrument(roster, cols)
+    fill = store.fill_by_poll(roster, cols)
+
+    lines = [f"📅 ПОСЕЩАЕМОСТЬ: последние {len(cols)} {plural_ru(len(cols), 'опрос', 'опроса', 'опросов')}", ""]
+    for c in cols:
+        d = datetime.fromtimestamp(store.dates[c]).strftime("%d.%m") if store.dates[c] else "?"
+        lines.append(f"• {d} {str(store.questions[c])[:40]}")
+    lines.append("")
+
+    for k, row in rates.iterrows():
+        per_poll = " / ".join(str(int(v)) for v in fill.loc[k].to_numpy()) if k in fill.index else ""
+        lines.append(
+            f"{ICON.get(k, '🎵')} {k}: {row['rate'] * 100:.0f}% "
+            f"(в составе {int(row['members'])}; по опросам: {per_poll})"
+        )
+
+    missing = store.absentees(roster, cols)
+    lines.append("")
+    lines.append(f"💤 Ни разу не были: {len(missing)}")
+    r = roster_series(roster)
+    for uid in missing[:50]:
+        lines.append(f"  • {uid} — {r.get(uid, 'неизвестно')}")
+    if len(missing) > 50:
+        lines.append(f"  … и ещё {len(missing) - 50}")
+    return "\n".join(lines)
+
+
+# =========================
+# BATCH: НЕСКОЛЬКО ОПРОСОВ ЗА ОДИН ЗАПУСК
+# =========================
+VOTE_REQUIRED_MSG = (
+    "Telegram требует, чтобы этот аккаунт проголосовал в опросе, прежде чем смотреть голоса.\n"
+    "Проголосуй (любой вариант) и запусти скрипт снова."
+)
+
+
+def select_batch_polls(
+        polls,
+        queries: List[str],
+        since: Optional[date],
+        until: Optional[date],
+) -> list:
+    """
+    Отбирает опросы для batch-режима:
+      - since/until — только опросы с датой в этом диапазоне (включительно)
+      - queries — по одному опросу на каждую подстроку (в порядке запросов)
+      - без queries — все опросы из диапазона, от старых к новым
+    """
+    pool = []
+    for m, q in polls:
+        d = m.date.date() if m.date else None
+        if since and (d is None or d < since):
+            continue
+        if until and (d is None or d > until):
+            continue
+        pool.append((m, q))
+
+    if not queries:
+        return [m for m, _ in reversed(pool)]
+
+    chosen = []
+    seen: Set[int] = set()
+    for query in queries:
+        pq = query.casefold()
+        matches = [(m, q) for (m, q) in pool if pq in (q or "").casefold()]
+        if not matches:
+            log(f"⚠️ По запросу «{query}» опросов не найдено — пропускаю.")
+            continue
+        m = pick_poll(matches, query)
+        if m is not None and m.id not in seen:
+            seen.add(m.id)
+            chosen.append(m)
+    return chosen
+
+
+def join_reports(reports: List[str], limit: int = TG_MESSAGE_LIMIT) -> List[str]:
+    """
+    Склеивает отчёты в как можно меньшее число сообщений, не превышая лимит Telegram.
+    Отчёт длиннее лимита уходит несколькими сообщениями (split_report), ничего не обрезается.
+    """
+    messages: List[str] = []
+    current = ""
+    for report in reports:
+        report = report.strip()
+        candidate = f"{current}\n\n{report}" if current else report
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            messages.append(current)
+        *head, current = split_report(report, limit) or [""]
+        messages.extend(head)
+    if current:
+        messages.append(current)
+    return messages
+
+
+def start_roster_load(
+        musicians_csv: str,
+        roster_cache: Optional[str] = None,
+        normalizer: InstrumentNormalizer = DEFAULT_NORMALIZER,
+) -> "asyncio.Task[Tuple[Dict[int, str], int]]":
+    """
+    Состав читается в рабочем потоке, пока идут сетевые этапы (подключение, поиск опроса, голоса).
+    await task -> (roster, total_rows), как у load_roster; ошибку чтения получит тот, кто дождётся задачи.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(load_roster, musicians_csv, roster_cache, normalizer))
+    # запуск может закончиться раньше, чем понадобится состав (нет опросов, --list-topics) — тогда не шумим
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+async def make_poll_report(
+        client: TelegramClient,
+        chat_peer,
+        poll_msg,
+        musicians: Dict[int, str],
+        votes_page_size: int,
+        smart_sort: bool,
+        limiter: RequestLimiter,
+        vote_cache: Optional[VoteCache] = None,
+        per_option: bool = False,
+        classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+) -> Tuple[str, Optional[List[Tuple[str, Set[int]]]]]:
+    """
+    Отчёт по одному опросу; ошибки выгрузки превращаются в текст отчёта.
+    Возвращает (текст, [(option_text, voter_ids)] или None при ошибке).
+    """
+    poll_question = as_text(poll_msg.media.poll.question)
+    tally = InstrumentTally(musicians)
+
+    async def count_option(_, voters: Set[int]) -> None:
+        tally.add(voters)
+
+    try:
+        options = await fetch_poll_option_voters(
+            client=client,
+            chat_peer=chat_peer,
+            poll_msg=poll_msg,
+            votes_page_size=votes_page_size,
+            smart_sort=smart_sort,
+            limiter=limiter,
+            cache=vote_cache,
+            classifier=classifier,
+            on_option=count_option,
+        )
+    except errors.PollVoteRequiredError:
+        return f"❌ Опрос: {poll_question}\n{VOTE_REQUIRED_MSG}", None
+    except RuntimeError as e:
+        return f"❌ Опрос: {poll_question}\n{e}", None
+
+    voter_ids = union_voters(options)
+    log(f"📊 {poll_question[:60]}: идут {len(voter_ids)} человек")
+    report = build_report(
+        poll_question, [text for text, _ in options], voter_ids, musicians,
+        per_option=options if per_option else None, tally=tally,
+    )
+    return report, options
+
+
+def build_comparison(poll_msgs: list, options: List[List[Tuple[str, Set[int]]]], roster: RosterLike) -> str:
+    """Сравнение нескольких опросов: люди по инструментам и пульты в каждом опросе."""
+    labels = []
+    data = {}
+    for m, opts in zip(poll_msgs, options):
+        label = f"{m.date.strftime('%d.%m') if m.date else '?'} {as_text(m.media.poll.question)[:30]}"
+        labels.append(label)
+        data[label] = opts
+
+    table = attendance_table(votes_frame(data), roster, by=["poll"]).reindex(columns=labels, fill_value=0)
+    need = stands_table(table)
+
+    lines = ["📈 СРАВНЕНИЕ ОПРОСОВ", ""]
+    for i, label in enumerate(labels, start=1):
+        lines.append(f"{i}. {label}")
     lines.append("")
+    for k in table.index:
+        values = " / ".join(str(int(v)) for v in table.loc[k].to_numpy())
+        lines.append(f"{ICON.get(k, '🎵')} {k}: {values}")
+    lines.append("")
+    lines.append("📊 Всего: " + " / ".join(str(int(v)) for v in table.sum(axis=0).to_numpy()))
+    lines.append("🎼 Пультов: " + " / ".join(str(int(v)) for v in need.loc["total"].to_numpy()))
     return "\n".join(lines)
 
 
+async def run_batch(
+        client: TelegramClient,
+        chat_entity,
+        chat_peer,
+        polls,
+        args,
+        musicians_csv: str,
+        votes_page_size: int,
+        limiter: RequestLimiter,
+        vote_cache: Optional[VoteCache] = None,
+        refresh: bool = False,
+        roster_cache: Optional[str] = None,
+        normalizer: InstrumentNormalizer = DEFAULT_NORMALIZER,
+        watcher_options: Optional[dict] = None,
+        attendance: Optional[AttendanceStore] = None,
+        report_store: Optional[ReportStore] = None,
+        classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+        roster: Optional[asyncio.Future] = None,
+) -> None:
+    """
+    Отчёты по нескольким опросам за одно подключение:
+    состав музыкантов читается один раз, голоса всех опросов выгружаются параллельно
+    (через общий limiter), отчёты отправляются вместе.
+    С watcher_options — вместо разовой отправки запускается PollWatcher.
+    roster — уже начатое чтение состава (start_roster_load); без него чтение начинается здесь.
+    """
+    if roster is None:
+        roster = start_roster_load(musicians_csv, roster_cache, normalizer)
+    if args.polls or args.since or args.until or args.all_polls:
+        selected = select_batch_polls(polls, args.polls, args.since, args.until)
+    else:
+        # --watch без batch-флагов: один опрос, как в обычном режиме
+        poll_msg = pick_poll(polls, args.poll.strip() if args.poll else None)
+        selected = [poll_msg] if poll_msg else []
+    if not selected:
+        msg = "❌ Batch: не найдено ни одного подходящего опроса."
+        log(msg)
+        await client.send_message("me", msg)
+        return
+
+    if refresh:
+        selected = await refresh_poll_messages(client, chat_entity, selected)
+
+    log(f"🗳️ Batch: опросов — {len(selected)}")
+    for m in selected:
+        d = m.date.strftime("%Y-%m-%d %H:%M") if m.date else "?"
+        log(f"  • [{d}] id={m.id} | {as_text(m.media.poll.question)[:90]}")
+
+    musicians, total_rows = await roster
+    log(f"📁 Загружено {total_rows} записей, с инструментами: {len(musicians)}")
+    musicians = roster_series(musicians)
+
+    if watcher_options is not None:
+        watcher = PollWatcher(
+            client, chat_entity, chat_peer, musicians, votes_page_size, args.smart_sort,
+            limiter, vote_cache, attendance=attendance, report_store=report_store,
+            resend=args.resend, classifier=classifier, **watcher_options,
+        )
+        await watcher.start(selected)
+        await watcher.run()
+        return
+
+    results = await asyncio.gather(*[
+        make_poll_report(
+            client, chat_peer, m, musicians, votes_page_size, args.smart_sort, limiter, vote_cache, args.per_option,
+            classifier,
+        )
+        for m in selected
+    ])
+    reports = [report for report, _ in results]
+
+    fetched = [(m, opts) for m, (_, opts) in zip(selected, results) if opts is not None]
+    for m, opts in fetched:
+        record_attendance(attendance, chat_peer, m, opts, musicians)
+    if len(fetched) > 1:
+        reports.append(build_comparison([m for m, _ in fetched], [opts for _, opts in fetched], musicians))
+
+    if report_store is None:
+        for text in join_reports(reports):
+            await client.send_message("me", text)
+        log(f"✅ Отправлено отчётов: {len(reports)}")
+    else:
+        # по сообщению на опрос (и одно на сравнение): неизменившиеся не трогаем, остальные правим
+        chat_id = get_peer_id(chat_peer)
+        keys = [str(m.id) for m in selected]
+        if len(reports) > len(selected):
+            keys.append("compare:" + ",".join(str(m.id) for m, _ in fetched))
+        outcomes = [
+            await deliver_report(client, report_store, chat_id, key, text, resend=args.resend)
+            for key, text in zip(keys, reports)
+        ]
+        log(
+            f"✅ Отчётов: {len(reports)} — новых {outcomes.count('sent')}, "
+            f"обновлено {outcomes.count('edited')}, без изменений {outcomes.count('unchanged')}"
+        )
+    for report in reports:
+        log(report)
+
+
+# =========================
+# WATCH: ЖИВОЕ ОБНОВЛЕНИЕ ОТЧЁТОВ
+# =========================
+class PollWatcher:
+    """
+    Демон для --watch: держит подключение, слушает UpdateMessagePoll и правки
+    сообщений с отслеживаемыми опросами и редактирует уже отправленные отчёты
+    в Избранном. Перевыгружаются только варианты с изменившимся счётчиком
+    (через VoteCache; без кэша на диске — через кэш в памяти).
+    """
+
+    def __init__(
+            self,
+            client: TelegramClient,
+            chat_entity,
+            chat_peer,
+            musicians: Dict[int, str],
+            votes_page_size: int,
+            smart_sort: bool,
+            limiter: RequestLimiter,
+            vote_cache: Optional[VoteCache] = None,
+            debounce: float = 2.0,
+            fallback_interval: float = 0.0,
+            attendance: Optional[AttendanceStore] = None,
+            metrics: Optional[RpcMetrics] = None,
+            report_store: Optional[ReportStore] = None,
+            resend: bool = False,
+            classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+    ):
+        self.client = client
+        self.chat_entity = chat_entity
+        self.chat_peer = chat_peer
+        self.musicians = musicians
+        self.votes_page_size = votes_page_size
+        self.smart_sort = smart_sort
+        self.limiter = limiter
+        self.vote_cache = vote_cache if vote_cache is not None else VoteCache(":memory:")
+        self.debounce = debounce
+        self.fallback_interval = fallback_interval
+        self.attendance = attendance
+        self.metrics = metrics
+        # без общего кэша отчёты всё равно правим на месте — храним их id в памяти на время наблюдения
+        self.report_store = report_store if report_store is not None else ReportStore(":memory:")
+        self.resend = resend
+        self.classifier = classifier
+
+        self.polls: Dict[int, object] = {}  # msg_id -> poll message
+        self.by_poll_id: Dict[int, int] = {}  # poll.id -> msg_id
+        self.last_reports: Dict[int, str] = {}
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._dirty: Set[int] = set()  # msg_id, у которых голоса изменились во время пересборки
+
+    def track(self, poll_msg) -> None:
+        self.polls[poll_msg.id] = poll_msg
+        self.by_poll_id[int(poll_msg.media.poll.id)] = poll_msg.id
+
+    async def _report(self, msg_id: int) -> str:
+        report, options = await make_poll_report(
+            self.client, self.chat_peer, self.polls[msg_id], self.musicians,
+            self.votes_page_size, self.smart_sort, self.limiter, self.vote_cache, classifier=self.classifier,
+        )
+        if options is not None:
+            record_attendance(self.attendance, self.chat_peer, self.polls[msg_id], options, self.musicians)
+        return report
+
+    async def start(self, poll_msgs: list) -> None:
+        for m in poll_msgs:
+            self.track(m)
+
+        reports = await asyncio.gather(*[self._report(m.id) for m in poll_msgs])
+        chat_id = get_peer_id(self.chat_peer)
+        for m, report in zip(poll_msgs, reports):
+            # отчёт с прошлого запуска продолжаем править, а не шлём ещё один
+            await deliver_report(self.client, self.report_store, chat_id, str(m.id), report, self.resend)
+            self.last_reports[m.id] = report
+            log(report)
+
+        self.client.add_event_handler(self._on_raw, events.Raw(types.UpdateMessagePoll))
+        self.client.add_event_handler(self._on_edit, events.MessageEdited(chats=self.chat_entity))
+
+    def apply_results(self, poll_id: int, results) -> None:
+        msg_id = self.by_poll_id.get(int(poll_id))
+        if msg_id is None or results is None:
+            return
+        poll_msg = self.polls[msg_id]
+        old = option_vote_counts(poll_msg)
+        poll_msg.media.results = results
+        if option_vote_counts(poll_msg) != old:
+            self._schedule(msg_id)
+
+    async def _on_raw(self, update) -> None:
+        self.apply_results(update.poll_id, update.results)
+
+    async def _on_edit(self, event) -> None:
+        msg = event.message
+        if msg.id not in self.polls or not isinstance(getattr(msg, "media", None), MessageMediaPoll):
+            return
+        self.track(msg)
+        self._schedule(msg.id)
+
+    def _schedule(self, msg_id: int) -> None:
+        # пачку голосов подряд сводим в одно обновление отчёта; голоса, пришедшие,
+        # пока отчёт уже пересобирается, помечают опрос — задача пересоберёт его ещё раз
+        task = self._pending.get(msg_id)
+        if task is not None and not task.done():
+            self._dirty.add(msg_id)
+            return
+        self._pending[msg_id] = asyncio.create_task(self._refresh(msg_id))
+
+    async def _refresh(self, msg_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.debounce)
+            self._dirty.discard(msg_id)
+            await self._update_report(msg_id)
+            if msg_id not in self._dirty:
+                return
+
+    async def _update_report(self, msg_id: int) -> None:
+        try:
+            report = await self._report(msg_id)
+            if report == self.last_reports.get(msg_id):
+                return
+            await deliver_report(self.client, self.report_store, get_peer_id(self.chat_peer), str(msg_id), report)
+            self.last_reports[msg_id] = report
+            log(f"🔄 Отчёт обновлён: {as_text(self.polls[msg_id].media.poll.question)[:60]}")
+        except errors.RPCError as e:
+            log(f"⚠️ Не удалось обновить отчёт: {e}")
+        finally:
+            if self.metrics is not None:
+                self.metrics.flush(quiet=True)
+
+    async def _fallback_loop(self) -> None:
+        # страховка на случай пропущенных апдейтов: редкий getPollResults
+        while True:
+            await asyncio.sleep(self.fallback_interval)
+            for msg_id in list(self.polls):
+                try:
+                    res = await self.limiter.call(self.client, functions.messages.GetPollResultsRequest(
+                        peer=self.chat_peer, msg_id=msg_id,
+                    ))
+                except errors.RPCError as e:
+                    log(f"⚠️ getPollResults для id={msg_id}: {e}")
+                    continue
+                for upd in getattr(res, "updates", []) or []:
+                    if isinstance(upd, types.UpdateMessagePoll):
+                        self.apply_results(upd.poll_id, upd.results)
+            if self.metrics is not None:
+                self.metrics.flush()
+
+    async def run(self) -> None:
+        log(f"👁️ Watch: слежу за опросами ({len(self.polls)}). Ctrl+C — выход.")
+        fallback = asyncio.create_task(self._fallback_loop()) if self.fallback_interval > 0 else None
+        try:
+            await self.client.run_until_disconnected()
+        finally:
+            if fallback is not None:
+                fallback.cancel()
+            for task in self._pending.values():
+                task.cancel()
+
+
+# =========================
+# НЕСКОЛЬКО ЧАТОВ ЗА ОДИН ЗАПУСК
+# =========================
+async def report_chat(
+        client: TelegramClient,
+        chat: dict,
+        args,
+        limiter: RequestLimiter,
+        votes_page_size: int,
+        search_limit: int,
+        normalizer: InstrumentNormalizer = DEFAULT_NORMALIZER,
+        roster_cache: Optional[str] = None,
+        vote_cache: Optional[VoteCache] = None,
+        poll_index: Optional[PollIndex] = None,
+        entity_cache: Optional[EntityCache] = None,
+        attendance: Optional[AttendanceStore] = None,
+        watcher_options: Optional[dict] = None,
+        archive: Optional[ResponseArchive] = None,
+        report_store: Optional[ReportStore] = None,
+        classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+        roster: Optional[asyncio.Future] = None,
+) -> None:
+    """
+    Обычный (или batch / --watch) отчёт для одного чата из секции [chat:<имя>].
+    Клиент, limiter и кэши общие для всех чатов запуска.
+    Состав читается в рабочем потоке параллельно с сетевыми этапами (roster — уже начатое чтение).
+    """
+    name = chat["NAME"]
+    if roster is None:
+        roster = start_roster_load(chat["MUSICIANS_CSV"], roster_cache, normalizer)
+    chat_entity = await resolve_chat_entity(client, chat["CHAT_ID"], cache=entity_cache)
+    chat_peer = await client.get_input_entity(chat_entity)
+    if archive is not None:
+        archive.put_chat(chat_entity)
+
+    topic_id = chat["DEFAULT_TOPIC_ID"] if isinstance(chat_entity, types.Channel) else 0
+    log(f"🔍 [{name}] Ищу опрос в теме ID {topic_id}...")
+    polls, topic_id = await collect_polls(client, chat_entity, topic_id, search_limit, poll_index)
+    if archive is not None:
+        archive.add_polls(get_peer_id(chat_entity), topic_id, [m for m, _ in polls])
+    if not polls:
+        msg = f"❌ [{name}] Не найдено опросов (topic_id={topic_id}, fallback=0 тоже пусто)."
+        log(msg)
+        await client.send_message("me", msg)
+        return
+
+    if args.polls or args.since or args.until or args.all_polls or watcher_options is not None:
+        await run_batch(
+            client, chat_entity, chat_peer, polls, args,
+            musicians_csv=chat["MUSICIANS_CSV"],
+            roster_cache=roster_cache,
+            normalizer=normalizer,
+            votes_page_size=votes_page_size,
+            limiter=limiter,
+            vote_cache=vote_cache,
+            refresh=poll_index is not None,
+            watcher_options=watcher_options,
+            attendance=attendance,
+            report_store=report_store,
+            classifier=classifier,
+            roster=roster,
+        )
+        return
+
+    poll_msg = pick_poll(polls, args.poll.strip() if args.poll else None,
+                         poll_index, get_peer_id(chat_entity), topic_id)
+    if poll_msg and poll_index is not None:
+        refreshed = await refresh_poll_messages(client, chat_entity, [poll_msg])
+        poll_msg = refreshed[0] if refreshed else None
+    if not poll_msg:
+        msg = f"❌ [{name}] Не удалось выбрать опрос."
+        log(msg)
+        await client.send_message("me", msg)
+        return
+
+    musicians, total_rows = await roster
+    log(f"📁 [{name}] Загружено {total_rows} записей, с инструментами: {len(musicians)}")
+    musicians = roster_series(musicians)
+
+    report, options = await make_poll_report(
+        client, chat_peer, poll_msg, musicians, votes_page_size, args.smart_sort, limiter, vote_cache,
+        args.per_option, classifier,
+    )
+    if options is not None:
+        record_attendance(attendance, chat_peer, poll_msg, options, musicians)
+
+    report = f"🎻 {name}\n\n{report}"
+    outcome = await deliver_report(client, report_store, get_peer_id(chat_peer), str(poll_msg.id), report, args.resend)
+    log(f"{DELIVERY_LOG[outcome]} [{name}]")
+    log(report)
+
+
+def select_chats(chats: List[dict], names: List[str], all_chats: bool) -> List[dict]:
+    if all_chats:
+        return list(chats)
+    by_name = {c["NAME"].casefold(): c for c in chats}
+    selected = []
+    for n in names:
+        c = by_name.get(n.casefold())
+        if c is None:
+            log(f"⚠️ В config.ini нет секции [chat:{n}] — пропускаю.")
+            continue
+        selected.append(c)
+    return selected
+
+
+# =========================
+# REPLAY: ОТЧЁТЫ ИЗ АРХИВА БЕЗ СЕТИ
+# =========================
+async def replay_reports(
+        archive: ResponseArchive,
+        chat_ref,
+        args,
+        musicians_csv: str,
+        votes_page_size: int,
+        roster_cache: Optional[str] = None,
+        normalizer: InstrumentNormalizer = DEFAULT_NORMALIZER,
+        classifier: OptionClassifier = DEFAULT_CLASSIFIER,
+) -> None:
+    """
+    --replay: тот же пайплайн, что и обычный запуск (pick_poll / batch → голоса → build_report),
+    но опросы и страницы голосов берутся из архива, записанного с --record.
+    Отчёты только печатаются; кэш голосов и история посещаемости не трогаются.
+    """
+    ref = parse_chat_ref(chat_ref)
+    chat_entity = archive.chat(ref) if isinstance(ref, int) else None
+    if chat_entity is None:
+        log(f"❌ В архиве {archive.path} нет чата {chat_ref} (нужен id чата). Сначала запусти с --record.")
+        return
+    chat_peer = get_input_peer(chat_entity)
+
+    polls = archive.polls(get_peer_id(chat_entity), args.topic_id)
+    log(f"📦 Архив: {len(polls)} {plural_ru(len(polls), 'опрос', 'опроса', 'опросов')}")
+    if not polls:
+        return
+    snapshots = archive.snapshot_ids(get_peer_id(chat_entity))
+    for m, _ in polls:
+        if m.id not in snapshots:
+            # счётчики этой копии — не те, по которым выгружались голоса: без них каждый вариант
+            # берётся со страниц архива, и пропавшие страницы дают ошибку, а не пустой вариант
+            m.media.results = None
+
+    client = ReplayClient(archive)
+    limiter = RequestLimiter(16)  # сети нет — ограничивать нечего
+
+    if args.polls or args.since or args.until or args.all_polls:
+        await run_batch(
+            client, chat_entity, chat_peer, polls, args,
+            musicians_csv=musicians_csv,
+            roster_cache=roster_cache,
+            normalizer=normalizer,
+            votes_page_size=votes_page_size,
+            limiter=limiter,
+            classifier=classifier,
+        )
+        return
+
+    poll_msg = pick_poll(polls, args.poll.strip() if args.poll else None)
+    musicians, total_rows = load_roster(musicians_csv, roster_cache, normalizer)
+    log(f"📁 Загружено {total_rows} записей, с инструментами: {len(musicians)}")
+    report, _ = await make_poll_report(
+        client, chat_peer, poll_msg, musicians, votes_page_size, args.smart_sort, limiter,
+        per_option=args.per_option, classifier=classifier,
+    )
+    log(report)
+
+
 # Функция выбора чата по ID
 def entity_kind(ent) -> str:
     if isinstance(ent, types.User):
@@ -545,17 +1344,41 @@ def parse_chat_ref(chat_ref):
     return s  # username/ссылка
 
 
-async def resolve_chat_entity(client: TelegramClient, chat_ref, scan_limit: int = 200):
+async def resolve_chat_entity(
+        client: TelegramClient,
+        chat_ref,
+        scan_limit: int = 200,
+        cache: Optional[EntityCache] = None,
+):
     """
     Универсально получает entity:
+    0) из локального кэша (свежая запись — без запросов, устаревшая — перепроверка одним запросом)
     1) пробует get_entity напрямую
     2) если не вышло — сканирует диалоги и ищет по peer_id
     """
     ref = parse_chat_ref(chat_ref)
 
+    # 0) кэш
+    if cache is not None:
+        hit = cache.lookup(ref)
+        if hit is not None:
+            ent, fresh = hit
+            if fresh:
+                return ent
+            try:
+                ent = await client.get_entity(get_input_peer(ent))
+                cache.put(ent)
+                return ent
+            except (ValueError, TypeError, errors.RPCError):
+                # access_hash устарел (например, аккаунт вышел из чата) — забываем запись
+                cache.invalidate(get_peer_id(ent))
+
     # 1) прямой способ
     try:
-        return await client.get_entity(ref)
+        ent = await client.get_entity(ref)
+        if cache is not None:
+            cache.put(ent)
+        return ent
     except Exception:
         pass
 
@@ -565,44 +1388,62 @@ async def resolve_chat_entity(client: TelegramClient, chat_ref, scan_limit: int
         # если это @username/ссылка — direct get_entity уже попытался, значит реально не находится
         raise ValueError(f"Cannot find any entity corresponding to {chat_ref!r}")
 
-    i = 0
+    found = None
+    scanned = []
     async for d in client.iter_dialogs():
+        scanned.append(d)
         ent = d.entity
         pid = get_peer_id(ent)  # это то же самое, что d.id (-100... для супергрупп)
-        if pid == target:
-            return ent
         # на всякий случай: если передали +id, а pid оказался -id
-        if pid == -target:
-            return ent
-        i += 1
-        if i >= scan_limit:
+        if pid == target or pid == -target:
+            found = ent
+            break
+        if len(scanned) >= scan_limit:
             break
 
+    # всё, что уже пришло со сканом, сохраняем — следующий запуск обойдётся без него
+    if cache is not None:
+        cache.put_dialogs(scanned)
+    if found is not None:
+        return found
+
     raise ValueError(f"Cannot find any entity corresponding to {chat_ref!r} (scanned {scan_limit} dialogs)")
 
 
-async def pick_chat_interactively(client: TelegramClient, limit: int = 30):
+async def pick_chat_interactively(client: TelegramClient, limit: int = 30, cache: Optional[EntityCache] = None):
     """
     Показывает первые N диалогов и даёт выбрать.
+    Со свежим кэшем список берётся с диска; "r" — перечитать диалоги из Telegram.
     Возвращает entity выбранного диалога.
     """
-    dialogs = []
-    i = 0
-    async for d in client.iter_dialogs():
-        dialogs.append(d)
-        i += 1
-        if i >= limit:
-            break
+    cached = cache.dialogs(limit) if cache is not None else None
+
+    while True:
+        if cached is None:
+            fetched = []
+            async for d in client.iter_dialogs():
+                fetched.append(d)
+                if len(fetched) >= limit:
+                    break
+            if cache is not None:
+                cache.put_dialogs(fetched)
+            dialogs = [(d.name, d.id, d.entity) for d in fetched]
+        else:
+            dialogs = cached
 
-    log("\n📚 Диалоги:")
-    for idx, d in enumerate(dialogs, start=1):
-        ent = d.entity
-        log(f"{idx:>2}. {d.name} | id={d.id} | type={entity_kind(ent)}")
+        log("\n📚 Диалоги:" + (" (из кэша, r — обновить)" if cached is not None else ""))
+        for idx, (name, pid, ent) in enumerate(dialogs, start=1):
+            log(f"{idx:>2}. {name} | id={pid} | type={entity_kind(ent)}")
+
+        raw = input("\nНомер диалога (Enter = 1): ").strip()
+        if raw.lower() == "r" and cached is not None:
+            cached = None
+            continue
+        break
 
-    raw = input("\nНомер диалога (Enter = 1): ").strip()
     n = 1 if raw == "" else int(raw)
     n = max(1, min(n, len(dialogs)))
-    chosen = dialogs[n - 1].entity
+    chosen = dialogs[n - 1][2]
 
     title = getattr(chosen, "title", getattr(chosen, "first_name", ""))
     cid = getattr(chosen, "id", None)
@@ -627,7 +1468,34 @@ async def main():
     parser.add_argument("--pick-chat", action="store_true", help="Выбрать чат из списка диалогов (интерактивно)")
     parser.add_argument("--pick-chat-limit", type=int, default=30,
                         help="Сколько диалогов показать при --pick-chat (по умолчанию 30)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Не использовать локальный кэш (всё выгружать заново)")
+    parser.add_argument("--resend", action="store_true",
+                        help="Отправить отчёт новым сообщением, а не править прошлый в Избранном")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Один раз дочитать всю историю темы в индекс опросов (для --poll по старым опросам)")
+    parser.add_argument("--polls", type=str, nargs="+", default=[],
+                        help="Batch: несколько опросов по подстрокам в вопросе")
+    parser.add_argument("--since", type=date.fromisoformat, default=None,
+                        help="Batch: опросы начиная с даты YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, default=None,
+                        help="Batch: опросы по дату YYYY-MM-DD включительно")
+    parser.add_argument("--all-polls", action="store_true", help="Batch: все опросы в теме")
+    parser.add_argument("--per-option", action="store_true",
+                        help="Добавить в отчёт разбивку по вариантам ответа")
+    parser.add_argument("--watch", action="store_true",
+                        help="Не выходить: обновлять отчёты в Избранном при изменении голосов")
+    parser.add_argument("--attendance", type=int, default=0, metavar="N",
+                        help="Посещаемость по инструментам за последние N опросов (из истории, без Telegram)")
+    parser.add_argument("--chats", type=str, nargs="+", default=[], metavar="NAME",
+                        help="Отчёты сразу по нескольким чатам из секций [chat:NAME] (параллельно)")
+    parser.add_argument("--all-chats", action="store_true", help="Отчёты по всем секциям [chat:...]")
+    parser.add_argument("--record", type=str, nargs="?", const="", default=None, metavar="ARCHIVE",
+                        help="Сохранить опросы и все страницы голосов в архив (по умолчанию [files] archive)")
+    parser.add_argument("--replay", type=str, nargs="?", const="", default=None, metavar="ARCHIVE",
+                        help="Собрать отчёты из архива --record без Telegram и без входа")
     args = parser.parse_args()
+    batch_mode = bool(args.polls or args.since or args.until or args.all_polls)
 
     conf = load_config(args.config)
 
@@ -639,25 +1507,157 @@ async def main():
     MUSICIANS_CSV = conf["MUSICIANS_CSV"]
     SEARCH_LIMIT = conf["SEARCH_LIMIT"]
     VOTES_PAGE_SIZE = conf["VOTES_PAGE_SIZE"]
+    VOTES_CONCURRENCY = conf["VOTES_CONCURRENCY"]
+    CACHE_DB = "" if args.no_cache else conf["CACHE_DB"]
+    NORMALIZER = load_normalizer(conf["INSTRUMENT_RULES"])
+    CLASSIFIER = load_classifier(conf["OPTION_LEXICON"])
+    ROSTER_CACHE = "" if args.no_cache else (conf["ROSTER_CACHE"] or f"{MUSICIANS_CSV}.roster")
+
+    ATTENDANCE = conf["ATTENDANCE"]
+    ARCHIVE = None
+    if args.record is not None or args.replay is not None:
+        ARCHIVE = (args.record if args.record is not None else args.replay) or conf["ARCHIVE"]
+
+    if args.attendance:
+        if not ATTENDANCE or not os.path.exists(ATTENDANCE):
+            log(f"❌ Нет истории посещаемости ({ATTENDANCE or '[files] attendance не задан'}).")
+            return
+        store = AttendanceStore(ATTENDANCE)
+        roster, _ = load_roster(MUSICIANS_CSV, ROSTER_CACHE, NORMALIZER)
+        ref = parse_chat_ref(args.chat.strip() if args.chat.strip() else CHAT_ID)
+        chat_ids = [ref, -ref] if isinstance(ref, int) else None
+        log(build_attendance_report(store, roster, args.attendance, chat_ids))
+        return
+
+    if args.replay is not None:
+        if not os.path.exists(ARCHIVE):
+            log(f"❌ Архив не найден: {ARCHIVE}")
+            return
+        archive = ResponseArchive(ARCHIVE)
+        try:
+            await replay_reports(
+                archive, args.chat.strip() if args.chat.strip() else CHAT_ID, args,
+                musicians_csv=MUSICIANS_CSV,
+                votes_page_size=VOTES_PAGE_SIZE,
+                roster_cache=ROSTER_CACHE,
+                normalizer=NORMALIZER,
+                classifier=CLASSIFIER,
+            )
+        finally:
+            archive.close()
+        return
+
+    chats: List[dict] = []
+    if args.chats or args.all_chats:
+        chats = select_chats(conf["CHATS"], args.chats, args.all_chats)
+        if not chats:
+            log("❌ Нет чатов для отчёта: добавь в config.ini секции [chat:<имя>].")
+            return
 
     log("🎻 Запуск парсера оркестра...")
 
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
-    await client.start()
+    # состав (CSV + нормализация) не зависит от сети — читаем в рабочем потоке, пока идут подключение и поиск.
+    # Один файл — одна задача: у чатов с общим CSV один и тот же кэш состава.
+    rosters: Dict[str, asyncio.Future] = {}
+    if chats or not args.list_topics:
+        for csv_path, cache_path in (
+                [(c["MUSICIANS_CSV"], "" if args.no_cache else f"{c['MUSICIANS_CSV']}.roster") for c in chats]
+                or [(MUSICIANS_CSV, ROSTER_CACHE)]
+        ):
+            if csv_path not in rosters:
+                rosters[csv_path] = start_roster_load(csv_path, cache_path, NORMALIZER)
+
+    metrics = RpcMetrics(conf["METRICS"])
+    client = metrics.instrument(TelegramClient(SESSION_NAME, API_ID, API_HASH))
+    with metrics.stage("connect"):
+        await client.start()
     log("✅ Подключено к Telegram")
 
+    archive = ResponseArchive(ARCHIVE) if args.record is not None else None
+    if archive is not None:
+        # все страницы голосов должны попасть в архив — кэш голосов при записи не используется
+        client = RecordingClient(client, archive)
+        log(f"📼 Запись ответов в архив: {ARCHIVE}")
+
+    vote_cache = VoteCache(CACHE_DB) if CACHE_DB and archive is None else None
+    poll_index = PollIndex(CACHE_DB) if CACHE_DB else None
+    attendance = AttendanceStore(ATTENDANCE) if ATTENDANCE else None
+    entity_cache = EntityCache(CACHE_DB, ttl=conf["ENTITY_TTL"]) if CACHE_DB else None
+    report_store = ReportStore(CACHE_DB) if CACHE_DB else None
+
     try:
+        watcher_options = None
+        if args.watch:
+            watcher_options = {
+                "debounce": conf["WATCH_DEBOUNCE"],
+                "fallback_interval": conf["WATCH_FALLBACK_INTERVAL"],
+                "metrics": metrics,
+            }
+
+        if chats:
+            log(f"🎻 Чатов в запуске: {len(chats)} — " + ", ".join(c["NAME"] for c in chats))
+
+            # один клиент и один limiter на все чаты: общий бюджет запросов к Telegram
+            limiter = RequestLimiter(VOTES_CONCURRENCY)
+            with metrics.stage("chats"):
+                results = await asyncio.gather(*[
+                    report_chat(
+                        client, chat, args, limiter,
+                        votes_page_size=VOTES_PAGE_SIZE,
+                        search_limit=SEARCH_LIMIT,
+                        normalizer=NORMALIZER,
+                        classifier=CLASSIFIER,
+                        roster_cache="" if args.no_cache else f"{chat['MUSICIANS_CSV']}.roster",
+                        vote_cache=vote_cache,
+                        poll_index=poll_index,
+                        entity_cache=entity_cache,
+                        attendance=attendance,
+                        watcher_options=watcher_options,
+                        archive=archive,
+                        report_store=report_store,
+                        roster=rosters[chat["MUSICIANS_CSV"]],
+                    )
+                    for chat in chats
+                ], return_exceptions=True)
+            for chat, res in zip(chats, results):
+                if isinstance(res, Exception):
+                    msg = f"❌ [{chat['NAME']}] {type(res).__name__}: {res}"
+                    log(msg)
+                    await client.send_message("me", msg)
+            log("👋 Завершено")
+            return
+
         # 0) Выбор чата: config -> --chat -> --pick-chat
         chat_ref = None
 
-        if args.pick_chat:
-            chat_entity = await pick_chat_interactively(client, limit=args.pick_chat_limit)
-        else:
-            # если указали --chat, используем его, иначе берём из конфига
-            chat_ref = args.chat.strip() if args.chat.strip() else CHAT_ID
-            chat_entity = await resolve_chat_entity(client, chat_ref, scan_limit=max(args.pick_chat_limit, 200))
+        with metrics.stage("resolve_chat"):
+            if args.pick_chat:
+                chat_entity = await pick_chat_interactively(client, limit=args.pick_chat_limit, cache=entity_cache)
+            else:
+                # если указали --chat, используем его, иначе берём из конфига
+                chat_ref = args.chat.strip() if args.chat.strip() else CHAT_ID
+                chat_entity = await resolve_chat_entity(
+                    client, chat_ref, scan_limit=max(args.pick_chat_limit, 200), cache=entity_cache,
+                )
+
+            chat_peer = await client.get_input_entity(chat_entity)
+
+        # если topic_id не задан явно:
+        # - для обычных чатов/групп (types.Chat, types.User) тем нет -> topic_id = 0
+        # - для супергрупп/каналов (types.Channel) можно взять DEFAULT_TOPIC_ID
+        default_topic_id = DEFAULT_TOPIC_ID if isinstance(chat_entity, types.Channel) else 0
+        topic_id = args.topic_id if args.topic_id else 0
 
-        chat_peer = await client.get_input_entity(chat_entity)
+        # тема известна без запросов (--topic-id или по умолчанию) — поиск опросов стартует сразу,
+        # а запись в архив, логи и прочая подготовка идут, пока он в сети
+        search = None
+        if not args.list_topics and not (not topic_id and args.topic.strip()):
+            topic_id = topic_id or default_topic_id
+            log(f"🔍 Ищу опрос в теме ID {topic_id}...")
+            search = asyncio.ensure_future(collect_polls(client, chat_entity, topic_id, SEARCH_LIMIT, poll_index))
+
+        if archive is not None:
+            archive.put_chat(chat_entity)
 
         # для логов
         chat_title = getattr(chat_entity, "title",
@@ -666,7 +1666,10 @@ async def main():
 
         # list topics
         if args.list_topics:
-            topics = await get_forum_topics(client, chat_entity, query=None, limit=200)
+            if entity_cache is not None:
+                topics = await cached_forum_topics(client, chat_entity, entity_cache)
+            else:
+                topics = await get_forum_topics(client, chat_entity, query=None, limit=None)
             log("\n📌 Темы форума:")
             for t in topics:
                 # покажем и id, и top_message на всякий случай
@@ -674,34 +1677,30 @@ async def main():
             log("\n👋 Завершено")
             return
 
-        # choose topic id
-        topic_id = args.topic_id if args.topic_id else 0
-
-        if not topic_id and args.topic.strip():
-            topic_id = await choose_topic_id(client, chat_entity, args.topic.strip())
-
-        # если topic_id не задан явно:
-        # - для обычных чатов/групп (types.Chat, types.User) тем нет -> topic_id = 0
-        # - для супергрупп/каналов (types.Channel) можно взять DEFAULT_TOPIC_ID
-        if not topic_id:
-            if isinstance(chat_entity, types.Channel) and DEFAULT_TOPIC_ID:
-                topic_id = DEFAULT_TOPIC_ID
+        if search is None:
+            # --topic: сначала найти тему
+            with metrics.stage("topics"):
+                topic_id = await choose_topic_id(client, chat_entity, args.topic.strip(), cache=entity_cache)
+            topic_id = topic_id or default_topic_id
+            log(f"🔍 Ищу опрос в теме ID {topic_id}...")
+            search = asyncio.ensure_future(collect_polls(client, chat_entity, topic_id, SEARCH_LIMIT, poll_index))
+
+        with metrics.stage("find_polls"):
+            polls, topic_id = await search
+        if archive is not None:
+            archive.add_polls(get_peer_id(chat_entity), topic_id, [m for m, _ in polls])
+
+        if args.backfill:
+            if poll_index is None:
+                log("⚠️ --backfill сохраняет опросы в кэш, а он выключен — пропускаю.")
             else:
-                topic_id = 0
-
-        log(f"🔍 Ищу опрос в теме ID {topic_id}...")
-
-        try:
-            polls = await find_polls_in_topic(client, chat_entity, topic_id, SEARCH_LIMIT)
-        except errors.rpcerrorlist.PeerIdInvalidError:
-            log("⚠️ Этот чат не поддерживает темы/reply_to. Ищу опрос по всему чату (без topic_id)...")
-            topic_id = 0
-            polls = await find_polls_in_topic(client, chat_entity, 0, SEARCH_LIMIT)
-
-        # Авто-фоллбек: если тема не форумная/не та — пробуем искать опросы по всему чату
-        if not polls and topic_id > 0:
-            log("⚠️ В этой теме опросов нет. Пробую искать по всему чату (без topic_id)...")
-            polls = await find_polls_in_topic(client, chat_entity, 0, SEARCH_LIMIT)
+                log("🗂️  Добираю старую историю опросов...")
+                with metrics.stage("backfill"):
+                    found = await backfill_polls(client, chat_entity, topic_id, poll_index,
+                                                 limiter=RequestLimiter(VOTES_CONCURRENCY))
+                log(f"🗂️  Добор истории: найдено опросов — {found}")
+                if found:
+                    polls = poll_index.polls(get_peer_id(chat_entity), topic_id) or polls
 
         if not polls:
             msg = f"❌ Не найдено опросов (topic_id={topic_id}, fallback=0 тоже пусто)."
@@ -709,7 +1708,32 @@ async def main():
             await client.send_message("me", msg)
             return
 
-        poll_msg = pick_poll(polls, args.poll.strip() if args.poll else None)
+        if batch_mode or args.watch:
+            with metrics.stage("batch"):
+                await run_batch(
+                    client, chat_entity, chat_peer, polls, args,
+                    musicians_csv=MUSICIANS_CSV,
+                    roster_cache=ROSTER_CACHE,
+                    normalizer=NORMALIZER,
+                    votes_page_size=VOTES_PAGE_SIZE,
+                    limiter=RequestLimiter(VOTES_CONCURRENCY),
+                    vote_cache=vote_cache,
+                    refresh=poll_index is not None,
+                    watcher_options=watcher_options,
+                    attendance=attendance,
+                    report_store=report_store,
+                    classifier=CLASSIFIER,
+                    roster=rosters[MUSICIANS_CSV],
+                )
+            log("👋 Завершено")
+            return
+
+        poll_msg = pick_poll(polls, args.poll.strip() if args.poll else None,
+                             poll_index, get_peer_id(chat_entity), topic_id)
+        if poll_msg and poll_index is not None:
+            refreshed = await refresh_poll_messages(client, chat_entity, [poll_msg])
+            poll_msg = refreshed[0] if refreshed else None
+
         if not poll_msg:
             msg = "❌ Не удалось выбрать опрос."
             log(msg)
@@ -727,20 +1751,33 @@ async def main():
         if args.smart_sort:
             log("🧠 Smart sort: включён (сортирую 'Смогу...' по времени/смыслу)")
 
-        # fetch voters
+        # fetch voters: каждый вариант раскладывается по инструментам, как только выгружен
+        # (состав к этому моменту обычно уже прочитан в потоке), остальные варианты в это время ещё в сети
+        roster = rosters[MUSICIANS_CSV]
+        tally: Optional[InstrumentTally] = None
+
+        async def count_option(_, voters: Set[int]) -> None:
+            nonlocal tally
+            musicians, _ = await roster
+            if tally is None:
+                tally = InstrumentTally(musicians)
+            tally.add(voters)
+
         try:
-            voter_ids, option_texts = await fetch_poll_voters_yes_union(
-                client=client,
-                chat_peer=chat_peer,
-                poll_msg=poll_msg,
-                votes_page_size=VOTES_PAGE_SIZE,
-                smart_sort=args.smart_sort,
-            )
+            with metrics.stage("fetch_votes"):
+                options = await fetch_poll_option_voters(
+                    client=client,
+                    chat_peer=chat_peer,
+                    poll_msg=poll_msg,
+                    votes_page_size=VOTES_PAGE_SIZE,
+                    smart_sort=args.smart_sort,
+                    concurrency=VOTES_CONCURRENCY,
+                    cache=vote_cache,
+                    classifier=CLASSIFIER,
+                    on_option=count_option,
+                )
         except errors.PollVoteRequiredError:
-            msg = (
-                "❌ Telegram требует, чтобы этот аккаунт проголосовал в опросе, прежде чем смотреть голоса.\n"
-                "Проголосуй (любой вариант) и запусти скрипт снова."
-            )
+            msg = "❌ " + VOTE_REQUIRED_MSG
             log(msg)
             await client.send_message("me", msg)
             return
@@ -749,22 +1786,45 @@ async def main():
             await client.send_message("me", f"❌ {e}")
             return
 
+        voter_ids = union_voters(options)
+        option_texts = [text for text, _ in options]
         log(f"📊 На мероприятие идут: {len(voter_ids)} человек")
 
-        # load musicians
-        musicians, total_rows = load_musicians_csv(MUSICIANS_CSV)
-        log(f"📁 Загружено {total_rows} записей")
+        # load musicians: ждём, только если поток ещё не дочитал состав
+        with metrics.stage("roster"):
+            musicians, total_rows = await roster
+            log(f"📁 Загружено {total_rows} записей")
         log(f"✅ В базе {len(musicians)} музыкантов с инструментами")
+        musicians = tally.roster if tally is not None else roster_series(musicians)
+
+        record_attendance(attendance, chat_peer, poll_msg, options, musicians)
 
         # report
-        report = build_report(poll_question, option_texts, voter_ids, musicians)
+        report = build_report(
+            poll_question, option_texts, voter_ids, musicians,
+            per_option=options if args.per_option else None, tally=tally,
+        )
 
-        await client.send_message("me", report)
-        log("✅ Отчет отправлен!")
+        with metrics.stage("send"):
+            outcome = await deliver_report(client, report_store, get_peer_id(chat_peer), str(poll_msg.id), report,
+                                           resend=args.resend)
+            log(DELIVERY_LOG[outcome])
         log(report)
         log("👋 Завершено")
 
     finally:
+        if vote_cache is not None:
+            vote_cache.close()
+        if poll_index is not None:
+            poll_index.close()
+        if entity_cache is not None:
+            entity_cache.close()
+        if report_store is not None:
+            report_store.close()
+        if archive is not None:
+            archive.close()
+        metrics.flush()
+        metrics.close()
         await client.disconnect()
 
 
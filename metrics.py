@@ -0,0 +1,251 @@
+import bisect
+import contextlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from telethon import errors
+
+from common import log
+
+
+# =========================
+# МЕТРИКИ ЗАПРОСОВ К TELEGRAM
+# =========================
+# верхние границы корзин гистограммы задержек, сек
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Telethon сам ждёт короткие FloodWait (меньше flood_sleep_threshold) и пишет об этом
+# в этот логгер: "Sleeping%s for %ds (%s) on %s flood wait"
+TELETHON_FLOOD_LOGGER = "telethon.client.users"
+
+
+def request_name(request) -> str:
+    if isinstance(request, (list, tuple)):
+        return "+".join(sorted({type(r).__name__ for r in request}))
+    return type(request).__name__
+
+
+def response_size(result) -> int:
+    """Размер ответа в байтах (TL-сериализация — столько и пришло по сети без сжатия)."""
+    if isinstance(result, (list, tuple)):
+        return sum(response_size(r) for r in result)
+    try:
+        return len(bytes(result))
+    except (TypeError, ValueError, AttributeError, NotImplementedError):
+        return 0
+
+
+class RequestStats:
+    __slots__ = ("count", "errors", "seconds", "max_seconds", "buckets", "bytes", "flood_seconds", "retries")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # последняя — больше всех границ
+        self.bytes = 0
+        self.flood_seconds = 0
+        self.retries = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 6),
+            "max_seconds": round(self.max_seconds, 6),
+            "latency_buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+            "bytes": self.bytes,
+            "flood_wait_seconds": self.flood_seconds,
+            "retries": self.retries,
+        }
+
+
+class _FloodLogHandler(logging.Handler):
+    def __init__(self, metrics: "RpcMetrics"):
+        super().__init__(logging.INFO)
+        self.metrics = metrics
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if "flood wait" not in str(record.msg) or not record.args or len(record.args) < 4:
+            return
+        _, delay, _, name = record.args[:4]
+        self.metrics.flood(str(name), int(delay))
+
+
+class RpcMetrics:
+    """
+    Счётчики по каждому типу запроса: число вызовов, ошибки, гистограмма задержек,
+    полученные байты, секунды FloodWait и повторы. Плюс время этапов запуска (stage).
+    Задержка запроса включает ожидание FloodWait, если Telethon переждал его сам.
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.requests: Dict[str, RequestStats] = {}
+        self.stages: Dict[str, float] = {}
+        self.started_at = time.time()
+        self._handler: Optional[logging.Handler] = None
+
+    def _stats(self, name: str) -> RequestStats:
+        s = self.requests.get(name)
+        if s is None:
+            s = self.requests[name] = RequestStats()
+        return s
+
+    # ---------- сбор ----------
+    def observe(self, name: str, seconds: float, nbytes: int = 0, error: bool = False) -> None:
+        s = self._stats(name)
+        s.count += 1
+        s.errors += int(error)
+        s.seconds += seconds
+        s.max_seconds = max(s.max_seconds, seconds)
+        s.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        s.bytes += nbytes
+
+    def flood(self, name: str, seconds: int) -> None:
+        """FloodWait на запрос name: после него запрос повторяется (Telethon или RequestLimiter)."""
+        s = self._stats(name)
+        s.flood_seconds += int(seconds)
+        s.retries += 1
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t
+
+    async def timed_call(self, request, call):
+        """await call — один запрос request; время, ответ и ошибка записываются в метрики."""
+        name = request_name(request)
+        t = time.perf_counter()
+        try:
+            result = await call
+        except errors.FloodWaitError as e:
+            self.observe(name, time.perf_counter() - t, error=True)
+            self.flood(name, e.seconds)
+            raise
+        except Exception:
+            self.observe(name, time.perf_counter() - t, error=True)
+            raise
+        self.observe(name, time.perf_counter() - t, response_size(result))
+        return result
+
+    def instrument(self, client):
+        """
+        Оборачивает публичный client(request): через него идут и запросы самого
+        Telethon внутри get_messages / iter_dialogs / get_entity. Подменяется только
+        класс этого клиента (подкласс с тем же именем), остальные клиенты не меняются.
+        """
+        metrics = self
+        base = type(client)
+
+        class Instrumented(base):
+            async def __call__(self, request, *args, **kwargs):
+                return await metrics.timed_call(request, super().__call__(request, *args, **kwargs))
+
+        Instrumented.__name__ = Instrumented.__qualname__ = base.__name__
+        client.__class__ = Instrumented
+
+        if self._handler is None:
+            self._handler = _FloodLogHandler(self)
+            flood_logger = logging.getLogger(TELETHON_FLOOD_LOGGER)
+            flood_logger.addHandler(self._handler)
+            if flood_logger.getEffectiveLevel() > logging.INFO:
+                flood_logger.setLevel(logging.INFO)
+        return client
+
+    # ---------- вывод ----------
+    def as_dict(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "requests": {name: s.as_dict() for name, s in sorted(self.requests.items())},
+            "stages": {name: round(sec, 6) for name, sec in self.stages.items()},
+        }
+
+    def summary(self) -> str:
+        total = sum(s.count for s in self.requests.values())
+        seconds = sum(s.seconds for s in self.requests.values())
+        nbytes = sum(s.bytes for s in self.requests.values())
+        flood = sum(s.flood_seconds for s in self.requests.values())
+        lines = [
+            f"📈 Запросы к Telegram: {total} за {seconds:.1f} с, получено {nbytes / 1024:.0f} КБ, "
+            f"FloodWait {flood} с"
+        ]
+        for name, s in sorted(self.requests.items(), key=lambda kv: -kv[1].seconds):
+            avg = s.seconds / s.count * 1000 if s.count else 0.0
+            extra = ""
+            if s.flood_seconds or s.retries:
+                extra += f", FloodWait {s.flood_seconds} с, повторов {s.retries}"
+            if s.errors:
+                extra += f", ошибок {s.errors}"
+            lines.append(
+                f"  • {name}: {s.count} × {avg:.0f} мс (макс. {s.max_seconds * 1000:.0f} мс), "
+                f"{s.bytes / 1024:.0f} КБ{extra}"
+            )
+        if self.stages:
+            lines.append("⏱️ Этапы: " + " | ".join(f"{k} {v:.2f} с" for k, v in self.stages.items()))
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """Текстовый формат Prometheus (для node_exporter textfile collector)."""
+        out: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, rows: List[str]) -> None:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(rows)
+
+        items = sorted(self.requests.items())
+        metric("orchestra_rpc_requests_total", "counter", "Telegram requests by method.",
+               [f'orchestra_rpc_requests_total{{method="{n}"}} {s.count}' for n, s in items])
+        metric("orchestra_rpc_errors_total", "counter", "Failed Telegram requests by method.",
+               [f'orchestra_rpc_errors_total{{method="{n}"}} {s.errors}' for n, s in items])
+
+        rows = []
+        for n, s in items:
+            cumulative = 0
+            for bound, c in zip(list(LATENCY_BUCKETS) + ["+Inf"], s.buckets):
+                cumulative += c
+                rows.append(f'orchestra_rpc_latency_seconds_bucket{{method="{n}",le="{bound}"}} {cumulative}')
+            rows.append(f'orchestra_rpc_latency_seconds_sum{{method="{n}"}} {s.seconds:.6f}')
+            rows.append(f'orchestra_rpc_latency_seconds_count{{method="{n}"}} {s.count}')
+        metric("orchestra_rpc_latency_seconds", "histogram", "Telegram request latency.", rows)
+
+        metric("orchestra_rpc_received_bytes_total", "counter", "Bytes received by method.",
+               [f'orchestra_rpc_received_bytes_total{{method="{n}"}} {s.bytes}' for n, s in items])
+        metric("orchestra_rpc_flood_wait_seconds_total", "counter", "FloodWait seconds by method.",
+               [f'orchestra_rpc_flood_wait_seconds_total{{method="{n}"}} {s.flood_seconds}' for n, s in items])
+        metric("orchestra_rpc_retries_total", "counter", "Retries after FloodWait by method.",
+               [f'orchestra_rpc_retries_total{{method="{n}"}} {s.retries}' for n, s in items])
+        metric("orchestra_stage_seconds", "gauge", "Wall time of run stages.",
+               [f'orchestra_stage_seconds{{stage="{k}"}} {v:.6f}' for k, v in self.stages.items()])
+        return "\n".join(out) + "\n"
+
+    def write(self, path: Optional[str] = None) -> None:
+        """JSON или, для *.prom, текстовый файл Prometheus (атомарная замена)."""
+        path = path if path is not None else self.path
+        if not path:
+            return
+        data = self.prometheus() if path.endswith(".prom") else json.dumps(self.as_dict(), ensure_ascii=False, indent=2)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def flush(self, quiet: bool = False) -> None:
+        """Сводка в лог (если не quiet) и в файл метрик."""
+        if not quiet:
+            log(self.summary())
+        self.write()
+
+    def close(self) -> None:
+        if self._handler is not None:
+            logging.getLogger(TELETHON_FLOOD_LOGGER).removeHandler(self._handler)
+            self._handler = None
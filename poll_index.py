@@ -0,0 +1,301 @@
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telethon import functions
+from telethon.tl import types
+from telethon.tl.types import MessageMediaPoll
+from telethon.utils import get_peer_id
+
+from common import RequestLimiter, as_text, dump_tl, load_tl
+from fuzzy import normalize_text, similarity, trigrams
+
+
+# =========================
+# ПОИСК ОПРОСОВ НА СЕРВЕРЕ
+# =========================
+async def search_polls(
+        client,
+        chat,
+        topic_id: int,
+        limit: Optional[int],
+        min_id: int = 0,
+        page_size: int = 100,
+        limiter: Optional[RequestLimiter] = None,
+) -> Tuple[list, int]:
+    """
+    Ищет сообщения-опросы через messages.search (в теме — с top_msg_id), страницами по page_size.
+    Отдельного фильтра «только опросы» в API нет, поэтому опросы отбираются на клиенте;
+    limit — сколько сообщений просмотреть (как раньше у iter_messages), None — без ограничения.
+    topic_id > 0 — только в этой теме; min_id — только сообщения новее него.
+    Возвращает (опросы от новых к старым, максимальный id просмотренного сообщения или min_id).
+    """
+    found = []
+    seen = 0
+    max_id = min_id
+    async for messages in iter_search_pages(client, chat, topic_id, min_id, 0, page_size, limiter, limit):
+        seen += len(messages)
+        max_id = max(max_id, max(int(m.id) for m in messages))
+        found.extend(m for m in messages if isinstance(getattr(m, "media", None), MessageMediaPoll))
+        if limit is not None and seen >= limit:
+            break
+    return found, max_id
+
+
+async def iter_search_pages(
+        client,
+        chat,
+        topic_id: int,
+        min_id: int = 0,
+        offset_id: int = 0,
+        page_size: int = 100,
+        limiter: Optional[RequestLimiter] = None,
+        limit: Optional[int] = None,
+):
+    """Страницы messages.search от offset_id (0 — с самого нового) к старым; limit=None — до начала чата."""
+    seen = 0
+    while limit is None or seen < limit:
+        req = functions.messages.SearchRequest(
+            peer=chat,
+            q="",
+            filter=types.InputMessagesFilterEmpty(),
+            min_date=None,
+            max_date=None,
+            offset_id=offset_id,
+            add_offset=0,
+            limit=page_size if limit is None else min(page_size, limit - seen),
+            max_id=0,
+            min_id=min_id,
+            hash=0,
+            top_msg_id=topic_id if topic_id > 0 else None,
+        )
+        res = await (limiter.call(client, req) if limiter else client(req))
+        messages = getattr(res, "messages", []) or []
+        seen += len(messages)
+        if messages:
+            yield messages
+        if len(messages) < req.limit:
+            return
+        offset_id = messages[-1].id
+
+
+def poll_text(msg) -> str:
+    """Вопрос и все варианты ответа — то, по чему ищет --poll."""
+    poll = msg.media.poll
+    return " ".join([as_text(poll.question)] + [as_text(a.text) for a in poll.answers])
+
+
+# =========================
+# ЛОКАЛЬНЫЙ ИНДЕКС ОПРОСОВ
+# =========================
+class PollIndex:
+    """
+    Опросы, уже найденные в (chat_id, topic_id), хранятся на диске вместе с
+    водяным знаком — максимальным id сообщения. Следующий запуск спрашивает у
+    сервера только сообщения новее водяного знака.
+
+    Для --poll рядом лежит триграммный индекс по вопросу и вариантам ответа
+    (poll_grams) всех опросов чата: search() ранжирует совпадения с опечатками
+    и другими формами слов по всей истории, не перечитывая сообщения.
+    Старую историю можно добрать backfill_polls.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS polls (
+                chat_id  INTEGER NOT NULL,
+                topic_id INTEGER NOT NULL,
+                msg_id   INTEGER NOT NULL,
+                date     REAL,
+                question TEXT    NOT NULL,
+                raw      BLOB    NOT NULL,
+                PRIMARY KEY (chat_id, topic_id, msg_id)
+            );
+            CREATE TABLE IF NOT EXISTS poll_watermarks (
+                chat_id    INTEGER NOT NULL,
+                topic_id   INTEGER NOT NULL,
+                max_msg_id INTEGER NOT NULL,
+                updated_at REAL    NOT NULL,
+                PRIMARY KEY (chat_id, topic_id)
+            );
+            CREATE TABLE IF NOT EXISTS poll_texts (
+                chat_id INTEGER NOT NULL,
+                msg_id  INTEGER NOT NULL,
+                body    TEXT    NOT NULL,
+                PRIMARY KEY (chat_id, msg_id)
+            );
+            CREATE TABLE IF NOT EXISTS poll_grams (
+                chat_id INTEGER NOT NULL,
+                gram    TEXT    NOT NULL,
+                msg_id  INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, gram, msg_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS poll_backfill (
+                chat_id   INTEGER NOT NULL,
+                topic_id  INTEGER NOT NULL,
+                offset_id INTEGER NOT NULL,
+                done      INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, topic_id)
+            );
+            """
+        )
+        self._db.commit()
+        self._index_missing()
+
+    # ---------- полнотекстовый индекс ----------
+    def _index_texts(self, chat_id: int, messages: list) -> None:
+        texts = [(int(chat_id), int(m.id), normalize_text(poll_text(m))) for m in messages]
+        self._db.executemany("DELETE FROM poll_grams WHERE chat_id=? AND msg_id=?", [t[:2] for t in texts])
+        self._db.executemany("INSERT OR REPLACE INTO poll_texts (chat_id, msg_id, body) VALUES (?, ?, ?)", texts)
+        self._db.executemany(
+            "INSERT OR IGNORE INTO poll_grams (chat_id, gram, msg_id) VALUES (?, ?, ?)",
+            [(cid, g, mid) for cid, mid, body in texts for g in trigrams(body)],
+        )
+
+    def _index_missing(self) -> None:
+        """Опросы, сохранённые до появления полнотекстового индекса, индексируются один раз."""
+        rows = self._db.execute(
+            "SELECT DISTINCT p.chat_id, p.msg_id, p.raw FROM polls p "
+            "LEFT JOIN poll_texts t ON t.chat_id = p.chat_id AND t.msg_id = p.msg_id WHERE t.msg_id IS NULL"
+        ).fetchall()
+        by_chat: Dict[int, list] = {}
+        for chat_id, _, raw in rows:
+            by_chat.setdefault(chat_id, []).append(load_tl(raw))
+        for chat_id, messages in by_chat.items():
+            self._index_texts(chat_id, messages)
+        if rows:
+            self._db.commit()
+
+    def search(
+            self, chat_id: int, query: str, topic_id: int = 0, limit: int = 20, threshold: float = 0.6,
+    ) -> List[Tuple[object, str, float]]:
+        """
+        [(message, question, оценка)] по вопросу и вариантам ответа, от лучших совпадений к худшим,
+        при равной оценке — от новых к старым. topic_id > 0 — только опросы, найденные в этой теме.
+        """
+        q = normalize_text(query)
+        grams = sorted(trigrams(q))
+        if not grams:
+            return []
+        placeholders = ",".join("?" * len(grams))
+        sql = f"SELECT msg_id, COUNT(*) AS hits FROM poll_grams WHERE chat_id=? AND gram IN ({placeholders})"
+        params: list = [int(chat_id), *grams]
+        if topic_id > 0:
+            sql += " AND msg_id IN (SELECT msg_id FROM polls WHERE chat_id=? AND topic_id=?)"
+            params += [int(chat_id), int(topic_id)]
+        # кандидаты — опросы с наибольшим числом общих триграмм
+        sql = (
+            f"SELECT c.msg_id, t.body FROM ({sql} GROUP BY msg_id ORDER BY hits DESC, msg_id DESC LIMIT 300) c "
+            "JOIN poll_texts t ON t.chat_id=? AND t.msg_id = c.msg_id"
+        )
+        params.append(int(chat_id))
+
+        words = q.split()
+        memo: Dict[Tuple[str, str], float] = {}
+        scored = []
+        for msg_id, body in self._db.execute(sql, params):
+            score = similarity(q, words, body, memo)
+            if score >= threshold:
+                scored.append((score, msg_id))
+        scored.sort(key=lambda sm: (-sm[0], -sm[1]))
+
+        out = []
+        for score, msg_id in scored[:limit]:
+            row = self._db.execute(
+                "SELECT raw, question FROM polls WHERE chat_id=? AND msg_id=? LIMIT 1", (int(chat_id), msg_id),
+            ).fetchone()
+            if row:
+                out.append((load_tl(row[0]), row[1], round(score, 3)))
+        return out
+
+    # ---------- добор старой истории ----------
+    def backfill_state(self, chat_id: int, topic_id: int) -> Tuple[int, bool]:
+        """(offset_id, история просмотрена до начала) для backfill_polls."""
+        row = self._db.execute(
+            "SELECT offset_id, done FROM poll_backfill WHERE chat_id=? AND topic_id=?", (int(chat_id), int(topic_id)),
+        ).fetchone()
+        return (int(row[0]), bool(row[1])) if row else (0, False)
+
+    def set_backfill_state(self, chat_id: int, topic_id: int, offset_id: int, done: bool) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO poll_backfill (chat_id, topic_id, offset_id, done) VALUES (?, ?, ?, ?)",
+            (int(chat_id), int(topic_id), int(offset_id), int(done)),
+        )
+        self._db.commit()
+
+    def watermark(self, chat_id: int, topic_id: int) -> int:
+        row = self._db.execute(
+            "SELECT max_msg_id FROM poll_watermarks WHERE chat_id=? AND topic_id=?",
+            (int(chat_id), int(topic_id)),
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def add(self, chat_id: int, topic_id: int, messages: list, scanned_max_id: int = 0) -> None:
+        """
+        Сохраняет опросы и сдвигает водяной знак до самого нового из них или до scanned_max_id —
+        максимального id просмотренного сообщения (опросом оно быть не обязано).
+        """
+        rows = []
+        max_id = max(self.watermark(chat_id, topic_id), int(scanned_max_id))
+        for msg in messages:
+            max_id = max(max_id, int(msg.id))
+            date = msg.date.timestamp() if getattr(msg, "date", None) else None
+            rows.append((
+                int(chat_id), int(topic_id), int(msg.id), date,
+                as_text(msg.media.poll.question), dump_tl(msg),
+            ))
+
+        self._db.executemany(
+            "INSERT OR REPLACE INTO polls (chat_id, topic_id, msg_id, date, question, raw) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._index_texts(chat_id, messages)
+        self._db.execute(
+            "INSERT OR REPLACE INTO poll_watermarks (chat_id, topic_id, max_msg_id, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (int(chat_id), int(topic_id), max_id, time.time()),
+        )
+        self._db.commit()
+
+    def polls(self, chat_id: int, topic_id: int) -> List[Tuple[object, str]]:
+        """[(message, question)] от новых к старым — тот же формат, что у find_polls_in_topic."""
+        rows = self._db.execute(
+            "SELECT raw, question FROM polls WHERE chat_id=? AND topic_id=? ORDER BY msg_id DESC",
+            (int(chat_id), int(topic_id)),
+        ).fetchall()
+        return [(load_tl(raw), question) for raw, question in rows]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+async def backfill_polls(
+        client,
+        chat,
+        topic_id: int,
+        index: PollIndex,
+        page_size: int = 100,
+        limiter: Optional[RequestLimiter] = None,
+) -> int:
+    """
+    Дочитывает историю (chat, topic_id) от самых старых уже просмотренных сообщений до начала чата
+    и кладёт опросы в индекс. Курсор сохраняется после каждой страницы — прерванный добор
+    продолжается с того же места. Возвращает число найденных опросов.
+    """
+    chat_id = get_peer_id(chat)
+    offset_id, done = index.backfill_state(chat_id, topic_id)
+    if done:
+        return 0
+    found = 0
+    async for messages in iter_search_pages(client, chat, topic_id, 0, offset_id, page_size, limiter):
+        polls = [m for m in messages if isinstance(getattr(m, "media", None), MessageMediaPoll)]
+        index.add(chat_id, topic_id, polls)
+        found += len(polls)
+        offset_id = messages[-1].id
+        index.set_backfill_state(chat_id, topic_id, offset_id, done=False)
+    index.set_backfill_state(chat_id, topic_id, offset_id, done=True)
+    return found
@@ -0,0 +1,147 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+# =========================
+# СЛОВАРЬ ВАРИАНТОВ ОПРОСА
+# =========================
+# yes       — подстроки «позитивного» варианта: ✅, "приду", "смогу", ...
+# negatable — слова, которые отрицаются: "не смогу" или вариант, начинающийся с "не" и содержащий слово, — «нет»
+# ranks     — смысловой порядок вариантов без времени (первое совпавшее правило задаёт ранг и метку)
+# time_markers — предлоги перед временем: "в 13:00", "к 10"
+DEFAULT_LEXICON: Dict = {
+    "yes": ["✅", "приду", "смогу", "буду"],
+    "negatable": ["смогу", "приду"],
+    "ranks": [
+        {"label": "саундчек", "any": ["саунд", "чек"]},
+        {"label": "репетиция", "any": ["репет"]},
+        {"label": "концерт", "any": ["концерт"]},
+    ],
+    "time_markers": ["в", "к"],
+}
+
+NO_TIME_SLOT = 10_000  # при сортировке: варианты без времени идут после всех со временем
+MEMO_SIZE = 4096  # сколько разных текстов вариантов помнит classify()
+
+
+def prepare_option_text(txt: str) -> str:
+    """casefold и схлопывание пробелов — один раз на вариант."""
+    return " ".join((txt or "").casefold().split())
+
+
+class OptionInfo(NamedTuple):
+    yes: bool
+    minutes: Optional[int]  # время из варианта в минутах от полуночи
+    rank: int               # индекс правила из ranks; len(ranks) — ни одно не подошло
+    label: str              # метка правила ("репетиция", ...) или ""
+
+    def sort_key(self, index: int) -> Tuple[int, int, int, int]:
+        """Порядок --smart-sort: сначала по времени, затем по смыслу, затем как в опросе."""
+        if self.minutes is not None:
+            return 0, self.minutes, self.rank, index
+        return 1, self.rank, NO_TIME_SLOT, index
+
+
+# =========================
+# КЛАССИФИКАТОР
+# =========================
+class OptionClassifier:
+    """
+    Разбор варианта ответа за один проход:
+      - текст нормализуется один раз (prepare_option_text)
+      - все подстроки словаря ищутся одним скомпилированным regex, время — ещё одним
+      - результат (OptionInfo) кэшируется по исходному тексту — общий для всех опросов
+        (lru, не больше memo_size текстов: --watch и сервис работают долго)
+    """
+
+    def __init__(self, lexicon: Optional[Dict] = None, memo_size: int = MEMO_SIZE):
+        lexicon = DEFAULT_LEXICON if lexicon is None else lexicon
+        yes = [prepare_option_text(w) for w in lexicon.get("yes", [])]
+        negatable = [prepare_option_text(w) for w in lexicon.get("negatable", [])]
+        ranks = [
+            (str(r.get("label", "")), [prepare_option_text(w) for w in r.get("any", [])])
+            for r in lexicon.get("ranks", [])
+        ]
+        markers = [prepare_option_text(m) for m in lexicon.get("time_markers", [])]
+
+        patterns: List[str] = []
+        pos: Dict[str, int] = {}
+
+        def mask(words: Sequence[str]) -> int:
+            m = 0
+            for w in words:
+                if w not in pos:
+                    pos[w] = len(patterns)
+                    patterns.append(w)
+                m |= 1 << pos[w]
+            return m
+
+        self._yes = mask(yes)
+        self._negated = mask([f"не {w}" for w in negatable])
+        self._negatable = mask(negatable)
+        self._ranks = [(mask(words), label) for label, words in ranks]
+        # все подстроки — одним regex: на каждой позиции lookahead находит самое длинное совпадение,
+        # а более короткие там же — его префиксы, их биты добавляются из _implied
+        self._implied = {p: sum(1 << i for i, q in enumerate(patterns) if p.startswith(q)) for p in patterns}
+        alternation = "|".join(re.escape(p) for p in sorted(patterns, key=len, reverse=True))
+        self._scan = re.compile(f"(?=({alternation}))") if patterns else None
+        self._time = re.compile(
+            r"(?:" + "|".join(rf"\b{re.escape(m)}\b" for m in markers) + r")\s*(\d{1,2})(?::(\d{2}))?\b"
+        ) if markers else None
+        self._memo = lru_cache(maxsize=memo_size)(self._classify_raw)
+
+    @classmethod
+    def from_file(cls, path: str) -> "OptionClassifier":
+        """JSON в формате DEFAULT_LEXICON; отсутствующие ключи берутся из встроенного словаря."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Файл словаря вариантов не найден: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        unknown = set(data) - set(DEFAULT_LEXICON)
+        if unknown:
+            raise ValueError(f"В {path} неизвестные ключи: {', '.join(sorted(unknown))}")
+        return cls({**DEFAULT_LEXICON, **data})
+
+    def _minutes(self, t: str) -> Optional[int]:
+        m = self._time.search(t) if self._time is not None else None
+        if not m:
+            return None
+        hh = int(m.group(1))
+        mm = int(m.group(2) or "0")
+        if not (0 <= hh <= 23 and 0 <= mm <= 59):
+            return None
+        return hh * 60 + mm
+
+    def _match(self, t: str) -> int:
+        found = 0
+        if self._scan is not None:
+            implied = self._implied
+            for m in self._scan.finditer(t):
+                found |= implied[m.group(1)]
+        return found
+
+    def _classify(self, t: str) -> OptionInfo:
+        found = self._match(t)
+        negated = bool(found & self._negated) or (t.startswith("не") and bool(found & self._negatable))
+        rank, label = len(self._ranks), ""
+        for i, (m, lbl) in enumerate(self._ranks):
+            if found & m:
+                rank, label = i, lbl
+                break
+        return OptionInfo(not negated and bool(found & self._yes), self._minutes(t), rank, label)
+
+    def _classify_raw(self, txt: str) -> OptionInfo:
+        return self._classify(prepare_option_text(txt))
+
+    def classify(self, txt: str) -> OptionInfo:
+        return self._memo(txt or "")
+
+DEFAULT_CLASSIFIER = OptionClassifier()
+
+
+def load_classifier(path: str = "") -> OptionClassifier:
+    """Классификатор по словарю из файла; без файла — встроенный словарь."""
+    return OptionClassifier.from_file(path) if path else DEFAULT_CLASSIFIER
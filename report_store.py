@@ -0,0 +1,158 @@
+import hashlib
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from telethon import errors
+
+from common import log
+
+
+# =========================
+# ОТПРАВЛЕННЫЕ ОТЧЁТЫ (SQLite)
+# =========================
+TG_MESSAGE_LIMIT = 4096
+
+
+def report_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_report(report: str, limit: int = TG_MESSAGE_LIMIT) -> List[str]:
+    """Режет длинный отчёт на сообщения по границам строк; строка длиннее лимита режется по символам."""
+    parts: List[str] = []
+    current = ""
+    for line in report.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        parts.append(current)
+        current = line
+    if current:
+        parts.append(current)
+    return parts
+
+
+class ReportStore:
+    """
+    Какой отчёт уже лежит в Избранном: ключ (chat_id, key) -> id сообщений и хэш текста.
+    key — id сообщения с опросом (или "compare:<ids>" для сравнения опросов в batch).
+    Длинный отчёт занимает несколько сообщений — храним id каждого куска по порядку.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sent_reports (
+                chat_id        INTEGER NOT NULL,
+                key            TEXT    NOT NULL,
+                report_msg_id  INTEGER NOT NULL,
+                hash           TEXT    NOT NULL,
+                updated_at     REAL    NOT NULL,
+                report_msg_ids TEXT    NOT NULL DEFAULT '',
+                PRIMARY KEY (chat_id, key)
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sent_reports)")}
+        if "report_msg_ids" not in columns:
+            # база до разбиения отчётов: у каждой записи одно сообщение — report_msg_id
+            self._db.execute("ALTER TABLE sent_reports ADD COLUMN report_msg_ids TEXT NOT NULL DEFAULT ''")
+        self._db.commit()
+
+    def get(self, chat_id: int, key: str) -> Optional[Tuple[List[int], str]]:
+        row = self._db.execute(
+            "SELECT report_msg_id, hash, report_msg_ids FROM sent_reports WHERE chat_id=? AND key=?",
+            (int(chat_id), str(key)),
+        ).fetchone()
+        if not row:
+            return None
+        ids = [int(x) for x in row[2].split(",")] if row[2] else [int(row[0])]
+        return ids, row[1]
+
+    def put(self, chat_id: int, key: str, report_msg_ids: List[int], digest: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO sent_reports (chat_id, key, report_msg_id, hash, updated_at, report_msg_ids) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                int(chat_id), str(key), int(report_msg_ids[0]), digest, time.time(),
+                ",".join(str(int(i)) for i in report_msg_ids),
+            ),
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+async def deliver_report(
+        client,
+        store: Optional[ReportStore],
+        chat_id: int,
+        key,
+        text: str,
+        resend: bool = False,
+) -> str:
+    """
+    Кладёт отчёт в Избранное (длиннее лимита Telegram — несколькими сообщениями, split_report):
+      "unchanged" — текст тот же, что в прошлый раз, и прошлые сообщения на месте
+      "edited"    — прошлые сообщения отредактированы на месте
+      "sent"      — новые сообщения (первый раз, resend, без store, прошлое удалено
+                    или отчёт теперь занимает другое число сообщений)
+    """
+    parts = split_report(text) or [text]
+    if store is None:
+        for part in parts:
+            await client.send_message("me", part)
+        return "sent"
+
+    digest = report_hash(text)
+    prev = None if resend else store.get(chat_id, key)
+    if prev is not None:
+        old_ids, old_digest = prev
+        # удалённое сообщение get_messages возвращает как None
+        alive = [m is not None for m in await client.get_messages("me", ids=old_ids)]
+        if not all(alive):
+            log("⚠️ Прошлый отчёт удалён из Избранного, отправляю новый.")
+        elif old_digest == digest:
+            return "unchanged"
+        elif len(old_ids) != len(parts):
+            log(f"ℹ️ Отчёт теперь из {len(parts)} сообщ. вместо {len(old_ids)} — отправляю заново.")
+        else:
+            try:
+                edited = 0
+                for msg_id, part in zip(old_ids, parts):
+                    try:
+                        await client.edit_message("me", msg_id, part)
+                        edited += 1
+                    except errors.MessageNotModifiedError:
+                        pass
+                store.put(chat_id, key, old_ids, digest)
+                return "edited" if edited else "unchanged"
+            except (errors.MessageIdInvalidError, errors.MessageEditTimeExpiredError) as e:
+                # прошлый отчёт удалили из Избранного (или его уже нельзя править) — шлём новый
+                log(f"⚠️ Прошлый отчёт не отредактировать ({type(e).__name__}), отправляю новый.")
+        # оставшиеся куски старого отчёта иначе висели бы рядом с новым
+        stale = [msg_id for msg_id, ok in zip(old_ids, alive) if ok]
+        if stale:
+            await client.delete_messages("me", stale)
+
+    sent_ids = [(await client.send_message("me", part)).id for part in parts]
+    store.put(chat_id, key, sent_ids, digest)
+    return "sent"
+
+
+DELIVERY_LOG = {
+    "sent": "✅ Отчет отправлен!",
+    "edited": "✏️ Отчёт обновлён в Избранном",
+    "unchanged": "⏭️ Отчёт не изменился — не отправляю",
+}
@@ -0,0 +1,183 @@
+import csv
+import hashlib
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from instruments import DEFAULT_NORMALIZER, InstrumentNormalizer
+
+
+# =========================
+# CSV МУЗЫКАНТОВ
+# =========================
+def load_musicians_csv(path: str) -> Tuple[Dict[int, str], int]:
+    """
+    CSV: delimiter ';', columns: user_id, Инструмент
+    Возвращает: (user_id -> instrument, total_rows)
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Файл не найден: {path}")
+
+    musicians: Dict[int, str] = {}
+    total_rows = 0
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        for row in reader:
+            total_rows += 1
+            uid = (row.get("user_id") or "").strip()
+            instr = (row.get("Инструмент") or "").strip()
+            if not uid or not instr:
+                continue
+            try:
+                musicians[int(uid)] = instr
+            except ValueError:
+                continue
+
+    return musicians, total_rows
+
+
+# =========================
+# СКОМПИЛИРОВАННЫЙ СОСТАВ (бинарный кэш)
+# =========================
+# Формат файла:
+#   magic(6) | mtime_ns q | size q | sha256 32s | total_rows q | n_keys I | n_users I
+#   keys: n_keys строк (длина H + utf-8)
+#   user_ids: array('q') * n_users
+#   key_idx:  array('H') * n_users
+ROSTER_MAGIC = b"ROSTR1"
+ROSTER_HEADER = struct.Struct("<qq32sqII")
+
+
+def file_sha256(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def _rules_digest(rules_key: str) -> bytes:
+    return hashlib.sha256(rules_key.encode("utf-8")).digest()[:8]
+
+
+def write_roster_cache(
+        path: str,
+        roster: Dict[int, str],
+        total_rows: int,
+        mtime_ns: int,
+        size: int,
+        sha: bytes,
+        rules_key: str,
+) -> None:
+    keys: List[str] = sorted(set(roster.values()))
+    key_pos = {k: i for i, k in enumerate(keys)}
+    uids = array("q", roster.keys())
+    idx = array("H", (key_pos[v] for v in roster.values()))
+
+    # своё временное имя на каждую запись: два процесса (или потока) не пишут в один и тот же .tmp
+    with tempfile.NamedTemporaryFile(
+            "wb", dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp",
+            delete=False,
+    ) as f:
+        tmp = f.name
+        try:
+            f.write(ROSTER_MAGIC)
+            f.write(_rules_digest(rules_key))
+            f.write(ROSTER_HEADER.pack(mtime_ns, size, sha, total_rows, len(keys), len(uids)))
+            for k in keys:
+                kb = k.encode("utf-8")
+                f.write(struct.pack("<H", len(kb)))
+                f.write(kb)
+            f.write(uids.tobytes())
+            f.write(idx.tobytes())
+        except BaseException:
+            f.close()
+            os.unlink(tmp)
+            raise
+    os.replace(tmp, path)
+
+
+def read_roster_cache(path: str, rules_key: str):
+    """
+    Возвращает (roster, total_rows, mtime_ns, size, sha) или None, если кэша нет,
+    он битый или собран по другим правилам нормализации.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if not data.startswith(ROSTER_MAGIC):
+        return None
+    pos = len(ROSTER_MAGIC)
+    if data[pos:pos + 8] != _rules_digest(rules_key):
+        return None
+    pos += 8
+
+    try:
+        mtime_ns, size, sha, total_rows, n_keys, n_users = ROSTER_HEADER.unpack_from(data, pos)
+        pos += ROSTER_HEADER.size
+
+        keys: List[str] = []
+        for _ in range(n_keys):
+            (ln,) = struct.unpack_from("<H", data, pos)
+            pos += 2
+            keys.append(data[pos:pos + ln].decode("utf-8"))
+            pos += ln
+
+        uids = array("q")
+        uids.frombytes(data[pos:pos + 8 * n_users])
+        pos += 8 * n_users
+        idx = array("H")
+        idx.frombytes(data[pos:pos + 2 * n_users])
+    except (struct.error, UnicodeDecodeError, ValueError):
+        return None
+
+    if len(uids) != n_users or len(idx) != n_users:
+        return None
+
+    roster = dict(zip(uids, (keys[i] for i in idx)))
+    return roster, total_rows, mtime_ns, size, sha
+
+
+def load_roster(
+        csv_path: str,
+        cache_path: Optional[str] = None,
+        normalizer: InstrumentNormalizer = DEFAULT_NORMALIZER,
+) -> Tuple[Dict[int, str], int]:
+    """
+    Состав оркестра: user_id -> канонический ключ инструмента (уже нормализованный).
+    С cache_path CSV парсится только если изменился файл (mtime/размер, затем sha256)
+    или правила нормализации; иначе состав читается из бинарного кэша.
+    Возвращает (roster, total_rows).
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Файл не найден: {csv_path}")
+
+    rules_key = normalizer.rules_key
+
+    st = os.stat(csv_path)
+
+    if cache_path:
+        cached = read_roster_cache(cache_path, rules_key)
+        if cached is not None:
+            roster, total_rows, mtime_ns, size, sha = cached
+            if mtime_ns == st.st_mtime_ns and size == st.st_size:
+                return roster, total_rows
+            # файл «тронули», но содержимое то же — обновляем только заголовок
+            if size == st.st_size and sha == file_sha256(csv_path):
+                write_roster_cache(cache_path, roster, total_rows, st.st_mtime_ns, st.st_size, sha, rules_key)
+                return roster, total_rows
+
+    musicians, total_rows = load_musicians_csv(csv_path)
+    roster = dict(zip(musicians.keys(), normalizer.normalize_column(musicians.values())))
+
+    if cache_path:
+        write_roster_cache(
+            cache_path, roster, total_rows, st.st_mtime_ns, st.st_size, file_sha256(csv_path), rules_key,
+        )
+    return roster, total_rows
@@ -0,0 +1,439 @@
+import argparse
+import asyncio
+import functools
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from telethon import TelegramClient, errors
+from telethon.tl.types import MessageMediaPoll
+from telethon.utils import get_peer_id
+
+from common import RequestLimiter, as_text, log
+from entity_cache import EntityCache
+from instruments import load_normalizer
+from main import (
+    VOTE_REQUIRED_MSG,
+    build_report,
+    cached_forum_topics,
+    collect_polls,
+    fetch_poll_option_voters,
+    get_forum_topics,
+    load_config,
+    resolve_chat_entity,
+    union_voters,
+)
+from metrics import RpcMetrics
+from poll_index import PollIndex
+from poll_options import load_classifier
+from roster import load_roster
+from stats import counts_dict, instrument_counts, roster_series, stands
+from vote_cache import VoteCache
+
+
+# =========================
+# КЭШ С ОБЪЕДИНЕНИЕМ ЗАПРОСОВ
+# =========================
+class CoalescingCache:
+    """
+    Результаты async-функций по ключу. Пока результат моложе ttl, он отдаётся без вызова;
+    одновременные запросы одного ключа ждут один и тот же вызов. Ошибки не кэшируются.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = float(ttl)
+        self._values: Dict[tuple, Tuple[float, object]] = {}
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def get(self, key: tuple, factory):
+        hit = self._values.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            self.hits += 1
+            return hit[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.coalesced += 1
+        # shield: если один клиент отключился, выгрузку для остальных не отменяем
+        return await asyncio.shield(task)
+
+    def _done(self, key: tuple, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        now = time.monotonic()
+        self._values[key] = (now + self.ttl, task.result())
+        if len(self._values) > 1000:
+            self._values = {k: v for k, v in self._values.items() if v[0] > now}
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "coalesced": self.coalesced, "misses": self.misses, "entries": len(self._values)}
+
+
+# =========================
+# HTTP
+# =========================
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+}
+
+
+def flag(query: Dict[str, str], name: str) -> bool:
+    return query.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+def int_param(query: Dict[str, str], name: str, default: int = 0) -> int:
+    raw = query.get(name, "")
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise HttpError(400, f"{name} должен быть числом: {raw}")
+
+
+class ReportService:
+    """
+    Один прогретый TelegramClient и отчёты по HTTP:
+      GET /chats                                  — чаты из config.ini
+      GET /chats/<чат>/topics                     — темы форума
+      GET /chats/<чат>/polls?topic=&q=            — опросы (q — поиск по вопросу и вариантам)
+      GET /chats/<чат>/report?topic=&poll=        — отчёт по опросу (по умолчанию — последнему)
+      GET /chats/<чат>/polls/<msg_id>/report      — отчёт по id сообщения с опросом
+      GET /health, /metrics
+    <чат> — имя секции [chat:<имя>], default или id/@username.
+    У отчётов: format=text|json, per_option=1, smart_sort=1.
+    Одинаковые запросы в пределах ttl отвечают из памяти, одновременные — одной выгрузкой.
+    """
+
+    def __init__(
+            self,
+            client: TelegramClient,
+            conf: dict,
+            limiter: RequestLimiter,
+            ttl: float,
+            vote_cache: Optional[VoteCache] = None,
+            poll_index: Optional[PollIndex] = None,
+            entity_cache: Optional[EntityCache] = None,
+            metrics: Optional[RpcMetrics] = None,
+    ):
+        self.client = client
+        self.conf = conf
+        self.limiter = limiter
+        self.vote_cache = vote_cache
+        self.poll_index = poll_index
+        self.entity_cache = entity_cache
+        self.metrics = metrics
+        self.normalizer = load_normalizer(conf["INSTRUMENT_RULES"])
+        self.classifier = load_classifier(conf["OPTION_LEXICON"])
+        self.cache = CoalescingCache(ttl)
+        self.entities = CoalescingCache(conf["ENTITY_TTL"])
+        self.started_at = time.time()
+
+        self.default_chat = {
+            "NAME": "default",
+            "CHAT_ID": conf["CHAT_ID"],
+            "DEFAULT_TOPIC_ID": conf["DEFAULT_TOPIC_ID"],
+            "MUSICIANS_CSV": conf["MUSICIANS_CSV"],
+        }
+        self.chats = {c["NAME"].casefold(): c for c in conf["CHATS"]}
+
+    # ---------- данные ----------
+    def chat_conf(self, ref: str) -> dict:
+        if ref.casefold() == "default":
+            return self.default_chat
+        chat = self.chats.get(ref.casefold())
+        if chat is not None:
+            return chat
+        return {**self.default_chat, "NAME": ref, "CHAT_ID": ref, "DEFAULT_TOPIC_ID": 0}
+
+    def roster_cache(self, musicians_csv: str) -> str:
+        if self.conf["ROSTER_CACHE"] and musicians_csv == self.conf["MUSICIANS_CSV"]:
+            return self.conf["ROSTER_CACHE"]
+        return f"{musicians_csv}.roster"
+
+    async def roster(self, musicians_csv: str):
+        """Состав читается в рабочем потоке; одновременные отчёты по одному CSV ждут одно чтение."""
+        async def load():
+            musicians, _ = await asyncio.to_thread(
+                load_roster, musicians_csv, self.roster_cache(musicians_csv), self.normalizer,
+            )
+            return roster_series(musicians)
+
+        return await self.cache.get(("roster", musicians_csv), load)
+
+    async def resolve(self, chat: dict):
+        async def load():
+            try:
+                entity = await resolve_chat_entity(self.client, chat["CHAT_ID"], cache=self.entity_cache)
+            except (ValueError, RuntimeError) as e:
+                raise HttpError(404, f"Чат не найден: {chat['CHAT_ID']} ({e})")
+            return entity, await self.client.get_input_entity(entity)
+
+        return await self.entities.get(("chat", str(chat["CHAT_ID"])), load)
+
+    async def topics(self, chat: dict) -> List[dict]:
+        entity, _ = await self.resolve(chat)
+
+        async def load():
+            if self.entity_cache is not None:
+                topics = await cached_forum_topics(self.client, entity, self.entity_cache)
+            else:
+                topics = await get_forum_topics(self.client, entity, query=None, limit=None)
+            return [{"id": int(t.id), "title": t.title, "top_message": t.top_message} for t in topics]
+
+        return await self.cache.get(("topics", get_peer_id(entity)), load)
+
+    async def polls(self, chat: dict, topic_id: int) -> Tuple[list, int]:
+        entity, _ = await self.resolve(chat)
+
+        async def load():
+            return await collect_polls(self.client, entity, topic_id, self.conf["SEARCH_LIMIT"], self.poll_index)
+
+        return await self.cache.get(("polls", get_peer_id(entity), topic_id), load)
+
+    async def find_poll(self, chat: dict, topic_id: int, query: str) -> int:
+        entity, _ = await self.resolve(chat)
+        polls, topic_id = await self.polls(chat, topic_id)
+        if query:
+            if self.poll_index is not None:
+                matches = self.poll_index.search(get_peer_id(entity), query, topic_id)
+                if not matches and topic_id > 0:
+                    matches = self.poll_index.search(get_peer_id(entity), query)
+                ids = [m.id for m, _, _ in matches]
+            else:
+                ids = [m.id for m, q in polls if query.casefold() in (q or "").casefold()]
+            if not ids:
+                raise HttpError(404, f"Опрос не найден: {query}")
+            return ids[0]
+        if not polls:
+            raise HttpError(404, f"В теме {topic_id} нет опросов")
+        return polls[0][0].id
+
+    async def report(self, chat: dict, msg_id: int, per_option: bool, smart_sort: bool) -> dict:
+        entity, peer = await self.resolve(chat)
+        key = ("report", get_peer_id(entity), msg_id, per_option, smart_sort)
+
+        async def load():
+            # состав читается параллельно с запросами к Telegram
+            roster_task = asyncio.ensure_future(self.roster(chat["MUSICIANS_CSV"]))
+            roster_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            # свежие счётчики голосов — одним getMessages; дальше VoteCache докачивает только изменившееся
+            msgs = await self.client.get_messages(entity, ids=[msg_id])
+            poll_msg = msgs[0] if msgs else None
+            if poll_msg is None or not isinstance(getattr(poll_msg, "media", None), MessageMediaPoll):
+                raise HttpError(404, f"Сообщение id={msg_id} — не опрос")
+            question = as_text(poll_msg.media.poll.question)
+            try:
+                options = await fetch_poll_option_voters(
+                    self.client, peer, poll_msg, self.conf["VOTES_PAGE_SIZE"], smart_sort,
+                    limiter=self.limiter, cache=self.vote_cache, classifier=self.classifier,
+                )
+            except errors.PollVoteRequiredError:
+                raise HttpError(409, VOTE_REQUIRED_MSG)
+            except RuntimeError as e:
+                raise HttpError(422, str(e))
+
+            roster = await roster_task
+            voter_ids = union_voters(options)
+            counts, found = instrument_counts(voter_ids, roster)
+            strings, others = stands(counts)
+            return {
+                "chat": chat["NAME"],
+                "chat_id": get_peer_id(entity),
+                "msg_id": poll_msg.id,
+                "date": poll_msg.date.isoformat() if poll_msg.date else None,
+                "question": question,
+                "options": [{"text": text, "voters": len(voters)} for text, voters in options],
+                "people": found,
+                "not_found": len(voter_ids) - found,
+                "instruments": counts_dict(counts),
+                "stands": {"strings": strings, "others": others, "total": strings + others},
+                "text": build_report(
+                    question, [text for text, _ in options], voter_ids, roster,
+                    per_option=options if per_option else None,
+                ),
+                "generated_at": time.time(),
+            }
+
+        return await self.cache.get(key, load)
+
+    # ---------- маршруты ----------
+    async def route(self, path: List[str], query: Dict[str, str]) -> Tuple[object, Optional[str]]:
+        """(данные для JSON, текст для format=text или None)."""
+        if not path or path == ["health"]:
+            data = {"ok": True, "uptime": round(time.time() - self.started_at, 1), "cache": self.cache.stats()}
+            return data, None
+        if path == ["metrics"]:
+            if self.metrics is None:
+                raise HttpError(404, "Метрики выключены")
+            return None, self.metrics.prometheus()
+        if path == ["chats"]:
+            chats = [self.default_chat] + list(self.chats.values())
+            data = [
+                {"name": c["NAME"], "chat_id": c["CHAT_ID"], "default_topic_id": c["DEFAULT_TOPIC_ID"]} for c in chats
+            ]
+            return data, "\n".join(f"{c['name']} | chat_id={c['chat_id']} | topic={c['default_topic_id']}"
+                                   for c in data)
+        if len(path) < 3 or path[0] != "chats":
+            raise HttpError(404, "Нет такого адреса: /" + "/".join(path))
+
+        chat = self.chat_conf(path[1])
+        rest = path[2:]
+        topic_id = int_param(query, "topic", chat["DEFAULT_TOPIC_ID"])
+
+        if rest == ["topics"]:
+            topics = await self.topics(chat)
+            return topics, "\n".join(f"ID={t['id']} | {t['title']}" for t in topics)
+
+        if rest == ["polls"]:
+            polls, topic_id = await self.polls(chat, topic_id)
+            q = query.get("q", "").strip()
+            if q and self.poll_index is not None:
+                entity, _ = await self.resolve(chat)
+                found = [(m, question) for m, question, _ in self.poll_index.search(get_peer_id(entity), q, topic_id)]
+            else:
+                found = [(m, question) for m, question in polls if q.casefold() in (question or "").casefold()]
+            data = [
+                {"msg_id": m.id, "date": m.date.isoformat() if m.date else None, "question": question}
+                for m, question in found
+            ]
+            return data, "\n".join(f"[{p['date'] or '?'}] id={p['msg_id']} | {p['question']}" for p in data)
+
+        if rest == ["report"]:
+            msg_id = await self.find_poll(chat, topic_id, query.get("poll", "").strip())
+        elif len(rest) == 3 and rest[0] == "polls" and rest[2] == "report":
+            msg_id = int_param({"msg_id": rest[1]}, "msg_id")
+        else:
+            raise HttpError(404, "Нет такого адреса: /" + "/".join(path))
+
+        data = await self.report(chat, msg_id, flag(query, "per_option"), flag(query, "smart_sort"))
+        return data, data["text"]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=10)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+
+        parts = head.split(b"\r\n", 1)[0].decode("utf-8", "replace").split()
+        method = parts[0] if parts else ""
+        query: Dict[str, str] = {}
+        text: Optional[str] = None
+        try:
+            if len(parts) < 2:
+                raise HttpError(400, "Некорректный запрос")
+            if method not in ("GET", "HEAD"):
+                raise HttpError(405, "Только GET")
+            url = urlsplit(parts[1])
+            path = [unquote(p) for p in url.path.split("/") if p]
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            data, text = await self.route(path, query)
+            status = 200
+        except HttpError as e:
+            status, data = e.status, {"error": e.message}
+        except errors.RPCError as e:
+            status, data = 502, {"error": f"Telegram: {e}"}
+        except Exception as e:
+            log(f"❌ HTTP {' '.join(parts[:2])}: {type(e).__name__}: {e}")
+            status, data = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        if data is None or (status == 200 and query.get("format") == "text" and text is not None):
+            body, ctype = (text or "").encode("utf-8"), "text/plain; charset=utf-8"
+        elif status != 200 and query.get("format") == "text":
+            body, ctype = data["error"].encode("utf-8"), "text/plain; charset=utf-8"
+        else:
+            body, ctype = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"), "application/json; charset=utf-8"
+
+        header = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("ascii")
+        try:
+            writer.write(header if method == "HEAD" else header + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+# =========================
+# MAIN
+# =========================
+async def main():
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервис отчётов оркестра")
+    parser.add_argument("--config", type=str, default="config.ini", help="Путь к config.ini")
+    parser.add_argument("--host", type=str, default="", help="Адрес (по умолчанию [server] host)")
+    parser.add_argument("--port", type=int, default=0, help="Порт (по умолчанию [server] port)")
+    parser.add_argument("--ttl", type=float, default=None, help="Сколько секунд отдавать отчёт из памяти")
+    args = parser.parse_args()
+
+    conf = load_config(args.config)
+    host = args.host or conf["SERVER_HOST"]
+    port = args.port or conf["SERVER_PORT"]
+    ttl = conf["SERVER_TTL"] if args.ttl is None else args.ttl
+    cache_db = conf["CACHE_DB"]
+
+    metrics = RpcMetrics(conf["METRICS"])
+    client = metrics.instrument(TelegramClient(conf["SERVER_SESSION"], conf["API_ID"], conf["API_HASH"]))
+    with metrics.stage("connect"):
+        await client.start()
+    log("✅ Подключено к Telegram")
+
+    vote_cache = VoteCache(cache_db) if cache_db else None
+    poll_index = PollIndex(cache_db) if cache_db else None
+    entity_cache = EntityCache(cache_db, ttl=conf["ENTITY_TTL"]) if cache_db else None
+    service = ReportService(
+        client, conf, RequestLimiter(conf["VOTES_CONCURRENCY"]), ttl,
+        vote_cache=vote_cache, poll_index=poll_index, entity_cache=entity_cache, metrics=metrics,
+    )
+
+    server = await asyncio.start_server(service.handle, host, port)
+    log(f"🌐 Отчёты: http://{host}:{port}/chats (кэш {ttl:g} с, Ctrl+C — выход)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if vote_cache is not None:
+            vote_cache.close()
+        if poll_index is not None:
+            poll_index.close()
+        if entity_cache is not None:
+            entity_cache.close()
+        metrics.flush()
+        metrics.close()
+        await client.disconnect()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        log("👋 Завершено")
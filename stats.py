@@ -0,0 +1,139 @@
+from typing import Dict, Iterable, List, Mapping, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+# =========================
+# АГРЕГАЦИЯ (pandas / NumPy)
+# =========================
+INSTRUMENT_ORDER = [
+    "первые скрипки", "вторые скрипки",
+    "альт", "виолончель", "контрабас",
+    "флейта", "гобой", "кларнет", "фагот", "сопрано-саксофон", "альт-саксофон", "тенор-саксофон",
+    "баритон-саксофон", "бас-саксофон",
+    "валторна", "труба", "тромбон", "туба",
+    "ударные", "фортепиано", "арфа", "дирижёр",
+    "неизвестно",
+]
+
+# струнные сидят по двое за пультом
+PAIRED_INSTRUMENTS = ["первые скрипки", "вторые скрипки", "альт", "виолончель"]
+
+RosterLike = Union[Mapping[int, str], pd.Series]
+
+
+def roster_series(roster: RosterLike) -> pd.Series:
+    """user_id -> инструмент как pd.Series (индекс — user_id)."""
+    if isinstance(roster, pd.Series):
+        return roster
+    return pd.Series(
+        list(roster.values()),
+        index=pd.Index(np.fromiter(roster.keys(), dtype=np.int64, count=len(roster)), name="user_id"),
+        dtype=object,
+        name="instrument",
+    )
+
+
+def ids_array(ids: Iterable[int]) -> np.ndarray:
+    return np.fromiter(ids, dtype=np.int64)
+
+
+def instrument_counts(voter_ids: Iterable[int], roster: RosterLike) -> Tuple[pd.Series, int]:
+    """
+    Соединяет голосовавших с составом и считает людей по инструментам.
+    Возвращает (instrument -> count, сколько голосовавших нашлось в составе).
+    """
+    r = roster_series(roster)
+    matched = r[r.index.isin(ids_array(voter_ids))]
+    return matched.value_counts(sort=False), int(len(matched))
+
+
+class InstrumentTally:
+    """
+    instrument_counts по мере прихода голосов: каждый вариант раскладывается по инструментам сразу,
+    учитываются только ещё не встреченные user_id (человек с несколькими вариантами — один раз).
+    Итог тот же, что instrument_counts(объединение всех вариантов, roster).
+    """
+
+    def __init__(self, roster: RosterLike):
+        self.roster = roster_series(roster)
+        self.voter_ids: Set[int] = set()
+        self.found = 0
+        self._parts: List[pd.Series] = []
+
+    def add(self, voters: Iterable[int]) -> None:
+        new = set(voters) - self.voter_ids
+        if not new:
+            return
+        self.voter_ids |= new
+        counts, found = instrument_counts(new, self.roster)
+        self._parts.append(counts)
+        self.found += found
+
+    def counts(self) -> pd.Series:
+        if not self._parts:
+            return instrument_counts((), self.roster)[0]
+        return pd.concat(self._parts).groupby(level=0, sort=False).sum()
+
+
+def stands(counts: pd.Series) -> Tuple[int, int]:
+    """
+    Пульты: струнным — один на двоих (округление вверх), остальным — по одному.
+    Возвращает (пульты для струнных, пульты для остальных).
+    """
+    n = counts.to_numpy(dtype=np.int64)
+    paired = counts.index.isin(PAIRED_INSTRUMENTS)
+    strings = int(((n[paired] + 1) // 2).sum())
+    others = int(n[~paired].sum())
+    return strings, others
+
+
+def votes_frame(polls: Mapping[str, List[Tuple[str, Set[int]]]]) -> pd.DataFrame:
+    """
+    Голоса в «длинном» виде: колонки poll, option, user_id.
+    polls: poll -> [(option_text, voter_ids), ...]
+    """
+    parts = []
+    for poll, options in polls.items():
+        for option, voters in options:
+            ids = ids_array(voters)
+            parts.append(pd.DataFrame({
+                "poll": np.full(len(ids), poll, dtype=object),
+                "option": np.full(len(ids), option, dtype=object),
+                "user_id": ids,
+            }))
+    if not parts:
+        return pd.DataFrame({"poll": [], "option": [], "user_id": np.array([], dtype=np.int64)})
+    return pd.concat(parts, ignore_index=True)
+
+
+def attendance_table(votes: pd.DataFrame, roster: RosterLike, by: Iterable[str] = ("poll",)) -> pd.DataFrame:
+    """
+    Таблица «инструмент × группа» (группа — опрос, вариант или оба).
+    Один человек учитывается в группе один раз, даже если выбрал несколько вариантов.
+    """
+    by = list(by)
+    r = roster_series(roster)
+    joined = votes.drop_duplicates(by + ["user_id"]).join(r.rename("instrument"), on="user_id", how="inner")
+    table = joined.groupby(["instrument"] + by, sort=False).size().unstack(by, fill_value=0)
+    order = [k for k in INSTRUMENT_ORDER if k in table.index]
+    rest = [k for k in table.index if k not in INSTRUMENT_ORDER]
+    return table.reindex(order + rest)
+
+
+def stands_table(table: pd.DataFrame) -> pd.DataFrame:
+    """Пульты по каждой колонке attendance_table: строки strings / others / total."""
+    n = table.to_numpy(dtype=np.int64)
+    paired = table.index.isin(PAIRED_INSTRUMENTS)
+    strings = ((n[paired] + 1) // 2).sum(axis=0)
+    others = n[~paired].sum(axis=0)
+    return pd.DataFrame(
+        [strings, others, strings + others],
+        index=["strings", "others", "total"],
+        columns=table.columns,
+    )
+
+
+def counts_dict(counts: pd.Series) -> Dict[str, int]:
+    return {str(k): int(v) for k, v in counts.items()}
@@ -0,0 +1,64 @@
+import sqlite3
+import time
+from array import array
+from typing import Iterable, Optional, Set, Tuple
+
+
+# =========================
+# КЭШ ГОЛОСОВ (SQLite)
+# =========================
+def pack_ids(ids: Iterable[int]) -> bytes:
+    return array("q", sorted(ids)).tobytes()
+
+
+def unpack_ids(blob: bytes) -> Set[int]:
+    a = array("q")
+    a.frombytes(blob or b"")
+    return set(a)
+
+
+class VoteCache:
+    """
+    Локальное хранилище уже выгруженных голосов.
+    Ключ: (chat_id, id сообщения с опросом, option bytes).
+    Вместе с голосами хранится счётчик voters из poll.results на момент выгрузки —
+    если он не изменился, вариант повторно не выгружается.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS poll_votes (
+                chat_id    INTEGER NOT NULL,
+                msg_id     INTEGER NOT NULL,
+                option     BLOB    NOT NULL,
+                voters     INTEGER NOT NULL,
+                user_ids   BLOB    NOT NULL,
+                updated_at REAL    NOT NULL,
+                PRIMARY KEY (chat_id, msg_id, option)
+            )
+            """
+        )
+        self._db.commit()
+
+    def get(self, chat_id: int, msg_id: int, option: bytes) -> Optional[Tuple[int, Set[int]]]:
+        row = self._db.execute(
+            "SELECT voters, user_ids FROM poll_votes WHERE chat_id=? AND msg_id=? AND option=?",
+            (int(chat_id), int(msg_id), bytes(option)),
+        ).fetchone()
+        if row is None:
+            return None
+        return int(row[0]), unpack_ids(row[1])
+
+    def put(self, chat_id: int, msg_id: int, option: bytes, voters: int, user_ids: Iterable[int]) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO poll_votes (chat_id, msg_id, option, voters, user_ids, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (int(chat_id), int(msg_id), bytes(option), int(voters), pack_ids(user_ids), time.time()),
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()